@@ -14,6 +14,8 @@ export interface FretState {
 export interface Message {
   type: 'FRET_UPDATE' | 'STRUM_EVENT' | 'READY';
   payload: any;
+  srv_ts?: number; // Server receive time (Unix ms), set by the /ws relay
+  seq?: number; // Per-sender sequence number, set by the /ws relay
 }
 
 export interface HandData {
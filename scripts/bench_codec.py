@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+JSON codec micro-benchmark.
+
+Compares encode/decode cost of the available codecs (stdlib json, orjson,
+msgspec) on the payloads the relay actually carries.
+
+Run with: python scripts/bench_codec.py [--iterations 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from server.python.codec import CODECS, JSONCodec  # noqa: E402
+
+PAYLOADS: dict[str, Any] = {
+    # Left-hand app chord change
+    "chord_change": {
+        "type": "chord_change",
+        "chord": "G",
+        "frets": [3, 2, 0, 0, 0, 3],
+        "fingering": [
+            {"string": 6, "fret": 3},
+            {"string": 5, "fret": 2},
+            {"string": 4, "fret": 0},
+            {"string": 3, "fret": 0},
+            {"string": 2, "fret": 0},
+            {"string": 1, "fret": 3},
+        ],
+        "timestamp": 1769947200123,
+    },
+    # MobileController fret state
+    "FRET_UPDATE": {"type": "FRET_UPDATE", "payload": [-1, 3, 2, 0, 1, 0]},
+    # Server presence message
+    "connection_event": {
+        "type": "connection_event",
+        "client_id": "client_1024",
+        "device_type": "mobile",
+        "event": "connected",
+    },
+}
+
+
+def time_per_call(func: Callable[[], Any], iterations: int) -> float:
+    """Time a function.
+
+    Args:
+        func: Function to call
+        iterations: Number of calls
+
+    Returns:
+        Microseconds per call
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main() -> None:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    codecs: list[JSONCodec] = []
+    for name, codec_class in CODECS.items():
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+
+    print(f"{'payload':<18} {'codec':<8} {'bytes':>6} {'dumps us':>9} {'loads us':>9}")
+    for payload_name, payload in PAYLOADS.items():
+        for codec in codecs:
+            encoded = codec.dumps(payload)
+            dumps_us = time_per_call(lambda: codec.dumps(payload), args.iterations)
+            loads_us = time_per_call(lambda: codec.loads(encoded), args.iterations)
+            print(
+                f"{payload_name:<18} {codec.name:<8} {len(encoded.encode()):>6} "
+                f"{dumps_us:>9.3f} {loads_us:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Relay hot-path benchmark suite.
+
+Drives ConnectionManager in-process through FakeWebSocket (no sockets,
+kernel or uvicorn in the measurement) at several connection counts:
+
+- relay/<mix>: handle_raw with a message mix (frames as received)
+- parsed/<mix>: handle_message with the same mix (WS_PASSTHROUGH=false path)
+- connect, disconnect, connection_event: join/leave and presence broadcast
+
+Each run registers one PC and N - 1 mobiles in one room, so relay fan-out
+stays constant while presence broadcasts grow with N. Presence batching is
+disabled, so every join/leave pays for its own room broadcast. Times include
+flushing the send queues through the writer tasks.
+
+Results can be saved as a baseline and later runs compared against it;
+--compare exits with status 1 when a case got slower than --threshold.
+Each run also times a fixed calibration loop (codec round trips and task
+switches, like the relay hot path), and baseline timings are scaled by the
+ratio of the two calibrations, so a baseline taken on a faster or slower
+machine does not read as a regression. The scaling only corrects for raw
+CPU speed: for gating, regenerate the baseline on the machine that runs the
+comparison.
+
+Run with:
+    python scripts/bench_relay.py --save .benchmarks/relay.json
+    python scripts/bench_relay.py --compare .benchmarks/relay.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from server.python.codec import get_codec  # noqa: E402
+from tests.fakes import FakeWebSocket  # noqa: E402
+from server.python.outbound import OutboundQueue  # noqa: E402
+from server.python.websocket import ClientConnection, ConnectionManager  # noqa: E402
+
+MOBILE_USER_AGENT = "Mozilla/5.0 (Linux; Android 14) Mobile"
+DESKTOP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+
+FRET_UPDATE = '{"type":"FRET_UPDATE","payload":[0,2,2,1,0,0]}'
+CHORD_CHANGE = (
+    '{"type":"chord_change","chord":"Am","frets":[null,0,2,2,1,0],'
+    '"fingering":[{"string":4,"fret":2},{"string":3,"fret":2},{"string":2,"fret":1}],'
+    '"timestamp":1769947200123}'
+)
+STRUM = '{"type":"STRUM_EVENT","payload":{"velocity":0.8}}'
+PING = '{"type":"ping"}'
+
+# Message mixes: frames cycled through in order
+MIXES: dict[str, list[str]] = {
+    "fret": [FRET_UPDATE],
+    "chord": [CHORD_CHANGE],
+    # A playing phone: mostly fret state, some chord changes and strums
+    "mixed": [FRET_UPDATE] * 16 + [CHORD_CHANGE, STRUM, STRUM, PING],
+}
+
+# Relay calls between queue flushes
+FLUSH_EVERY = 64
+
+# Rounds of the calibration loop, and runs of it (the fastest one counts)
+CALIBRATION_ROUNDS = 50_000
+CALIBRATION_RUNS = 5
+
+
+def populate(manager: ConnectionManager, count: int) -> list[FakeWebSocket]:
+    """Register connections directly, skipping the O(N^2) connect broadcasts.
+
+    Args:
+        manager: Connection manager to fill
+        count: Total number of connections (one PC, the rest mobile)
+
+    Returns:
+        Fake sockets of the mobile connections
+    """
+    mobiles: list[FakeWebSocket] = []
+    for i in range(count):
+        device_type = "pc" if i == 0 else "mobile"
+        user_agent = DESKTOP_USER_AGENT if i == 0 else MOBILE_USER_AGENT
+        websocket = FakeWebSocket(user_agent)
+        manager._register(
+            ClientConnection(
+                websocket=websocket,
+                client_id=manager._generate_client_id(),
+                device_type=device_type,
+                user_agent=user_agent,
+                outbound=OutboundQueue(
+                    manager.send_queue_size, manager.queue_full_policy, manager.metrics
+                ),
+            )
+        )
+        if device_type == "mobile":
+            mobiles.append(websocket)
+    return mobiles
+
+
+async def flush() -> None:
+    """Let the writer tasks drain their queues into the fake sockets."""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def time_calls(
+    calls: int, call: Callable[[int], Awaitable[Any]], flush_every: int = 1
+) -> float:
+    """Time async calls, flushing send queues in between.
+
+    Args:
+        calls: Number of calls
+        call: Called with the call index
+        flush_every: Calls between queue flushes
+
+    Returns:
+        Microseconds per call
+    """
+    start = time.perf_counter()
+    for i in range(calls):
+        await call(i)
+        if (i + 1) % flush_every == 0:
+            await flush()
+    await flush()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def calibrate() -> float:
+    """Time a fixed workload to measure the speed of this machine.
+
+    Returns:
+        Microseconds per round, fastest of CALIBRATION_RUNS runs
+    """
+    codec = get_codec()
+    best = float("inf")
+    for _ in range(CALIBRATION_RUNS):
+        start = time.perf_counter()
+        for i in range(CALIBRATION_ROUNDS):
+            message = codec.loads(CHORD_CHANGE)
+            message["seq"] = i
+            codec.dumps(message)
+            if i % FLUSH_EVERY == 0:
+                await asyncio.sleep(0)
+        best = min(best, time.perf_counter() - start)
+    return best / CALIBRATION_ROUNDS * 1e6
+
+
+async def bench(count: int, messages: int) -> dict[str, float]:
+    """Run every case at one connection count.
+
+    Args:
+        count: Number of registered connections
+        messages: Relay calls per message mix
+
+    Returns:
+        Microseconds per operation, by case name
+    """
+    results: dict[str, float] = {}
+    manager = ConnectionManager(presence_window=0)
+    mobiles = populate(manager, count)
+    await flush()
+
+    # Spread senders across the whole connection table
+    step = max(1, len(mobiles) // 97)
+    senders = mobiles[::step]
+    codec = get_codec()
+
+    for mix_name, frames in MIXES.items():
+        results[f"relay/{mix_name}"] = await time_calls(
+            messages,
+            lambda i: manager.handle_raw(senders[i % len(senders)], frames[i % len(frames)]),
+            FLUSH_EVERY,
+        )
+
+        decoded = [codec.loads(frame) for frame in frames]
+        results[f"parsed/{mix_name}"] = await time_calls(
+            messages,
+            lambda i: manager.handle_message(senders[i % len(senders)], decoded[i % len(decoded)]),
+            FLUSH_EVERY,
+        )
+
+    # Presence operations broadcast to the whole room: O(N) each
+    operations = max(5, min(200, 200_000 // count))
+
+    results["connection_event"] = await time_calls(
+        operations,
+        lambda i: manager._broadcast_connection_event(None, "client_bench", "mobile", "connected"),
+    )
+
+    joined = [FakeWebSocket(MOBILE_USER_AGENT) for _ in range(operations)]
+    results["connect"] = await time_calls(operations, lambda i: manager.connect(joined[i]))
+    results["disconnect"] = await time_calls(
+        operations, lambda i: manager.disconnect(joined[i], resumable=False)
+    )
+
+    await manager.disconnect_all()
+    return results
+
+
+def load_baseline(path: str) -> tuple[dict[str, dict[str, float]], float | None]:
+    """Load saved results.
+
+    Args:
+        path: Baseline JSON file
+
+    Returns:
+        Tuple of (microseconds per operation by case and connection count,
+        calibration time in microseconds or None for older baselines)
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+    return baseline["results"], baseline.get("calibration_us")
+
+
+def save_baseline(
+    path: str, results: dict[str, dict[str, float]], calibration_us: float
+) -> None:
+    """Save results as a baseline.
+
+    Args:
+        path: Baseline JSON file (parent directories are created)
+        results: Microseconds per operation, by case and connection count
+        calibration_us: Calibration time of the run, in microseconds
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "codec": get_codec().name,
+                "calibration_us": calibration_us,
+                "results": results,
+            },
+            f,
+            indent=2,
+            sort_keys=True,
+        )
+
+
+async def main() -> int:
+    """Main entry point.
+
+    Returns:
+        Exit status (1 if --compare found a regression)
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--counts", default="10,1000,10000,50000")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--save", help="Save results as a baseline JSON file")
+    parser.add_argument("--compare", help="Compare against a baseline JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown ratio reported as a regression (default 1.25)",
+    )
+    args = parser.parse_args()
+
+    baseline, baseline_calibration = load_baseline(args.compare) if args.compare else ({}, None)
+    results: dict[str, dict[str, float]] = {}
+    regressions = 0
+
+    calibration_us = round(await calibrate(), 4)
+    # Baseline timings scaled to the speed of this machine
+    scale = 1.0
+    if args.compare:
+        if baseline_calibration:
+            scale = calibration_us / baseline_calibration
+            print(f"Calibration {calibration_us:.3f} us, baseline scaled by {scale:.2f}")
+        else:
+            print("Baseline has no calibration; comparing raw timings")
+
+    print(f"{'case':<18} {'connections':>12} {'us/op':>10} {'baseline':>10} {'ratio':>7}")
+    for count in (int(c) for c in args.counts.split(",")):
+        for case, us in (await bench(max(count, 2), args.messages)).items():
+            results.setdefault(case, {})[str(count)] = round(us, 3)
+            line = f"{case:<18} {count:>12} {us:>10.2f}"
+            base = baseline.get(case, {}).get(str(count))
+            if base:
+                base *= scale
+                ratio = us / base
+                line += f" {base:>10.2f} {ratio:>7.2f}"
+                if ratio > args.threshold:
+                    line += "  REGRESSION"
+                    regressions += 1
+            print(line)
+
+    if args.save:
+        save_baseline(args.save, results, calibration_us)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        print(f"{regressions} regression(s) above {args.threshold:.2f}x")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
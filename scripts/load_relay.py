@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Synthetic load generator for the WebSocket relay.
+
+Connects simulated phones and PCs to a running server (see
+scripts/run_server.py) with mobile/desktop User-Agents, so the server's
+detect_device_type classifies them. Phones send chord_change and FRET_UPDATE
+at the configured rates, stamped with their send time; PCs measure end-to-end
+delivery latency (and send-to-server latency from the relay's srv_ts). All
+clients run on this box, so they share one clock.
+
+Reports throughput and p50/p95/p99/p99.9 per message type, optionally as CSV
+and JSON.
+
+Run with:
+    python scripts/run_server.py &
+    python scripts/load_relay.py --phones 2000 --pcs 20 --duration 30 --csv load.csv
+
+Raise the file descriptor limit (ulimit -n) for more than ~1000 clients, and
+use --processes to spread the clients over several cores.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from websockets.asyncio.client import ClientConnection, connect
+
+MOBILE_USER_AGENT = "Mozilla/5.0 (Linux; Android 14; Pixel 8) Mobile LoadRelay/1.0"
+DESKTOP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) LoadRelay/1.0"
+
+CHORDS = {
+    "C": [None, 3, 2, 0, 1, 0],
+    "G": [3, 2, 0, 0, 0, 3],
+    "Am": [None, 0, 2, 2, 1, 0],
+    "F": [1, 3, 3, 2, 1, 1],
+}
+QUANTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+
+# Time to let in-flight frames arrive after the phones stop sending
+DRAIN_SECONDS = 2.0
+
+
+def now_ms() -> float:
+    """Wall-clock time in milliseconds (shared by all local processes)."""
+    return time.time_ns() / 1_000_000
+
+
+@dataclass
+class WorkerResult:
+    """Raw measurements of one load process."""
+
+    connected: dict[str, int] = field(default_factory=lambda: {"mobile": 0, "pc": 0})
+    connect_failures: int = 0
+    closed_early: int = 0
+    sent: dict[str, int] = field(default_factory=dict)
+    # (metric, message type) -> latencies in ms
+    latencies: dict[tuple[str, str], list[float]] = field(default_factory=dict)
+
+
+def chord_change(sent_at: float) -> str:
+    """Build a chord_change frame like the left-hand app sends."""
+    chord, frets = random.choice(list(CHORDS.items()))
+    return json.dumps(
+        {
+            "type": "chord_change",
+            "chord": chord,
+            "frets": frets,
+            "fingering": [
+                {"string": 6 - i, "fret": fret}
+                for i, fret in enumerate(frets)
+                if fret is not None
+            ],
+            "timestamp": int(sent_at),
+            "sent_at": sent_at,
+        },
+        separators=(",", ":"),
+    )
+
+
+def fret_update(sent_at: float) -> str:
+    """Build a FRET_UPDATE frame like MobileController sends."""
+    return json.dumps(
+        {
+            "type": "FRET_UPDATE",
+            "payload": [random.choice((-1, 0, 1, 2, 3)) for _ in range(6)],
+            "sent_at": sent_at,
+        },
+        separators=(",", ":"),
+    )
+
+
+class LoadWorker:
+    """Runs one process's share of the simulated clients."""
+
+    def __init__(
+        self, args: argparse.Namespace, phones: int, pcs: int, start_at: float
+    ) -> None:
+        """Initialize the worker.
+
+        Args:
+            args: Parsed command line
+            phones: Phones to simulate in this process
+            pcs: PCs to simulate in this process
+            start_at: Wall-clock time (seconds) when all processes start sending
+        """
+        self.args = args
+        self.phones = phones
+        self.pcs = pcs
+        self.start_at = start_at
+        self.result = WorkerResult()
+        self.rooms = [r for r in args.room_ids.split(",") if r] if args.room_ids else [None]
+        self.measuring = False
+        self.stopping = asyncio.Event()
+
+    def url_for(self, index: int, batch: bool = False) -> str:
+        """Get the /ws URL for the client with this index (spreads clients over rooms)."""
+        params = []
+        room = self.rooms[index % len(self.rooms)]
+        if room is not None:
+            params.append(f"room_id={room}")
+        if batch:
+            params.append("batch=1")
+        if not params:
+            return self.args.url
+        separator = "&" if "?" in self.args.url else "?"
+        return f"{self.args.url}{separator}{'&'.join(params)}"
+
+    async def open(
+        self, index: int, user_agent: str, batch: bool = False
+    ) -> ClientConnection | None:
+        """Connect one client.
+
+        Args:
+            index: Client index (selects the room)
+            user_agent: User-Agent header to send
+            batch: Ask the relay to batch frames into JSON arrays
+
+        Returns:
+            Connection, or None if the handshake failed
+        """
+        try:
+            return await connect(
+                self.url_for(index, batch),
+                user_agent_header=user_agent,
+                compression="deflate" if self.args.deflate else None,
+                open_timeout=self.args.connect_timeout,
+                max_queue=None,
+            )
+        except Exception as e:
+            self.result.connect_failures += 1
+            if self.result.connect_failures <= 5:
+                print(f"[pid {os.getpid()}] connect failed: {e}", file=sys.stderr)
+            return None
+
+    def record(self, metric: str, msg_type: str, latency_ms: float) -> None:
+        """Record one latency sample."""
+        self.result.latencies.setdefault((metric, msg_type), []).append(latency_ms)
+
+    async def read_pc(self, websocket: ClientConnection) -> None:
+        """Receive frames on a PC and record the latency of phone frames."""
+        try:
+            async for message in websocket:
+                received_at = now_ms()
+                if not self.measuring or isinstance(message, bytes):
+                    continue
+                if '"sent_at"' not in message:
+                    continue  # presence, clock_sync, ...
+                try:
+                    data = json.loads(message)
+                except ValueError:
+                    continue
+                # Batching PCs get JSON arrays of messages
+                for item in data if isinstance(data, list) else [data]:
+                    msg_type = item.get("type", "unknown")
+                    sent_at = item.get("sent_at")
+                    if not isinstance(sent_at, (int, float)):
+                        continue
+                    self.record("e2e", msg_type, received_at - sent_at)
+                    server_time = item.get("srv_ts")
+                    if isinstance(server_time, (int, float)):
+                        self.record("to_server", msg_type, server_time - sent_at)
+        except Exception:
+            if not self.stopping.is_set():
+                self.result.closed_early += 1
+
+    async def drain(self, websocket: ClientConnection) -> None:
+        """Discard everything a phone receives so the relay never sees it as slow."""
+        try:
+            async for _ in websocket:
+                pass
+        except Exception:
+            if not self.stopping.is_set():
+                self.result.closed_early += 1
+
+    async def send_loop(
+        self, websocket: ClientConnection, msg_type: str, rate: float, deadline: float
+    ) -> None:
+        """Send one message type at a fixed rate until the deadline.
+
+        Sends are scheduled on absolute times, so a slow send does not shift
+        the rest of the schedule; missed slots are skipped, not bunched up.
+        """
+        if rate <= 0:
+            return
+        build = chord_change if msg_type == "chord_change" else fret_update
+        interval = 1 / rate
+        loop = asyncio.get_running_loop()
+        next_at = loop.time() + random.uniform(0, interval)
+        end_at = loop.time() + (deadline - time.time())
+        sent = 0
+        try:
+            while next_at < end_at:
+                await asyncio.sleep(max(0.0, next_at - loop.time()))
+                await websocket.send(build(now_ms()))
+                sent += 1
+                next_at += interval
+                if next_at < loop.time():
+                    next_at = loop.time() + interval
+        except Exception:
+            if not self.stopping.is_set():
+                self.result.closed_early += 1
+        finally:
+            self.result.sent[msg_type] = self.result.sent.get(msg_type, 0) + sent
+
+    async def run(self) -> WorkerResult:
+        """Connect, send for the configured duration, and collect results."""
+        args = self.args
+        sockets: list[ClientConnection] = []
+        readers: list[asyncio.Task] = []
+        phones: list[ClientConnection] = []
+
+        # PCs first, so they see the phones' frames from the start
+        plan = [("pc", i) for i in range(self.pcs)] + [("mobile", i) for i in range(self.phones)]
+        delay = 1 / args.ramp if args.ramp > 0 else 0.0
+        for device_type, index in plan:
+            user_agent = DESKTOP_USER_AGENT if device_type == "pc" else MOBILE_USER_AGENT
+            websocket = await self.open(index, user_agent, args.batch and device_type == "pc")
+            if websocket is not None:
+                sockets.append(websocket)
+                self.result.connected[device_type] += 1
+                if device_type == "pc":
+                    readers.append(asyncio.create_task(self.read_pc(websocket)))
+                else:
+                    phones.append(websocket)
+                    readers.append(asyncio.create_task(self.drain(websocket)))
+            if delay:
+                await asyncio.sleep(delay)
+
+        wait = self.start_at - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        else:
+            print(
+                f"[pid {os.getpid()}] connecting ran {-wait:.1f}s past the start time",
+                file=sys.stderr,
+            )
+
+        self.measuring = True
+        deadline = time.time() + args.duration
+        senders = [
+            asyncio.create_task(self.send_loop(ws, "chord_change", args.chord_rate, deadline))
+            for ws in phones
+        ] + [
+            asyncio.create_task(self.send_loop(ws, "FRET_UPDATE", args.fret_rate, deadline))
+            for ws in phones
+        ]
+        await asyncio.gather(*senders)
+        await asyncio.sleep(DRAIN_SECONDS)
+        self.measuring = False
+
+        self.stopping.set()
+        await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        return self.result
+
+
+def run_worker(args: argparse.Namespace, phones: int, pcs: int, start_at: float) -> WorkerResult:
+    """Process entry point: run one LoadWorker to completion."""
+    return asyncio.run(LoadWorker(args, phones, pcs, start_at).run())
+
+
+def split(total: int, parts: int) -> list[int]:
+    """Split a count as evenly as possible."""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(results: list[WorkerResult], args: argparse.Namespace) -> dict[str, Any]:
+    """Merge per-process results into the report.
+
+    Args:
+        results: Results of all load processes
+        args: Parsed command line
+
+    Returns:
+        Report with connection counts, throughput and latency rows
+    """
+    connected = {"mobile": 0, "pc": 0}
+    sent: dict[str, int] = {}
+    latencies: dict[tuple[str, str], list[float]] = {}
+    for result in results:
+        for device_type, count in result.connected.items():
+            connected[device_type] += count
+        for msg_type, count in result.sent.items():
+            sent[msg_type] = sent.get(msg_type, 0) + count
+        for key, values in result.latencies.items():
+            latencies.setdefault(key, []).extend(values)
+
+    rows = []
+    for (metric, msg_type), values in sorted(latencies.items()):
+        values.sort()
+        row: dict[str, Any] = {
+            "metric": metric,
+            "type": msg_type,
+            "sent": sent.get(msg_type, 0),
+            "received": len(values),
+            # Each phone frame reaches every PC of its room
+            "delivered_per_s": round(len(values) / args.duration, 1),
+        }
+        for name, q in QUANTILES:
+            row[f"{name}_ms"] = round(percentile(values, q), 3)
+        row["max_ms"] = round(values[-1], 3)
+        rows.append(row)
+
+    return {
+        "config": {
+            "url": args.url,
+            "phones": args.phones,
+            "pcs": args.pcs,
+            "rooms": args.room_ids or None,
+            "chord_rate": args.chord_rate,
+            "fret_rate": args.fret_rate,
+            "duration": args.duration,
+            "processes": args.processes,
+            "batch": args.batch,
+        },
+        "connected": connected,
+        "connect_failures": sum(r.connect_failures for r in results),
+        "closed_early": sum(r.closed_early for r in results),
+        "sent": sent,
+        "sent_per_s": round(sum(sent.values()) / args.duration, 1),
+        "rows": rows,
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    """Print the report as a table."""
+    print(
+        f"connected: {report['connected']['mobile']} phones, {report['connected']['pc']} PCs "
+        f"({report['connect_failures']} failed, {report['closed_early']} closed early)"
+    )
+    print(f"sent: {report['sent_per_s']} msg/s {report['sent']}")
+    print(
+        f"{'metric':<10} {'type':<14} {'received':>9} {'deliv/s':>9} "
+        + " ".join(f"{name + ' ms':>9}" for name, _ in QUANTILES)
+        + f" {'max ms':>9}"
+    )
+    for row in report["rows"]:
+        print(
+            f"{row['metric']:<10} {row['type']:<14} {row['received']:>9} "
+            f"{row['delivered_per_s']:>9} "
+            + " ".join(f"{row[name + '_ms']:>9}" for name, _ in QUANTILES)
+            + f" {row['max_ms']:>9}"
+        )
+
+
+def main() -> None:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="ws://127.0.0.1:3000/ws")
+    parser.add_argument("--phones", type=int, default=100)
+    parser.add_argument("--pcs", type=int, default=1)
+    parser.add_argument(
+        "--room-ids",
+        default="",
+        help="Comma-separated existing room IDs to spread clients over (default room if empty)",
+    )
+    parser.add_argument(
+        "--chord-rate", type=float, default=2.0, help="chord_change per phone per second"
+    )
+    parser.add_argument(
+        "--fret-rate", type=float, default=20.0, help="FRET_UPDATE per phone per second"
+    )
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of sending")
+    parser.add_argument(
+        "--ramp", type=float, default=200.0, help="Connections per second per process"
+    )
+    parser.add_argument("--connect-timeout", type=float, default=10.0)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--deflate", action="store_true", help="Offer permessage-deflate")
+    parser.add_argument(
+        "--batch", action="store_true", help="Connect PCs with batch=1 (JSON array frames)"
+    )
+    parser.add_argument("--csv", help="Write latency rows to this CSV file")
+    parser.add_argument("--json", help="Write the full report to this JSON file")
+    args = parser.parse_args()
+
+    processes = max(1, args.processes)
+    phone_shares = split(args.phones, processes)
+    pc_shares = split(args.pcs, processes)
+    slowest_ramp = max(p + c for p, c in zip(phone_shares, pc_shares)) / max(args.ramp, 1)
+    start_at = time.time() + slowest_ramp + 2.0
+
+    if processes == 1:
+        results = [run_worker(args, phone_shares[0], pc_shares[0], start_at)]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(
+                run_worker,
+                [(args, p, c, start_at) for p, c in zip(phone_shares, pc_shares)],
+            )
+
+    report = summarize(results, args)
+    print_report(report)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            fieldnames = list(report["rows"][0]) if report["rows"] else ["metric"]
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(report["rows"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ Environment variables:
     SERVER_PORT: Port to bind to (default: 3000)
     ALLOWED_ORIGINS: Comma-separated list of allowed CORS origins
     LOG_LEVEL: Logging level (default: info)
+    SERVER_WORKERS: Number of worker processes (default: 1, use RELAY_BROKER=uds for >1)
 """
 
 import os
@@ -30,6 +31,7 @@ if __name__ == "__main__":
         host=config.HOST,
         port=config.PORT,
         log_level=config.LOG_LEVEL,
+        workers=config.WORKERS,
         ws_ping_interval=config.WS_PING_INTERVAL,
         ws_ping_timeout=config.WS_PING_TIMEOUT,
     )
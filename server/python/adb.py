@@ -2,20 +2,39 @@
 
 This module handles:
 - ADB command execution
-- Device list management
+- Device list management (push-based tracking, see DeviceTracker)
 - Port forwarding management
-- Screen capture functionality
+- Screen capture functionality (in-memory, see screencap.py)
+
+Commands go straight to the ADB server over its socket protocol (see
+adb_client.py). If the server cannot be reached, they fall back to running
+the adb executable, which also starts the server.
+
+With ADB_TRACK_DEVICES, the device list is kept current by a push
+subscription to the ADB server and answered from memory.
 """
 
 import asyncio
-import json
 import logging
-import subprocess
 from dataclasses import dataclass
-from typing import Any
+from typing import AsyncIterator, Awaitable, TypeVar
+
+from .adb_client import ADBClient, ADBConnectionError, ADBFailure
+from .config import config
+from .screencap import FORMAT_PNG, ScreenCapturer
+from .shell_session import ShellSessions
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Device events
+DEVICE_ATTACHED = "attached"
+DEVICE_DETACHED = "detached"
+
+# Pending events per subscriber before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 64
+
 
 @dataclass
 class ADBDevice:
@@ -34,16 +53,276 @@ class ADBError(Exception):
     pass
 
 
+def parse_device_list(text: str) -> list[ADBDevice]:
+    """Parse the output of ``adb devices -l`` (or ``host:devices-l``).
+
+    Args:
+        text: Device list text
+
+    Returns:
+        Devices in the "device" state
+    """
+    devices: list[ADBDevice] = []
+
+    for line in text.strip().split("\n"):
+        # Skip the header and daemon startup messages of the adb executable
+        if not line.strip() or line.startswith(("List of devices", "*")):
+            continue
+
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == "device":
+            device_id = parts[0]
+
+            # Parse device info
+            model = None
+            product = None
+            device = None
+            transport_id = None
+
+            for part in parts[2:]:
+                if part.startswith("model:"):
+                    model = part.split(":", 1)[1]
+                elif part.startswith("product:"):
+                    product = part.split(":", 1)[1]
+                elif part.startswith("device:"):
+                    device = part.split(":", 1)[1]
+                elif part.startswith("transport_id:"):
+                    transport_id = part.split(":", 1)[1]
+
+            devices.append(
+                ADBDevice(
+                    device_id=device_id,
+                    model=model,
+                    product=product,
+                    device=device,
+                    transport_id=transport_id,
+                )
+            )
+
+    return devices
+
+
+@dataclass
+class DeviceEvent:
+    """A device that was attached or detached."""
+
+    event: str  # DEVICE_ATTACHED or DEVICE_DETACHED
+    device: ADBDevice
+
+
+class DeviceTracker:
+    """Registry of connected devices kept up to date by the ADB server.
+
+    Keeps one ``host:track-devices-l`` subscription open; the server sends
+    the full device list whenever a device is attached, detached or changes
+    state. If the subscription drops (e.g. the ADB server restarts), the
+    registry is marked as not synced and the tracker reconnects with backoff.
+    The first list after reconnecting is diffed against the old registry, so
+    subscribers only see the real changes.
+    """
+
+    def __init__(
+        self,
+        client: ADBClient,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 5.0,
+    ) -> None:
+        """Initialize the tracker.
+
+        Args:
+            client: Client for the ADB server
+            retry_delay: Seconds to wait before the first reconnect
+            max_retry_delay: Upper bound of the reconnect backoff in seconds
+        """
+        self.client = client
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.devices: dict[str, ADBDevice] = {}
+        # True while the subscription is up and the registry is current
+        self.synced = False
+        self.updates = 0
+        self._subscribers: set[asyncio.Queue[DeviceEvent]] = set()
+        self._task: asyncio.Task | None = None
+        self._synced_event = asyncio.Event()
+
+    def start(self) -> None:
+        """Start tracking in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop tracking and close the subscription."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._set_synced(False)
+
+    async def wait_synced(self, timeout: float | None = None) -> bool:
+        """Wait until the registry holds the current device list.
+
+        Args:
+            timeout: Seconds to wait at most (None waits forever)
+
+        Returns:
+            True if the registry is synced
+        """
+        try:
+            await asyncio.wait_for(self._synced_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.synced
+
+    def subscribe(self) -> asyncio.Queue[DeviceEvent]:
+        """Subscribe to device events.
+
+        Returns:
+            Queue the events are put in; pass it to unsubscribe() when done
+        """
+        queue: asyncio.Queue[DeviceEvent] = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue[DeviceEvent]) -> None:
+        """Stop putting device events in a queue.
+
+        Args:
+            queue: Queue returned by subscribe()
+        """
+        self._subscribers.discard(queue)
+
+    async def _run(self) -> None:
+        delay = self.retry_delay
+        while True:
+            try:
+                async for text in self.client.track_devices():
+                    self.update(parse_device_list(text))
+                    delay = self.retry_delay
+            except (ADBConnectionError, ADBFailure) as e:
+                if self.synced:
+                    logger.warning(f"Device tracking interrupted: {e}")
+                else:
+                    logger.debug(f"Device tracking unavailable: {e}")
+            self._set_synced(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def update(self, devices: list[ADBDevice]) -> list[DeviceEvent]:
+        """Replace the registry with a new device list.
+
+        Args:
+            devices: Devices in the "device" state
+
+        Returns:
+            Events for the devices that were attached or detached
+        """
+        current = {d.device_id: d for d in devices}
+        events = [
+            DeviceEvent(DEVICE_DETACHED, device)
+            for serial, device in self.devices.items()
+            if serial not in current
+        ]
+        events.extend(
+            DeviceEvent(DEVICE_ATTACHED, device)
+            for serial, device in current.items()
+            if serial not in self.devices
+        )
+
+        self.devices = current
+        self.updates += 1
+        self._set_synced(True)
+
+        for event in events:
+            logger.info(f"ADB device {event.event}: {event.device.device_id}")
+            self._publish(event)
+        return events
+
+    def _publish(self, event: DeviceEvent) -> None:
+        for queue in self._subscribers:
+            if queue.full():
+                # A stalled subscriber loses its oldest events, not the tracker
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def _set_synced(self, synced: bool) -> None:
+        self.synced = synced
+        if synced:
+            self._synced_event.set()
+        else:
+            self._synced_event.clear()
+
+
 class ADBManager:
     """Manages ADB operations."""
 
-    def __init__(self, adb_path: str = "adb") -> None:
+    def __init__(self, adb_path: str = "adb", client: ADBClient | None = None) -> None:
         """Initialize the ADB manager.
 
         Args:
             adb_path: Path to adb executable (default: "adb")
+            client: Client for the ADB server (default: one for
+                ADB_SERVER_HOST:ADB_SERVER_PORT, or None to always run the
+                adb executable if ADB_NATIVE is false)
         """
         self.adb_path = adb_path
+        if client is None and config.ADB_NATIVE:
+            client = ADBClient(config.ADB_SERVER_HOST, config.ADB_SERVER_PORT)
+        self.client = client
+        self.tracker = DeviceTracker(client) if client is not None else None
+        self.screen = ScreenCapturer(self.exec_out)
+        self.shells = (
+            ShellSessions(
+                client,
+                max_sessions=config.ADB_SHELL_SESSIONS_PER_DEVICE,
+                idle_timeout=config.ADB_SHELL_IDLE_TIMEOUT,
+            )
+            if client is not None and config.ADB_SHELL_SESSIONS
+            else None
+        )
+
+    def start(self) -> None:
+        """Start tracking devices in the background (if ADB_TRACK_DEVICES)."""
+        if self.tracker is not None and config.ADB_TRACK_DEVICES:
+            self.tracker.start()
+
+    async def close(self) -> None:
+        """Stop tracking devices and close the connections to the ADB server."""
+        if self.tracker is not None:
+            await self.tracker.stop()
+        await self.screen.close()
+        if self.shells is not None:
+            self.shells.close()
+        if self.client is not None:
+            await self.client.close()
+
+    async def _native(self, request: Awaitable[T], description: str, timeout: int = 30) -> T:
+        """Run a request against the ADB server.
+
+        Args:
+            request: Client coroutine to run
+            description: What the request does, for errors
+            timeout: Request timeout in seconds
+
+        Returns:
+            Result of the request
+
+        Raises:
+            ADBError: If the request timed out
+            ADBConnectionError: If the ADB server cannot be reached (the
+                caller falls back to the adb executable)
+            ADBFailure: If the server or device rejected the request
+        """
+        try:
+            return await asyncio.wait_for(request, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise ADBError(f"ADB request timed out: {description}")
+
+    @staticmethod
+    def _fallback(e: ADBConnectionError) -> None:
+        logger.debug(f"Falling back to the adb executable: {e}")
 
     async def _run_command(
         self, args: list[str], timeout: int = 30
@@ -85,53 +364,32 @@ class ADBManager:
     async def get_devices(self) -> list[ADBDevice]:
         """Get list of connected devices.
 
+        Answered from the device registry while it is synced, otherwise
+        queried from the ADB server.
+
         Returns:
             List of ADBDevice objects
         """
+        if self.tracker is not None and self.tracker.synced:
+            return list(self.tracker.devices.values())
+
+        if self.client is not None:
+            try:
+                text = await self._native(self.client.query("host:devices-l"), "devices")
+                return parse_device_list(text)
+            except ADBFailure as e:
+                logger.error(f"Failed to get devices: {e}")
+                return []
+            except ADBConnectionError as e:
+                self._fallback(e)
+
         stdout, stderr, code = await self._run_command(["devices", "-l"])
 
         if code != 0:
             logger.error(f"Failed to get devices: {stderr}")
             return []
 
-        devices: list[ADBDevice] = []
-        lines = stdout.strip().split("\n")
-
-        for line in lines[1:]:  # Skip header line
-            if not line.strip():
-                continue
-
-            parts = line.split()
-            if len(parts) >= 2 and parts[1] == "device":
-                device_id = parts[0]
-
-                # Parse device info
-                model = None
-                product = None
-                device = None
-                transport_id = None
-
-                for part in parts[2:]:
-                    if part.startswith("model:"):
-                        model = part.split(":", 1)[1]
-                    elif part.startswith("product:"):
-                        product = part.split(":", 1)[1]
-                    elif part.startswith("device:"):
-                        device = part.split(":", 1)[1]
-                    elif part.startswith("transport_id:"):
-                        transport_id = part.split(":", 1)[1]
-
-                devices.append(
-                    ADBDevice(
-                        device_id=device_id,
-                        model=model,
-                        product=product,
-                        device=device,
-                        transport_id=transport_id,
-                    )
-                )
-
-        return devices
+        return parse_device_list(stdout)
 
     async def forward_port(
         self, device_id: str, local_port: int, remote_port: int
@@ -146,6 +404,23 @@ class ADBManager:
         Returns:
             True if successful
         """
+        if self.client is not None:
+            try:
+                await self._native(
+                    self.client.command(
+                        f"host-serial:{device_id}:forward:tcp:{local_port};tcp:{remote_port}"
+                    ),
+                    "forward",
+                )
+            except ADBFailure as e:
+                logger.error(f"Forward failed: {e}")
+                return False
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                logger.info(f"Forwarded {device_id}: tcp:{local_port} -> tcp:{remote_port}")
+                return True
+
         stdout, stderr, code = await self._run_command(
             ["-s", device_id, "forward", f"tcp:{local_port}", f"tcp:{remote_port}"]
         )
@@ -170,6 +445,23 @@ class ADBManager:
         Returns:
             True if successful
         """
+        if self.client is not None:
+            try:
+                await self._native(
+                    self.client.device_command(
+                        device_id, f"reverse:forward:tcp:{remote_port};tcp:{local_port}"
+                    ),
+                    "reverse",
+                )
+            except ADBFailure as e:
+                logger.error(f"Reverse failed: {e}")
+                return False
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                logger.info(f"Reversed {device_id}: tcp:{remote_port} -> tcp:{local_port}")
+                return True
+
         stdout, stderr, code = await self._run_command(
             ["-s", device_id, "reverse", f"tcp:{remote_port}", f"tcp:{local_port}"]
         )
@@ -191,6 +483,21 @@ class ADBManager:
         Returns:
             True if successful
         """
+        if self.client is not None:
+            try:
+                await self._native(
+                    self.client.command(f"host-serial:{device_id}:killforward:tcp:{local_port}"),
+                    "remove forward",
+                )
+            except ADBFailure as e:
+                logger.error(f"Remove forward failed: {e}")
+                return False
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                logger.info(f"Removed forward {device_id}: tcp:{local_port}")
+                return True
+
         stdout, stderr, code = await self._run_command(
             ["-s", device_id, "forward", "--remove", f"tcp:{local_port}"]
         )
@@ -212,9 +519,7 @@ class ADBManager:
         Returns:
             Path to screenshot file
         """
-        stdout, stderr, code = await self._run_command(
-            ["-s", device_id, "shell", "screencap", "-p", path]
-        )
+        stdout, stderr, code = await self.shell_command(device_id, f"screencap -p {path}")
 
         if code != 0:
             logger.error(f"Screen capture failed: {stderr}")
@@ -223,6 +528,91 @@ class ADBManager:
         logger.info(f"Screen captured to {path}")
         return path
 
+    async def capture_screen(
+        self, device_id: str, fmt: str = FORMAT_PNG, scale: int = 1
+    ) -> AsyncIterator[bytes]:
+        """Capture the screen in memory.
+
+        Concurrent captures of the same device share one screencap run.
+
+        Args:
+            device_id: Device serial number
+            fmt: "png" or "raw" (screencap's raw frame: header + RGBA pixels)
+            scale: Divisor of width and height (1 for full size)
+
+        Yields:
+            Image data
+
+        Raises:
+            ADBError: If the capture failed
+            TimeoutError: If the capture took longer than its timeout
+            ConnectionAbortedError: If the capture was cancelled (on close())
+            ValueError: If the format is unknown or cannot be downscaled
+        """
+        async for chunk in self.screen.capture(device_id, fmt, scale):
+            yield chunk
+
+    async def exec_out(
+        self, device_id: str, command: str, chunk_size: int = 64 * 1024
+    ) -> AsyncIterator[bytes]:
+        """Run a command on a device and stream its raw stdout (``adb exec-out``).
+
+        Args:
+            device_id: Device serial number
+            command: Command line
+            chunk_size: Maximum bytes per chunk
+
+        Yields:
+            Chunks of stdout as they arrive
+
+        Raises:
+            ADBError: If the command could not be run
+        """
+        if self.client is not None:
+            try:
+                reader, writer = await self._native(
+                    self.client.open_service(device_id, f"exec:{command}"),
+                    f"exec-out {command}",
+                )
+            except ADBFailure as e:
+                raise ADBError(f"exec-out failed: {e}")
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                try:
+                    while True:
+                        chunk = await reader.read(chunk_size)
+                        if not chunk:
+                            return
+                        yield chunk
+                finally:
+                    writer.close()
+
+        cmd = [self.adb_path, "-s", device_id, "exec-out", command]
+        logger.debug(f"Running ADB command: {' '.join(cmd)}")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            raise ADBError(f"ADB executable not found: {self.adb_path}")
+
+        try:
+            while True:
+                chunk = await process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            stderr = await process.stderr.read()
+            if await process.wait() != 0:
+                raise ADBError(f"exec-out failed: {stderr.decode('utf-8', errors='ignore')}")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
     async def pull_file(self, device_id: str, remote_path: str, local_path: str) -> bool:
         """Pull file from device.
 
@@ -234,6 +624,20 @@ class ADBManager:
         Returns:
             True if successful
         """
+        if self.client is not None:
+            try:
+                await self._native(
+                    self.client.pull(device_id, remote_path, local_path), "pull"
+                )
+            except (ADBFailure, OSError) as e:
+                logger.error(f"Pull failed: {e}")
+                return False
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                logger.info(f"Pulled {remote_path} -> {local_path}")
+                return True
+
         stdout, stderr, code = await self._run_command(
             ["-s", device_id, "pull", remote_path, local_path]
         )
@@ -248,6 +652,9 @@ class ADBManager:
     async def shell_command(self, device_id: str, command: str) -> tuple[str, str, int]:
         """Execute shell command on device.
 
+        Commands run through a persistent shell on the device when
+        ADB_SHELL_SESSIONS is enabled.
+
         Args:
             device_id: Device serial number
             command: Shell command to execute
@@ -255,6 +662,24 @@ class ADBManager:
         Returns:
             Tuple of (stdout, stderr, return_code)
         """
+        if self.client is not None:
+            if self.shells is not None:
+                request = self.shells.run(device_id, command)
+            else:
+                request = self.client.shell(device_id, command)
+            try:
+                stdout, stderr, code = await self._native(request, f"shell {command}")
+            except ADBFailure as e:
+                return "", str(e), 1
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                return (
+                    stdout.decode("utf-8", errors="ignore"),
+                    stderr.decode("utf-8", errors="ignore"),
+                    code,
+                )
+
         return await self._run_command(["-s", device_id, "shell", command])
 
     async def get_device_ip(self, device_id: str) -> str | None:
@@ -266,15 +691,11 @@ class ADBManager:
         Returns:
             IP address or None
         """
-        stdout, stderr, code = await self._run_command(
-            ["-s", device_id, "shell", "ip", "route", "get", "1.1.1.1"]
-        )
+        stdout, stderr, code = await self.shell_command(device_id, "ip route get 1.1.1.1")
 
         if code != 0:
             # Try alternative method
-            stdout, stderr, code = await self._run_command(
-                ["-s", device_id, "shell", "ip", "addr", "show", "wlan0"]
-            )
+            stdout, stderr, code = await self.shell_command(device_id, "ip addr show wlan0")
 
             if code != 0:
                 return None
@@ -299,6 +720,24 @@ class ADBManager:
         Returns:
             True if successful
         """
+        if self.client is not None:
+            try:
+                result = await self._native(
+                    self.client.query(f"host:connect:{ip}:{port}"), "connect"
+                )
+            except ADBFailure as e:
+                logger.error(f"Wireless connect failed: {e}")
+                return False
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                # The server answers OKAY with a message either way
+                if not result.startswith(("connected", "already connected")):
+                    logger.error(f"Wireless connect failed: {result}")
+                    return False
+                logger.info(f"Connected to {ip}:{port}")
+                return True
+
         stdout, stderr, code = await self._run_command(["connect", f"{ip}:{port}"])
 
         if code != 0:
@@ -317,6 +756,18 @@ class ADBManager:
         Returns:
             True if successful
         """
+        if self.client is not None:
+            try:
+                await self._native(self.client.query(f"host:disconnect:{device_id}"), "disconnect")
+            except ADBFailure as e:
+                logger.error(f"Disconnect failed: {e}")
+                return False
+            except ADBConnectionError as e:
+                self._fallback(e)
+            else:
+                logger.info(f"Disconnected {device_id}")
+                return True
+
         stdout, stderr, code = await self._run_command(["disconnect", device_id])
 
         if code != 0:
@@ -331,11 +782,11 @@ class ADBManager:
 _adb_manager: ADBManager | None = None
 
 
-def get_adb_manager(adb_path: str = "adb") -> ADBManager:
+def get_adb_manager(adb_path: str = config.ADB_PATH) -> ADBManager:
     """Get the global ADB manager instance.
 
     Args:
-        adb_path: Path to adb executable
+        adb_path: Path to adb executable (default: ADB_PATH)
 
     Returns:
         ADBManager instance
@@ -0,0 +1,407 @@
+"""Native client for the ADB server's smart-socket protocol.
+
+Talks to the ADB server (``adb start-server``, localhost:5037 by default)
+directly instead of forking an ``adb`` process per call.
+
+Protocol summary:
+
+- Every request is a 4-digit hex length followed by the service name, e.g.
+  ``000chost:version``.
+- The server answers ``OKAY`` or ``FAIL`` + hex length + message.
+- Host queries (``host:devices-l``, ``host:version``, ...) then send a
+  hex-length-prefixed string.
+- ``host-serial:<serial>:forward:...`` answers a second status once the
+  forward is installed.
+- ``host:track-devices-l`` keeps the socket open and sends the full device
+  list (hex-length-prefixed) again whenever it changes.
+- Device services (``shell:``, ``exec:``, ``reverse:``, ``sync:``) first
+  switch the socket to a device with ``host:transport:<serial>``; after that
+  the socket carries the service's own stream.
+
+The server closes a socket once its service is done, so sockets cannot be
+reused. The client instead keeps a small pool of pre-connected sockets, so a
+request does not wait for a connect.
+"""
+
+import asyncio
+import logging
+import struct
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADB_HOST = "127.0.0.1"
+DEFAULT_ADB_PORT = 5037
+
+# shell,v2 packet: id (u8) + payload length (u32 little-endian)
+SHELL_PACKET = struct.Struct("<BI")
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+SHELL_CLOSE_STDIN = 4
+
+# sync: request/response header: id (4 bytes) + length (u32 little-endian)
+_SYNC_HEADER = struct.Struct("<4sI")
+
+
+class ADBConnectionError(Exception):
+    """Raised when the ADB server cannot be reached."""
+
+    pass
+
+
+class ADBFailure(Exception):
+    """Raised when the ADB server or device rejects a request."""
+
+    pass
+
+
+class ADBClient:
+    """Asyncio client for the ADB server."""
+
+    def __init__(
+        self,
+        host: str = DEFAULT_ADB_HOST,
+        port: int = DEFAULT_ADB_PORT,
+        pool_size: int = 2,
+        connect_timeout: float = 2.0,
+    ) -> None:
+        """Initialize the client.
+
+        Args:
+            host: ADB server host
+            port: ADB server port
+            pool_size: Pre-connected sockets to keep ready (0 disables the pool)
+            connect_timeout: Seconds to wait for a connection
+        """
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._refills: set[asyncio.Task] = set()
+        # Feature lists by serial (e.g. "shell_v2"), fetched once per device
+        self._features: dict[str, frozenset[str]] = {}
+
+    async def _open(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open a new socket to the ADB server.
+
+        Returns:
+            Stream reader and writer
+
+        Raises:
+            ADBConnectionError: If the server cannot be reached
+        """
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.connect_timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ADBConnectionError(
+                f"Cannot reach ADB server at {self.host}:{self.port}: {e}"
+            ) from e
+
+    def _refill(self) -> None:
+        """Top the pool of pre-connected sockets back up in the background."""
+        missing = self.pool_size - len(self._idle) - len(self._refills)
+        for _ in range(max(0, missing)):
+            task = asyncio.create_task(self._open())
+            self._refills.add(task)
+            task.add_done_callback(self._refilled)
+
+    def _refilled(self, task: asyncio.Task) -> None:
+        self._refills.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            self._idle.append(task.result())
+
+    async def _connect(
+        self, service: str
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Get a socket and send a service request on it.
+
+        A pooled socket the server has closed in the meantime is replaced
+        by a fresh one.
+
+        Args:
+            service: Service name (e.g. "host:version")
+
+        Returns:
+            Stream reader and writer, after the server answered OKAY
+
+        Raises:
+            ADBConnectionError: If the server cannot be reached
+            ADBFailure: If the server answered FAIL
+        """
+        pooled = None
+        while self._idle and pooled is None:
+            reader, writer = self._idle.pop()
+            if reader.at_eof() or writer.is_closing():
+                writer.close()
+            else:
+                pooled = reader, writer
+        self._refill()
+
+        if pooled is not None:
+            reader, writer = pooled
+            try:
+                await self._send(reader, writer, service)
+                return reader, writer
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Went stale in the pool (e.g. the server restarted)
+                writer.close()
+            except BaseException:
+                writer.close()
+                raise
+
+        reader, writer = await self._open()
+        try:
+            await self._send(reader, writer, service)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            writer.close()
+            raise ADBConnectionError(f"ADB server closed the connection: {e}") from e
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    @staticmethod
+    async def _send(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter, service: str
+    ) -> None:
+        """Send a request and read its status.
+
+        Raises:
+            ADBFailure: If the server answered FAIL
+        """
+        request = service.encode("utf-8")
+        writer.write(b"%04x" % len(request) + request)
+        await writer.drain()
+        await _read_status(reader)
+
+    async def query(self, service: str) -> str:
+        """Run a host query that answers with a string.
+
+        Args:
+            service: Host service (e.g. "host:devices-l")
+
+        Returns:
+            Response text
+        """
+        reader, writer = await self._connect(service)
+        try:
+            return await _read_string(reader)
+        finally:
+            writer.close()
+
+    async def command(self, service: str) -> None:
+        """Run a host command that answers with a second status (forwards).
+
+        Args:
+            service: Host service (e.g. "host-serial:<serial>:forward:tcp:1;tcp:2")
+
+        Raises:
+            ADBFailure: If the command failed
+        """
+        reader, writer = await self._connect(service)
+        try:
+            await _read_status(reader)
+        finally:
+            writer.close()
+
+    async def track_devices(self) -> AsyncIterator[str]:
+        """Subscribe to device list changes.
+
+        Yields:
+            Device list text (as ``host:devices-l`` returns it), first the
+            current list, then again after every change
+
+        Raises:
+            ADBConnectionError: If the server cannot be reached or closes the
+                subscription
+        """
+        reader, writer = await self._connect("host:track-devices-l")
+        try:
+            while True:
+                try:
+                    text = await _read_string(reader)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    raise ADBConnectionError(f"Device tracking connection lost: {e}") from e
+                yield text
+        finally:
+            writer.close()
+
+    async def open_service(
+        self, serial: str, service: str
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open a device service and hand over its stream.
+
+        Args:
+            serial: Device serial number
+            service: Device service (e.g. "exec:screencap -p")
+
+        Returns:
+            Stream reader and writer of the service; the caller closes them
+        """
+        reader, writer = await self._connect(f"host:transport:{serial}")
+        try:
+            await self._send(reader, writer, service)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def device_command(self, serial: str, service: str) -> None:
+        """Run a device service that answers with a status (reverse forwards).
+
+        Args:
+            serial: Device serial number
+            service: Device service (e.g. "reverse:forward:tcp:1;tcp:2")
+
+        Raises:
+            ADBFailure: If the command failed
+        """
+        reader, writer = await self.open_service(serial, service)
+        try:
+            await _read_status(reader)
+        finally:
+            writer.close()
+
+    async def features(self, serial: str) -> frozenset[str]:
+        """Get the features shared by the ADB server and a device.
+
+        Args:
+            serial: Device serial number
+
+        Returns:
+            Feature names (e.g. "shell_v2")
+        """
+        features = self._features.get(serial)
+        if features is None:
+            text = await self.query(f"host-serial:{serial}:features")
+            features = frozenset(f for f in text.strip().split(",") if f)
+            self._features[serial] = features
+        return features
+
+    async def shell(self, serial: str, command: str) -> tuple[bytes, bytes, int]:
+        """Run a shell command on a device.
+
+        Uses the shell v2 protocol where the device supports it, which keeps
+        stdout and stderr apart and reports the exit status. Legacy devices
+        get stderr mixed into stdout and an exit status of 0.
+
+        Args:
+            serial: Device serial number
+            command: Shell command line
+
+        Returns:
+            Tuple of (stdout, stderr, exit status)
+        """
+        if "shell_v2" not in await self.features(serial):
+            return await self.exec_out(serial, command, service="shell"), b"", 0
+
+        reader, writer = await self.open_service(serial, f"shell,v2,raw:{command}")
+        stdout = bytearray()
+        stderr = bytearray()
+        code = 0
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(SHELL_PACKET.size)
+                except asyncio.IncompleteReadError:
+                    break
+                packet_id, length = SHELL_PACKET.unpack(header)
+                payload = await reader.readexactly(length)
+                if packet_id == SHELL_STDOUT:
+                    stdout += payload
+                elif packet_id == SHELL_STDERR:
+                    stderr += payload
+                elif packet_id == SHELL_EXIT:
+                    code = payload[0] if payload else 0
+                    break
+        finally:
+            writer.close()
+        return bytes(stdout), bytes(stderr), code
+
+    async def exec_out(self, serial: str, command: str, service: str = "exec") -> bytes:
+        """Run a command and collect its raw (binary-safe) stdout.
+
+        Args:
+            serial: Device serial number
+            command: Command line
+            service: "exec" (no pty, binary-safe) or "shell"
+
+        Returns:
+            Everything the command wrote to stdout
+        """
+        reader, writer = await self.open_service(serial, f"{service}:{command}")
+        try:
+            return await reader.read()
+        finally:
+            writer.close()
+
+    async def pull(self, serial: str, remote_path: str, local_path: str) -> None:
+        """Copy a file from a device with the sync protocol.
+
+        Args:
+            serial: Device serial number
+            remote_path: Path on the device
+            local_path: Local destination path
+
+        Raises:
+            ADBFailure: If the device could not send the file
+        """
+        reader, writer = await self.open_service(serial, "sync:")
+        try:
+            path = remote_path.encode("utf-8")
+            writer.write(_SYNC_HEADER.pack(b"RECV", len(path)) + path)
+            await writer.drain()
+
+            with open(local_path, "wb") as f:
+                while True:
+                    chunk_id, length = _SYNC_HEADER.unpack(
+                        await reader.readexactly(_SYNC_HEADER.size)
+                    )
+                    if chunk_id == b"DATA":
+                        f.write(await reader.readexactly(length))
+                    elif chunk_id == b"DONE":
+                        break
+                    elif chunk_id == b"FAIL":
+                        message = await reader.readexactly(length)
+                        raise ADBFailure(message.decode("utf-8", errors="replace"))
+                    else:
+                        raise ADBFailure(f"Unexpected sync response: {chunk_id!r}")
+
+            writer.write(_SYNC_HEADER.pack(b"QUIT", 0))
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        """Close the pooled sockets."""
+        for task in list(self._refills):
+            task.cancel()
+        self._refills.clear()
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+async def _read_status(reader: asyncio.StreamReader) -> None:
+    """Read an OKAY/FAIL status.
+
+    Raises:
+        ADBFailure: If the status is FAIL (or unknown)
+    """
+    status = await reader.readexactly(4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        raise ADBFailure(await _read_string(reader))
+    raise ADBFailure(f"Unexpected ADB status: {status!r}")
+
+
+async def _read_string(reader: asyncio.StreamReader) -> str:
+    """Read a hex-length-prefixed string."""
+    length = int(await reader.readexactly(4), 16)
+    return (await reader.readexactly(length)).decode("utf-8", errors="replace")
@@ -0,0 +1,325 @@
+"""Message broker between relay worker processes.
+
+ConnectionManager delivers every room-wide message (relayed frames and
+presence events) to its own clients and publishes it to the broker, which
+hands it to the ConnectionManagers of the other workers.
+
+Implementations:
+- LocalBroker: single process, nothing to forward
+- UnixSocketBroker: all workers on one box exchange messages through a hub
+  listening on a Unix domain socket. The worker holding the hub lock file
+  runs the hub; if it dies, another worker takes over on reconnect.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+from dataclasses import dataclass
+from typing import Callable
+
+from .codec import get_codec
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# Message kinds
+RELAY = "relay"  # Frame from a client, delivered to the other side of its room
+EVENT = "event"  # Server-generated message, delivered to the whole room
+
+# Frame: u32 body length | u16 header length | header JSON | payload
+_FRAME_LENGTH = struct.Struct("!I")
+_HEADER_LENGTH = struct.Struct("!H")
+
+RECONNECT_DELAY = 0.5  # Seconds between broker reconnect attempts
+
+
+@dataclass
+class BrokerMessage:
+    """A room-wide message exchanged between workers."""
+
+    kind: str  # RELAY or EVENT
+    room_id: str | None
+    payload: str | bytes  # Encoded frame, forwarded unchanged
+    origin: str = ""  # Node ID of the publishing worker
+    sender_id: str | None = None
+    sender_device_type: str | None = None
+    msg_type: str | None = None
+    wire_format: str = "json"  # Format of the payload
+    # Wall-clock time (ms) the publishing worker received the frame
+    received_ms: int | None = None
+    seq: int | None = None  # Relay sequence number of the sender's frame
+
+
+def encode_broker_message(message: BrokerMessage) -> bytes:
+    """Encode a message as a length-prefixed frame.
+
+    Args:
+        message: Message to encode
+
+    Returns:
+        Frame bytes
+    """
+    is_bytes = isinstance(message.payload, bytes)
+    header = get_codec().dumps_bytes(
+        [
+            message.kind,
+            message.room_id,
+            message.origin,
+            message.sender_id,
+            message.sender_device_type,
+            message.msg_type,
+            message.wire_format,
+            is_bytes,
+            message.received_ms,
+            message.seq,
+        ]
+    )
+    payload = message.payload if is_bytes else message.payload.encode("utf-8")
+    body_length = _HEADER_LENGTH.size + len(header) + len(payload)
+    return b"".join(
+        (_FRAME_LENGTH.pack(body_length), _HEADER_LENGTH.pack(len(header)), header, payload)
+    )
+
+
+def decode_broker_message(body: bytes) -> BrokerMessage:
+    """Decode the body of a frame.
+
+    Args:
+        body: Frame body (without the length prefix)
+
+    Returns:
+        Decoded message
+
+    Raises:
+        ValueError: If the frame is malformed
+    """
+    (header_length,) = _HEADER_LENGTH.unpack_from(body)
+    header_end = _HEADER_LENGTH.size + header_length
+    (
+        kind,
+        room_id,
+        origin,
+        sender_id,
+        sender_device_type,
+        msg_type,
+        wire_format,
+        is_bytes,
+        received_ms,
+        seq,
+    ) = get_codec().loads(body[_HEADER_LENGTH.size : header_end])
+    payload = body[header_end:]
+    return BrokerMessage(
+        kind=kind,
+        room_id=room_id,
+        payload=payload if is_bytes else payload.decode("utf-8"),
+        origin=origin,
+        sender_id=sender_id,
+        sender_device_type=sender_device_type,
+        msg_type=msg_type,
+        wire_format=wire_format,
+        received_ms=received_ms,
+        seq=seq,
+    )
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    """Read one length-prefixed frame body.
+
+    Args:
+        reader: Stream to read from
+
+    Returns:
+        Frame body
+
+    Raises:
+        asyncio.IncompleteReadError: If the stream ends mid-frame
+    """
+    (length,) = _FRAME_LENGTH.unpack(await reader.readexactly(_FRAME_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+class Broker:
+    """Base broker. Subclasses forward messages between worker processes."""
+
+    # Whether other processes share the rooms (client IDs must be unique)
+    distributed = False
+
+    def __init__(self) -> None:
+        self.node_id = f"{os.getpid():x}"
+        self.published = 0
+        self.dropped = 0
+
+    async def start(self, deliver: Callable[[BrokerMessage], None]) -> None:
+        """Start receiving messages from other workers.
+
+        Args:
+            deliver: Called with each message published by another worker
+        """
+
+    async def stop(self) -> None:
+        """Stop the broker."""
+
+    def publish(self, message: BrokerMessage) -> None:
+        """Forward a message to the other workers without blocking.
+
+        Args:
+            message: Message already delivered to local clients
+        """
+
+
+class LocalBroker(Broker):
+    """In-process broker: a single worker has no peers to forward to."""
+
+
+class UnixSocketBroker(Broker):
+    """Broker connecting the workers of one box through a Unix domain socket."""
+
+    distributed = True
+
+    def __init__(self, path: str, max_buffer: int = 4 * 1024 * 1024) -> None:
+        """Initialize the broker.
+
+        Args:
+            path: Path of the hub socket (a ".lock" file is created next to it)
+            max_buffer: Bytes that may be buffered per peer before messages
+                are dropped
+        """
+        super().__init__()
+        self.path = path
+        self.max_buffer = max_buffer
+        self._deliver: Callable[[BrokerMessage], None] | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._task: asyncio.Task | None = None
+        self._lock_fd: int | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._peers: set[asyncio.StreamWriter] = set()
+
+    async def start(self, deliver: Callable[[BrokerMessage], None]) -> None:
+        self._deliver = deliver
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._server is not None:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def publish(self, message: BrokerMessage) -> None:
+        writer = self._writer
+        if writer is None or writer.transport.get_write_buffer_size() > self.max_buffer:
+            self.dropped += 1
+            return
+        writer.write(encode_broker_message(message))
+        self.published += 1
+
+    async def _run(self) -> None:
+        """Stay connected to the hub, hosting it if no other worker does."""
+        while True:
+            try:
+                await self._host_if_free()
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                logger.debug(f"Broker hub not reachable at {self.path}: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            logger.info(f"Worker {self.node_id} connected to relay broker at {self.path}")
+            self._writer = writer
+            try:
+                while True:
+                    self._receive(await _read_frame(reader))
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                logger.warning(f"Relay broker connection lost: {e}")
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _receive(self, body: bytes) -> None:
+        """Deliver a message from another worker to local clients."""
+        try:
+            message = decode_broker_message(body)
+        except (ValueError, TypeError, struct.error) as e:
+            logger.error(f"Dropping malformed broker frame: {e}")
+            return
+        if message.origin != self.node_id and self._deliver is not None:
+            self._deliver(message)
+
+    async def _host_if_free(self) -> None:
+        """Start the hub if no other worker holds the hub lock."""
+        if self._server is not None:
+            return
+
+        if self._lock_fd is None:
+            fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return
+            self._lock_fd = fd
+
+        # We hold the lock, so any existing socket file is stale
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self.path)
+        logger.info(f"Worker {self.node_id} hosting relay broker hub at {self.path}")
+
+    async def _serve_peer(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Hub side: forward every frame from one worker to all the others."""
+        self._peers.add(writer)
+        try:
+            while True:
+                body = await _read_frame(reader)
+                frame = _FRAME_LENGTH.pack(len(body)) + body
+                for peer in self._peers:
+                    if peer is writer:
+                        continue
+                    if peer.transport.get_write_buffer_size() > self.max_buffer:
+                        self.dropped += 1
+                        continue
+                    peer.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Hub shutting down; don't let the stream callback re-raise it
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+
+def create_broker(kind: str = config.RELAY_BROKER) -> Broker:
+    """Create the broker selected by config.
+
+    Args:
+        kind: "local" or "uds"
+
+    Returns:
+        Broker instance
+    """
+    if kind == "uds":
+        return UnixSocketBroker(config.RELAY_BROKER_PATH)
+    if kind != "local":
+        logger.warning(f"Unknown relay broker '{kind}', using local")
+    return LocalBroker()
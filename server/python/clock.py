@@ -0,0 +1,107 @@
+"""Clock synchronization between the relay and its WebSocket clients.
+
+NTP-style exchanges over /ws, all times in Unix epoch milliseconds:
+
+- Client-initiated: the client sends ``{"type": "ping", "t0": <client send>}``
+  and gets ``{"type": "pong", "t0": t0, "t1": <server receive>,
+  "t2": <server send>}``. With t3 the client receive time:
+  ``offset = ((t1 - t0) + (t2 - t3)) / 2`` (server minus client) and
+  ``rtt = (t3 - t0) - (t2 - t1)``.
+- Server-initiated: the server sends ``{"type": "clock_sync", "t0": <server
+  send>}`` and the client echoes ``{"type": "clock_sync_reply", "t0": t0,
+  "t1": <client receive>, "t2": <client send>}``. The server keeps the sample
+  with the lowest RTT out of the recent ones and tells the client its estimate
+  with ``{"type": "clock", "offset_ms": <client minus server>, "rtt_ms": ...}``.
+
+Relayed frames carry ``srv_ts``, the server receive time; a receiver converts
+it to its own clock with ``srv_ts + offset_ms``.
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass
+
+# Samples kept per client; the lowest-RTT one is the estimate
+SAMPLE_WINDOW = 8
+# Exchanges run back to back after a client first answers a sync
+INITIAL_SAMPLES = 4
+
+
+def now_ms() -> int:
+    """Get the server wall-clock time.
+
+    Returns:
+        Unix epoch milliseconds
+    """
+    return time.time_ns() // 1_000_000
+
+
+@dataclass
+class ClockSample:
+    """One sync exchange."""
+
+    offset_ms: float  # Client clock minus server clock
+    rtt_ms: float
+
+
+class ClockEstimator:
+    """Per-client clock offset estimate from server-initiated exchanges."""
+
+    def __init__(self, window: int = SAMPLE_WINDOW) -> None:
+        """Initialize the estimator.
+
+        Args:
+            window: Number of recent samples to pick the estimate from
+        """
+        self.samples: deque[ClockSample] = deque(maxlen=window)
+        self.pending_t0: int | None = None  # Send time of the unanswered sync
+        self.active = False  # Client has answered at least once
+
+    def start_exchange(self) -> int:
+        """Start a sync exchange.
+
+        Returns:
+            Server send time (t0) to put in the clock_sync frame
+        """
+        self.pending_t0 = now_ms()
+        return self.pending_t0
+
+    def add_reply(self, t0: int, t1: float, t2: float, t3: int) -> ClockSample | None:
+        """Record a clock_sync_reply.
+
+        Args:
+            t0: Server send time echoed by the client
+            t1: Client receive time
+            t2: Client send time
+            t3: Server receive time
+
+        Returns:
+            The new sample, or None if the reply does not answer the pending
+            exchange or is inconsistent
+        """
+        if t0 != self.pending_t0:
+            return None
+        self.pending_t0 = None
+
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return None
+        sample = ClockSample(offset_ms=((t1 - t0) + (t2 - t3)) / 2, rtt_ms=rtt)
+        self.samples.append(sample)
+        self.active = True
+        return sample
+
+    @property
+    def best(self) -> ClockSample | None:
+        """Lowest-RTT recent sample (least affected by queueing delay)."""
+        if not self.samples:
+            return None
+        return min(self.samples, key=lambda s: s.rtt_ms)
+
+    def needs_more_samples(self) -> bool:
+        """Check if the initial burst of exchanges is still running.
+
+        Returns:
+            True if fewer than INITIAL_SAMPLES samples were collected
+        """
+        return len(self.samples) < INITIAL_SAMPLES
@@ -0,0 +1,164 @@
+"""Pluggable JSON codec for WebSocket frames and HTTP responses.
+
+The codec is selected with the JSON_CODEC setting:
+- "auto": orjson if installed, then msgspec, then the standard library
+- "orjson" / "msgspec" / "json": that codec, falling back to the standard
+  library if it is not installed
+"""
+
+import json
+import logging
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+class JSONCodec:
+    """Standard library JSON codec."""
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> str:
+        """Serialize an object to JSON text.
+
+        Args:
+            obj: Object to serialize
+
+        Returns:
+            JSON text
+        """
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        """Serialize an object to UTF-8 encoded JSON.
+
+        Args:
+            obj: Object to serialize
+
+        Returns:
+            JSON bytes
+        """
+        return self.dumps(obj).encode("utf-8")
+
+    def loads(self, data: str | bytes) -> Any:
+        """Deserialize JSON text or bytes.
+
+        Args:
+            data: JSON text or bytes
+
+        Returns:
+            Decoded object
+
+        Raises:
+            ValueError: If the data is not valid JSON
+        """
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson-backed codec."""
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._orjson = orjson
+
+    def dumps(self, obj: Any) -> str:
+        return self._orjson.dumps(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj)
+
+    def loads(self, data: str | bytes) -> Any:
+        # orjson.JSONDecodeError subclasses ValueError
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec(JSONCodec):
+    """msgspec-backed codec."""
+
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._decode_error = msgspec.DecodeError
+
+    def dumps(self, obj: Any) -> str:
+        return self._encoder.encode(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def loads(self, data: str | bytes) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._decode_error as e:
+            raise ValueError(str(e)) from e
+
+
+CODECS: dict[str, type[JSONCodec]] = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "json": JSONCodec,
+}
+
+
+def create_codec(name: str) -> JSONCodec:
+    """Create a codec by name, falling back when its library is missing.
+
+    Args:
+        name: "auto", "orjson", "msgspec" or "json"
+
+    Returns:
+        JSONCodec instance
+    """
+    name = name.lower()
+    if name == "auto":
+        candidates = ["orjson", "msgspec", "json"]
+    elif name in CODECS:
+        candidates = [name, "json"]
+    else:
+        logger.warning(f"Unknown JSON codec '{name}', using json")
+        candidates = ["json"]
+
+    for candidate in candidates:
+        try:
+            return CODECS[candidate]()
+        except ImportError:
+            if name != "auto":
+                logger.warning(f"JSON codec '{candidate}' is not installed, using json")
+
+    return JSONCodec()
+
+
+# Global codec instance
+_codec: JSONCodec | None = None
+
+
+def get_codec() -> JSONCodec:
+    """Get the global codec instance selected by config.
+
+    Returns:
+        JSONCodec instance
+    """
+    global _codec
+    if _codec is None:
+        _codec = create_codec(config.JSON_CODEC)
+        logger.info(f"Using JSON codec: {_codec.name}")
+    return _codec
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse rendered with the configured codec."""
+
+    def render(self, content: Any) -> bytes:
+        return get_codec().dumps_bytes(content)
@@ -11,6 +11,7 @@ class Config:
     # Server settings
     HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
     PORT: int = int(os.getenv("SERVER_PORT", "3000"))
+    WORKERS: int = int(os.getenv("SERVER_WORKERS", "1"))
 
     # CORS settings
     ALLOWED_ORIGINS: list[str] = os.getenv(
@@ -21,6 +22,107 @@ class Config:
     # WebSocket settings
     WS_PING_INTERVAL: int = int(os.getenv("WS_PING_INTERVAL", "20"))
     WS_PING_TIMEOUT: int = int(os.getenv("WS_PING_TIMEOUT", "20"))
+    # Reject /ws handshakes without a room_id (otherwise they share a default room)
+    WS_REQUIRE_ROOM: bool = os.getenv("WS_REQUIRE_ROOM", "false").lower() == "true"
+    # Per-client outbound queue: max pending frames and what to do when full
+    # ("drop_oldest", "conflate" or "disconnect")
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    WS_QUEUE_FULL_POLICY: str = os.getenv("WS_QUEUE_FULL_POLICY", "drop_oldest")
+    # Slow-consumer eviction (close code 1013): a single send or a queue
+    # backlog past WS_SLOW_QUEUE_DEPTH lasting WS_SLOW_SEND_TIMEOUT_MS, or an
+    # average send time above WS_SLOW_SEND_AVG_MS
+    WS_EVICT_SLOW_CONSUMERS: bool = (
+        os.getenv("WS_EVICT_SLOW_CONSUMERS", "true").lower() == "true"
+    )
+    WS_SLOW_SEND_TIMEOUT_MS: int = int(os.getenv("WS_SLOW_SEND_TIMEOUT_MS", "500"))
+    WS_SLOW_SEND_AVG_MS: int = int(os.getenv("WS_SLOW_SEND_AVG_MS", "100"))
+    WS_SLOW_QUEUE_DEPTH: int = int(os.getenv("WS_SLOW_QUEUE_DEPTH", "64"))
+    # Latest-value message types: a pending frame is replaced by the newest one
+    WS_CONFLATE_TYPES: frozenset[str] = frozenset(
+        t.strip()
+        for t in os.getenv("WS_CONFLATE_TYPES", "FRET_UPDATE,chord_change").split(",")
+        if t.strip()
+    )
+    # Delivery budget (ms) per message type, as "type:ms" pairs: relayed frames
+    # still queued that long after they were received are dropped unsent
+    WS_MESSAGE_TTL_MS: dict[str, int] = {
+        t.split(":")[0].strip(): int(t.split(":")[1])
+        for t in os.getenv(
+            "WS_MESSAGE_TTL_MS", "chord_change:250,FRET_UPDATE:150,STRUM_EVENT:150"
+        ).split(",")
+        if t.strip()
+    }
+    # Max window (ms) for packing text frames to clients connected with
+    # batch=1 into one JSON array frame; the window adapts to load (0 = off)
+    WS_BATCH_WINDOW_MS: float = float(os.getenv("WS_BATCH_WINDOW_MS", "3"))
+    # Priority lanes of the per-client send queues: critical types are sent
+    # first, bulk types last, everything else in between
+    WS_CRITICAL_TYPES: frozenset[str] = frozenset(
+        t.strip()
+        for t in os.getenv("WS_CRITICAL_TYPES", "chord_change,FRET_UPDATE,STRUM_EVENT").split(",")
+        if t.strip()
+    )
+    WS_BULK_TYPES: frozenset[str] = frozenset(
+        t.strip()
+        for t in os.getenv("WS_BULK_TYPES", "strings_pressed,strings_released").split(",")
+        if t.strip()
+    )
+    # Forward relay frames unparsed (false = decode and re-encode every frame)
+    WS_PASSTHROUGH: bool = os.getenv("WS_PASSTHROUGH", "true").lower() == "true"
+    # Seconds between server-initiated clock syncs (0 = only client pings)
+    WS_CLOCK_SYNC_INTERVAL: float = float(os.getenv("WS_CLOCK_SYNC_INTERVAL", "10"))
+    # Add the server receive time ("srv_ts") to relayed frames
+    WS_STAMP_SERVER_TIME: bool = (
+        os.getenv("WS_STAMP_SERVER_TIME", "true").lower() == "true"
+    )
+    # Controller state kept per room and sent as a snapshot to joining clients
+    WS_SNAPSHOT_TYPES: frozenset[str] = frozenset(
+        t.strip()
+        for t in os.getenv("WS_SNAPSHOT_TYPES", "chord_change,FRET_UPDATE,STRUM_EVENT").split(",")
+        if t.strip()
+    )
+    WS_SNAPSHOT_MAX_ROOMS: int = int(os.getenv("WS_SNAPSHOT_MAX_ROOMS", "10000"))
+    # Seconds a dropped session can be resumed with its resume token (0 = off)
+    WS_RESUME_GRACE_SECONDS: float = float(os.getenv("WS_RESUME_GRACE_SECONDS", "10"))
+    # HMAC secret for resume tokens (default: random per process)
+    WS_RESUME_SECRET: str = os.getenv("WS_RESUME_SECRET", "")
+    # Window (ms) over which joins/leaves are batched into one presence frame
+    # per room (0 = one frame per event)
+    WS_PRESENCE_WINDOW_MS: int = int(os.getenv("WS_PRESENCE_WINDOW_MS", "50"))
+
+    # Relay broker between worker processes ("local" or "uds")
+    RELAY_BROKER: str = os.getenv("RELAY_BROKER", "local")
+    RELAY_BROKER_PATH: str = os.getenv("RELAY_BROKER_PATH", "/tmp/air-guitar-relay.sock")
+
+    # ADB: talk to the ADB server directly (falls back to the adb executable
+    # when the server cannot be reached)
+    ADB_PATH: str = os.getenv("ADB_PATH", "adb")
+    ADB_NATIVE: bool = os.getenv("ADB_NATIVE", "true").lower() == "true"
+    ADB_SERVER_HOST: str = os.getenv("ADB_SERVER_HOST", "127.0.0.1")
+    ADB_SERVER_PORT: int = int(
+        os.getenv("ADB_SERVER_PORT", os.getenv("ANDROID_ADB_SERVER_PORT", "5037"))
+    )
+    # Keep the device list current with a host:track-devices-l subscription
+    # (needs ADB_NATIVE)
+    ADB_TRACK_DEVICES: bool = os.getenv("ADB_TRACK_DEVICES", "true").lower() == "true"
+    # Run shell commands through persistent per-device shells (needs
+    # ADB_NATIVE): shells per device and seconds an idle shell is kept
+    ADB_SHELL_SESSIONS: bool = os.getenv("ADB_SHELL_SESSIONS", "true").lower() == "true"
+    ADB_SHELL_SESSIONS_PER_DEVICE: int = int(os.getenv("ADB_SHELL_SESSIONS_PER_DEVICE", "2"))
+    ADB_SHELL_IDLE_TIMEOUT: float = float(os.getenv("ADB_SHELL_IDLE_TIMEOUT", "60"))
+
+    # Screen mirroring (/ws/mirror): screenrecord bit rate and size ("" for
+    # the display size), frames a viewer may fall behind before its queue
+    # is dropped, and the screencap fallback's interval and downscaling
+    MIRROR_BIT_RATE: int = int(os.getenv("MIRROR_BIT_RATE", "4000000"))
+    MIRROR_SIZE: str = os.getenv("MIRROR_SIZE", "")
+    MIRROR_QUEUE_FRAMES: int = int(os.getenv("MIRROR_QUEUE_FRAMES", "120"))
+    MIRROR_FALLBACK_INTERVAL_MS: int = int(os.getenv("MIRROR_FALLBACK_INTERVAL_MS", "500"))
+    MIRROR_FALLBACK_SCALE: int = int(os.getenv("MIRROR_FALLBACK_SCALE", "2"))
+
+    # JSON codec for WebSocket frames and HTTP responses
+    # ("auto", "orjson", "msgspec" or "json")
+    JSON_CODEC: str = os.getenv("JSON_CODEC", "auto")
 
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "info")
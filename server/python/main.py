@@ -7,20 +7,25 @@ This server provides:
 - Health check endpoint
 """
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from typing import AsyncIterator
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
+from .codec import CodecJSONResponse, get_codec
 from .config import config
+from .mirror import get_mirror_hub
+from .presence import PRESENCE_FULL, PRESENCE_MODES
+from .screencap import CAPTURE_FORMATS, FORMAT_PNG
 from .websocket import ConnectionManager, get_connection_manager
-from .adb import get_adb_manager
-from .database import get_db_session
+from .adb import ADBDevice, ADBError, get_adb_manager
+from .database import async_session_factory, get_db_session
 from .models.room import Room
 
 # Configure logging
@@ -34,6 +39,9 @@ logger = logging.getLogger(__name__)
 connection_manager: ConnectionManager | None = None
 adb_manager = get_adb_manager()
 
+# Seconds between keep-alive comments on the device event stream
+DEVICE_EVENTS_KEEPALIVE = 15.0
+
 
 # Pydantic models for API
 class RoomCreate(BaseModel):
@@ -69,14 +77,23 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
 
     # Initialize connection manager
     connection_manager = get_connection_manager()
+    await connection_manager.start()
     logger.info("Connection manager initialized")
+    adb_manager.start()
+    if config.WORKERS > 1 and not connection_manager.broker.distributed:
+        logger.warning(
+            "Running several workers with RELAY_BROKER=local: clients on different "
+            "workers will not see each other (set RELAY_BROKER=uds)"
+        )
 
     yield
 
     # Shutdown
     logger.info("Shutting down server...")
     if connection_manager:
-        await connection_manager.disconnect_all()
+        await connection_manager.stop()
+    await get_mirror_hub().close()
+    await adb_manager.close()
     logger.info("Server shutdown complete")
 
 
@@ -86,6 +103,7 @@ app = FastAPI(
     description="WebSocket relay, ADB, and Room management server",
     version="0.3.0",
     lifespan=lifespan,
+    default_response_class=CodecJSONResponse,
 )
 
 # Configure CORS
@@ -101,7 +119,7 @@ app.add_middleware(
 @app.get("/api/health")
 async def health_check() -> JSONResponse:
     """Health check endpoint."""
-    return JSONResponse(
+    return CodecJSONResponse(
         content={
             "status": "ok",
             "service": "air-guitar-left-hand-server",
@@ -110,6 +128,17 @@ async def health_check() -> JSONResponse:
     )
 
 
+@app.get("/api/metrics")
+async def metrics() -> PlainTextResponse:
+    """Relay metrics in Prometheus text format."""
+    if connection_manager is None:
+        raise HTTPException(status_code=503, detail="Server not initialized")
+    return PlainTextResponse(
+        connection_manager.render_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.post("/api/rooms/create")
 async def create_room(
     data: RoomCreate, db: AsyncSession = Depends(get_db_session)
@@ -129,7 +158,7 @@ async def create_room(
         await db.commit()
         await db.refresh(room)
 
-        return JSONResponse(
+        return CodecJSONResponse(
             content={
                 "id": room.id,
                 "room_id": room.room_id,
@@ -165,7 +194,7 @@ async def get_room(
         if room is None:
             raise HTTPException(status_code=404, detail="Room not found")
 
-        return JSONResponse(
+        return CodecJSONResponse(
             content={
                 "id": room.id,
                 "room_id": room.room_id,
@@ -200,21 +229,21 @@ async def validate_room(
         room = result.scalar_one_or_none()
 
         if room is None:
-            return JSONResponse(
+            return CodecJSONResponse(
                 content={"valid": False, "room_id": None, "message": "Room not found"}
             )
 
         if room.is_expired():
-            return JSONResponse(
+            return CodecJSONResponse(
                 content={"valid": False, "room_id": room_id, "message": "Room expired"}
             )
 
-        return JSONResponse(
+        return CodecJSONResponse(
             content={"valid": True, "room_id": room_id, "message": "Room valid"}
         )
     except Exception as e:
         logger.error(f"Failed to validate room: {e}")
-        return JSONResponse(
+        return CodecJSONResponse(
             content={"valid": False, "room_id": None, "message": str(e)}
         )
 
@@ -224,30 +253,70 @@ async def get_adb_devices() -> JSONResponse:
     """Get list of connected ADB devices."""
     try:
         devices = await adb_manager.get_devices()
-        return JSONResponse(
-            content={
-                "devices": [
-                    {
-                        "device_id": d.device_id,
-                        "model": d.model,
-                        "product": d.product,
-                        "device": d.device,
-                    }
-                    for d in devices
-                ]
-            }
-        )
+        return CodecJSONResponse(content={"devices": [_device_json(d) for d in devices]})
     except Exception as e:
         logger.error(f"Failed to get ADB devices: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/adb/devices/events")
+async def adb_device_events() -> StreamingResponse:
+    """Stream device attach/detach events (Server-Sent Events).
+
+    The stream starts with a "devices" event holding the device registry,
+    followed by an "attached" or "detached" event per change. If the ADB
+    server cannot be reached, the registry is empty until it can.
+    """
+    tracker = adb_manager.tracker
+    if tracker is None or not config.ADB_TRACK_DEVICES:
+        raise HTTPException(status_code=503, detail="Device tracking is disabled")
+
+    codec = get_codec()
+
+    async def stream() -> AsyncIterator[str]:
+        events = tracker.subscribe()
+        try:
+            await tracker.wait_synced(DEVICE_EVENTS_KEEPALIVE)
+            devices = [_device_json(d) for d in tracker.devices.values()]
+            yield _sse("devices", codec.dumps({"devices": devices}))
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), DEVICE_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event.event, codec.dumps(_device_json(event.device)))
+        finally:
+            tracker.unsubscribe(events)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _device_json(device: ADBDevice) -> dict[str, str | None]:
+    """Serialize a device for the ADB API."""
+    return {
+        "device_id": device.device_id,
+        "model": device.model,
+        "product": device.product,
+        "device": device.device,
+    }
+
+
+def _sse(event: str, data: str) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
 @app.post("/api/adb/forward")
 async def adb_forward(device_id: str, local_port: int, remote_port: int) -> JSONResponse:
     """Set up ADB port forwarding."""
     try:
         success = await adb_manager.forward_port(device_id, local_port, remote_port)
-        return JSONResponse(content={"success": success})
+        return CodecJSONResponse(content={"success": success})
     except Exception as e:
         logger.error(f"ADB forward failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -258,7 +327,7 @@ async def adb_reverse(device_id: str, remote_port: int, local_port: int) -> JSON
     """Set up ADB reverse port forwarding."""
     try:
         success = await adb_manager.reverse_port(device_id, remote_port, local_port)
-        return JSONResponse(content={"success": success})
+        return CodecJSONResponse(content={"success": success})
     except Exception as e:
         logger.error(f"ADB reverse failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -269,18 +338,64 @@ async def adb_screen_capture(device_id: str) -> JSONResponse:
     """Capture device screen."""
     try:
         path = await adb_manager.screen_capture(device_id)
-        return JSONResponse(content={"path": path})
+        return CodecJSONResponse(content={"path": path})
     except Exception as e:
         logger.error(f"Screen capture failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/adb/screen")
+async def adb_screen_stream(
+    device_id: str,
+    format: str = FORMAT_PNG,
+    scale: int = Query(1, ge=1, le=16),
+) -> StreamingResponse:
+    """Capture device screen into the response.
+
+    Concurrent requests for the same device share one capture.
+
+    Args:
+        device_id: Device serial number
+        format: "png" or "raw" (screencap's raw frame: header + RGBA pixels)
+        scale: Divisor of width and height (1 for full size)
+    """
+    if format not in CAPTURE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+
+    chunks = adb_manager.capture_screen(device_id, format, scale)
+    try:
+        # Fail with an error status rather than a broken image
+        first = await anext(chunks)
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="Screen capture returned no data")
+    except (TimeoutError, asyncio.TimeoutError) as e:
+        logger.error(f"Screen capture failed: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except ConnectionAbortedError as e:
+        # The capture was cancelled (the server is shutting down)
+        raise HTTPException(status_code=503, detail=str(e))
+    except (ADBError, ValueError) as e:
+        logger.error(f"Screen capture failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream() -> AsyncIterator[bytes]:
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(
+        stream(),
+        media_type="image/png" if format == FORMAT_PNG else "application/octet-stream",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
 @app.post("/api/adb/shell")
 async def adb_shell(device_id: str, command: str) -> JSONResponse:
     """Execute shell command on device."""
     try:
         stdout, stderr, code = await adb_manager.shell_command(device_id, command)
-        return JSONResponse(
+        return CodecJSONResponse(
             content={"stdout": stdout, "stderr": stderr, "code": code}
         )
     except Exception as e:
@@ -288,35 +403,124 @@ async def adb_shell(device_id: str, command: str) -> JSONResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _check_room(room_id: str) -> str | None:
+    """Check that a room exists and has not expired.
+
+    Args:
+        room_id: Room ID to check
+
+    Returns:
+        None if the room can be joined, otherwise the rejection reason
+    """
+    from sqlalchemy import select
+
+    async with async_session_factory() as db:
+        result = await db.execute(select(Room).where(Room.room_id == room_id))
+        room = result.scalar_one_or_none()
+
+    if room is None:
+        return "Room not found"
+    if room.is_expired():
+        return "Room expired"
+    return None
+
+
+@app.websocket("/ws/mirror")
+async def mirror_endpoint(websocket: WebSocket) -> None:
+    """WebSocket endpoint for live device screen mirroring.
+
+    Viewers pick the device with the ``device_id`` query parameter
+    (``/ws/mirror?device_id=emulator-5554``); all viewers of a device share
+    one screen stream.
+    """
+    device_id = websocket.query_params.get("device_id")
+    await websocket.accept()
+    if not device_id:
+        await websocket.close(code=1008, reason="device_id is required")
+        return
+
+    await get_mirror_hub().watch(websocket, device_id)
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket) -> None:
-    """WebSocket endpoint for PC and mobile relay."""
+    """WebSocket endpoint for PC and mobile relay.
+
+    Clients bind to a room with the ``room_id`` query parameter
+    (``/ws?room_id=ABC123``). Clients without one share the default room.
+    A ``resume_token`` query parameter resumes a recently dropped session;
+    ``presence=counts`` limits presence frames to member counts, and
+    ``batch=1`` lets the server pack several messages into one JSON array
+    frame.
+    """
     if connection_manager is None:
         await websocket.close(code=1011, reason="Server not initialized")
         return
 
-    await connection_manager.connect(websocket)
+    room_id = websocket.query_params.get("room_id") or None
+    if room_id is None and config.WS_REQUIRE_ROOM:
+        await websocket.close(code=1008, reason="room_id is required")
+        return
+
+    presence = websocket.query_params.get("presence") or PRESENCE_FULL
+    if presence not in PRESENCE_MODES:
+        await websocket.close(code=1008, reason=f"Unknown presence mode: {presence}")
+        return
+
+    if room_id is not None:
+        try:
+            rejection = await _check_room(room_id)
+        except Exception as e:
+            logger.error(f"Failed to validate room {room_id}: {e}")
+            await websocket.close(code=1011, reason="Room validation failed")
+            return
+
+        if rejection:
+            await websocket.close(code=1008, reason=rejection)
+            return
+
+    await connection_manager.connect(
+        websocket,
+        room_id=room_id,
+        resume_token=websocket.query_params.get("resume_token") or None,
+        presence=presence,
+        batch=websocket.query_params.get("batch", "").lower() in ("1", "true"),
+    )
 
     try:
         while True:
-            data = await websocket.receive_json()
-            await connection_manager.handle_message(websocket, data)
-    except WebSocketDisconnect:
-        await connection_manager.disconnect(websocket)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            raw = message.get("text")
+            if raw is None:
+                raw = message.get("bytes") or b""
+
+            if config.WS_PASSTHROUGH:
+                # Forward frames as received; only control messages are parsed
+                await connection_manager.handle_raw(websocket, raw)
+            else:
+                data = connection_manager.decode_frame(websocket, raw)
+                await connection_manager.handle_message(websocket, data, len(raw))
+    except WebSocketDisconnect as e:
+        # A normal close (1000) ends the session; anything else may be resumed
+        await connection_manager.disconnect(websocket, resumable=e.code != 1000)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        await connection_manager.disconnect(websocket)
+        await connection_manager.disconnect(websocket, reason="error")
 
 
 @app.get("/")
 async def root() -> JSONResponse:
     """Root endpoint."""
-    return JSONResponse(
+    return CodecJSONResponse(
         content={
             "message": "Air Guitar Left Hand Server",
             "endpoints": {
                 "health": "/api/health",
-                "websocket": "/ws",
+                "metrics": "/api/metrics",
+                "websocket": "/ws?room_id={room_id}",
+                "mirror": "/ws/mirror?device_id={device_id}",
                 "rooms": {
                     "create": "/api/rooms/create",
                     "get": "/api/rooms/{room_id}",
@@ -324,6 +528,7 @@ async def root() -> JSONResponse:
                 },
                 "adb": {
                     "devices": "/api/adb/devices",
+                    "device_events": "/api/adb/devices/events",
                     "forward": "/api/adb/forward",
                     "reverse": "/api/adb/reverse",
                     "screen": "/api/adb/screen",
@@ -343,6 +548,7 @@ def run_server() -> None:
         host=config.HOST,
         port=config.PORT,
         log_level=config.LOG_LEVEL,
+        workers=config.WORKERS,
         ws_ping_interval=config.WS_PING_INTERVAL,
         ws_ping_timeout=config.WS_PING_TIMEOUT,
     )
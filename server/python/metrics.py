@@ -0,0 +1,312 @@
+"""Relay metrics in Prometheus text format.
+
+Everything runs on the event loop thread, so recording is plain integer
+arithmetic with no locks. Latencies go into HDR-style log-linear histograms
+(16 sub-buckets per power of two, about 6% relative error) that are folded
+into Prometheus buckets and quantiles only when scraped.
+"""
+
+from dataclasses import dataclass
+
+# Message types are client-controlled; cap label cardinality
+MAX_TYPE_LABELS = 64
+OTHER_TYPE = "other"
+
+_SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+_BUCKET_COUNT = 30 * _SUB_BUCKETS  # Up to ~2**30 microseconds (~18 minutes)
+
+# Bucket boundaries (seconds) exposed to Prometheus
+PROMETHEUS_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)  # fmt: skip
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations with microsecond resolution."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Record one duration.
+
+        Args:
+            seconds: Duration in seconds
+        """
+        value = int(seconds * 1_000_000)
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - _SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            index = value
+        else:
+            index = (shift << _SUB_BUCKET_BITS) + (value >> shift)
+        if index >= _BUCKET_COUNT:
+            index = _BUCKET_COUNT - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+
+    @staticmethod
+    def _upper_bound(index: int) -> float:
+        """Upper bound of a bucket in seconds."""
+        if index < 2 * _SUB_BUCKETS:
+            return (index + 1) / 1_000_000
+        shift = (index >> _SUB_BUCKET_BITS) - 1
+        mantissa = index - (shift << _SUB_BUCKET_BITS)
+        return ((mantissa + 1) << shift) / 1_000_000
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile.
+
+        Args:
+            q: Quantile in [0, 1]
+
+        Returns:
+            Upper bound (seconds) of the bucket holding the quantile
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if bucket_count and cumulative >= threshold:
+                return self._upper_bound(index)
+        return self._upper_bound(_BUCKET_COUNT - 1)
+
+    def render(self, name: str, help_text: str) -> list[str]:
+        """Render as a Prometheus histogram plus a quantile gauge.
+
+        Args:
+            name: Metric name
+            help_text: HELP text
+
+        Returns:
+            Exposition lines
+        """
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        boundaries = iter(PROMETHEUS_BUCKETS)
+        boundary = next(boundaries)
+        for index, bucket_count in enumerate(self.counts):
+            while boundary is not None and self._upper_bound(index) > boundary:
+                lines.append(f'{name}_bucket{{le="{boundary}"}} {cumulative}')
+                boundary = next(boundaries, None)
+            cumulative += bucket_count
+        while boundary is not None:
+            lines.append(f'{name}_bucket{{le="{boundary}"}} {cumulative}')
+            boundary = next(boundaries, None)
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.total}")
+        lines.append(f"{name}_count {self.count}")
+
+        lines.append(f"# HELP {name}_quantile {help_text} (HDR quantile estimate)")
+        lines.append(f"# TYPE {name}_quantile gauge")
+        for q in QUANTILES:
+            lines.append(f'{name}_quantile{{quantile="{q}"}} {self.quantile(q)}')
+        return lines
+
+
+@dataclass
+class RelayTrace:
+    """Timing of one relayed message across all of its receivers."""
+
+    received_at: float  # time.monotonic() when the frame was received
+    remaining: int = 0  # Receivers that have not been sent the frame yet
+    last_sent_at: float | None = None  # When a receiver was last sent the frame
+
+
+class RelayMetrics:
+    """Counters and histograms for the WebSocket relay."""
+
+    def __init__(self) -> None:
+        self.messages_in: dict[str, int] = {}
+        self.bytes_in: dict[str, int] = {}
+        self.messages_out: dict[str, int] = {}
+        self.bytes_out: dict[str, int] = {}
+        self.send_failures = 0
+        self.disconnects: dict[str, int] = {}
+        self.frames_dropped = 0
+        self.frames_conflated = 0
+        self.frames_expired: dict[str, int] = {}
+        self.sessions_resumed = 0
+        self.sequence_gaps = 0
+        self.batches_sent = 0
+        self.batched_frames = 0
+        self.frames_out_of_order = 0
+        # Receive -> send to the last receiver of a message
+        self.relay_latency = LatencyHistogram()
+        # Receive -> send, per receiver
+        self.delivery_latency = LatencyHistogram()
+
+    def _type_label(self, counters: dict[str, int], msg_type: str | None) -> str:
+        label = msg_type or OTHER_TYPE
+        if label not in counters and len(counters) >= MAX_TYPE_LABELS:
+            return OTHER_TYPE
+        return label
+
+    def message_in(self, msg_type: str | None, size: int) -> None:
+        """Count a frame received from a client.
+
+        Args:
+            msg_type: Message type from the envelope
+            size: Frame length
+        """
+        label = self._type_label(self.messages_in, msg_type)
+        self.messages_in[label] = self.messages_in.get(label, 0) + 1
+        self.bytes_in[label] = self.bytes_in.get(label, 0) + size
+
+    def message_out(self, msg_type: str | None, size: int) -> None:
+        """Count a frame sent to a client.
+
+        Args:
+            msg_type: Message type of the frame
+            size: Frame length
+        """
+        label = self._type_label(self.messages_out, msg_type)
+        self.messages_out[label] = self.messages_out.get(label, 0) + 1
+        self.bytes_out[label] = self.bytes_out.get(label, 0) + size
+
+    def delivered(self, trace: RelayTrace, now: float) -> None:
+        """Record that a relayed frame was sent to one of its receivers.
+
+        Args:
+            trace: Trace of the relayed message
+            now: Current time.monotonic()
+        """
+        self.delivery_latency.record(now - trace.received_at)
+        trace.last_sent_at = now
+        self.abandoned(trace)
+
+    def abandoned(self, trace: RelayTrace) -> None:
+        """Record that one receiver of a relayed frame is done with it.
+
+        Called for receivers that were sent the frame (see delivered()) and
+        for those that never will be (frame dropped, replaced, expired, or
+        queued for a session that went away). Relay latency is recorded
+        when the last receiver is done, up to the last send.
+
+        Args:
+            trace: Trace of the relayed message
+        """
+        trace.remaining -= 1
+        if trace.remaining == 0 and trace.last_sent_at is not None:
+            self.relay_latency.record(trace.last_sent_at - trace.received_at)
+
+    def expired(self, trace: RelayTrace | None, msg_type: str | None) -> None:
+        """Count a relayed frame dropped past its deadline.
+
+        Args:
+            trace: Trace of the relayed message, if any
+            msg_type: Message type of the frame
+        """
+        label = self._type_label(self.frames_expired, msg_type)
+        self.frames_expired[label] = self.frames_expired.get(label, 0) + 1
+        if trace is not None:
+            self.abandoned(trace)
+
+    def disconnected(self, reason: str) -> None:
+        """Count a disconnect.
+
+        Args:
+            reason: Disconnect reason label
+        """
+        self.disconnects[reason] = self.disconnects.get(reason, 0) + 1
+
+    def render(self, gauges: dict[str, tuple[str, dict[str, float]]]) -> str:
+        """Render all metrics in Prometheus text format.
+
+        Args:
+            gauges: Point-in-time values, as name -> (help, {label string: value})
+
+        Returns:
+            Exposition text
+        """
+        lines: list[str] = []
+
+        for name, (help_text, values) in gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in values.items():
+                lines.append(f"{name}{labels} {value}")
+
+        labelled_counters = (
+            ("relay_messages_in_total", "Frames received from clients", "type", self.messages_in),
+            ("relay_bytes_in_total", "Frame bytes received from clients", "type", self.bytes_in),
+            ("relay_messages_out_total", "Frames sent to clients", "type", self.messages_out),
+            ("relay_bytes_out_total", "Frame bytes sent to clients", "type", self.bytes_out),
+            ("relay_disconnects_total", "Client disconnects", "reason", self.disconnects),
+            (
+                "relay_frames_expired_total",
+                "Relayed frames dropped unsent past their TTL",
+                "type",
+                self.frames_expired,
+            ),
+        )
+        for name, help_text, label, values in labelled_counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for value_label, value in values.items():
+                lines.append(f'{name}{{{label}="{_escape(value_label)}"}} {value}')
+
+        counters = (
+            ("relay_send_failures_total", "Failed sends to clients", self.send_failures),
+            ("relay_frames_dropped_total", "Frames dropped by full queues", self.frames_dropped),
+            (
+                "relay_frames_conflated_total",
+                "State frames replaced by a newer one before sending",
+                self.frames_conflated,
+            ),
+            (
+                "relay_sessions_resumed_total",
+                "Dropped sessions resumed with a resume token",
+                self.sessions_resumed,
+            ),
+            (
+                "relay_batches_sent_total",
+                "Array frames sent to batching clients",
+                self.batches_sent,
+            ),
+            (
+                "relay_batched_frames_total",
+                "Frames sent inside array frames",
+                self.batched_frames,
+            ),
+            (
+                "relay_sequence_gaps_total",
+                "Relayed frames missing from a sender's sequence",
+                self.sequence_gaps,
+            ),
+            (
+                "relay_frames_out_of_order_total",
+                "Relayed frames dropped as older than the sender's last frame",
+                self.frames_out_of_order,
+            ),
+        )
+        for name, help_text, value in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+
+        lines.extend(
+            self.relay_latency.render(
+                "relay_latency_seconds", "Receive to send to the last receiver"
+            )
+        )
+        lines.extend(
+            self.delivery_latency.render(
+                "relay_delivery_latency_seconds", "Receive to send, per receiver"
+            )
+        )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
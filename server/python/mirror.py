@@ -0,0 +1,392 @@
+"""Live device screen mirroring for WebSocket viewers.
+
+One MirrorSession per device runs ``screenrecord --output-format=h264 -``
+through ``exec-out`` and fans the H.264 stream out to every viewer of that
+device, so the device encodes once however many viewers watch. The session
+stops (and with it screenrecord) when the last viewer leaves.
+
+Viewers get a ``{"type": "mirror", "codec": ...}`` text frame, then binary
+frames:
+
+- ``"h264"``: one Annex-B NAL unit (with its 4-byte start code) per frame.
+  Every viewer starts at an IDR frame, preceded by the cached SPS and PPS.
+- ``"png"``: one PNG image per frame, taken every
+  MIRROR_FALLBACK_INTERVAL_MS with screencap, for devices where screenrecord
+  cannot stream (e.g. no ``--output-format``, or a secure display).
+
+Each viewer has a bounded queue. A viewer whose queue overflows loses its
+pending frames. In H.264 mode it then skips frames until the next IDR, since
+frames that reference dropped ones cannot be decoded. The encoder and the
+other viewers never wait for a slow viewer.
+
+screenrecord stops after its time limit (3 minutes by default) and is then
+restarted while viewers remain.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .adb import ADBManager, get_adb_manager
+from .codec import get_codec
+from .config import config
+from .screencap import FORMAT_PNG
+
+logger = logging.getLogger(__name__)
+
+# Viewer codecs
+CODEC_H264 = "h264"
+CODEC_PNG = "png"
+
+# H.264 NAL unit types
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SPS = 7
+NAL_PPS = 8
+
+START_CODE = b"\x00\x00\x00\x01"
+
+# Max chunk size read from screenrecord
+_READ_SIZE = 64 * 1024
+
+# Seconds a screenrecord run must last to be restarted right away
+MIN_RECORD_SECONDS = 1.0
+
+
+def nal_type(nal: bytes) -> int:
+    """Get the type of a NAL unit that starts with a 4-byte start code."""
+    return nal[4] & 0x1F if len(nal) > 4 else 0
+
+
+class AnnexBSplitter:
+    """Splits an H.264 Annex-B byte stream into NAL units."""
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Add stream data.
+
+        Args:
+            data: Next chunk of the stream
+
+        Returns:
+            NAL units completed by the chunk, each with a 4-byte start code
+        """
+        self._buffer += data
+        nals = []
+        start = self._buffer.find(b"\x00\x00\x01")
+        if start < 0:
+            return nals
+
+        while True:
+            end = self._buffer.find(b"\x00\x00\x01", start + 3)
+            if end < 0:
+                break
+            # A 4-byte start code's leading zero does not belong to the payload
+            payload_end = end - 1 if self._buffer[end - 1] == 0 else end
+            nals.append(START_CODE + bytes(self._buffer[start + 3 : payload_end]))
+            start = end
+
+        del self._buffer[:start]
+        return nals
+
+    def flush(self) -> list[bytes]:
+        """Get the last NAL unit once the stream has ended."""
+        start = self._buffer.find(b"\x00\x00\x01")
+        nals = [] if start < 0 else [START_CODE + bytes(self._buffer[start + 3 :])]
+        self._buffer.clear()
+        return nals
+
+
+class MirrorViewer:
+    """A WebSocket watching a device, with its own bounded frame queue."""
+
+    def __init__(self, websocket: WebSocket, max_frames: int) -> None:
+        """Initialize the viewer.
+
+        Args:
+            websocket: Viewer's WebSocket
+            max_frames: Pending frames before the queue is dropped
+        """
+        self.websocket = websocket
+        self.max_frames = max_frames
+        self.frames: deque[str | bytes] = deque()
+        self.needs_keyframe = True  # H.264: skip frames until the next IDR
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def put(self, frame: str | bytes) -> bool:
+        """Queue a frame.
+
+        Returns:
+            False if the queue overflowed and was dropped
+        """
+        if len(self.frames) >= self.max_frames:
+            self.dropped += len(self.frames)
+            self.frames.clear()
+            self.needs_keyframe = True
+            return False
+        self.frames.append(frame)
+        self._ready.set()
+        return True
+
+    def close(self) -> None:
+        """Stop the viewer's writer once the queued frames are sent."""
+        self.closed = True
+        self._ready.set()
+
+    async def write(self) -> None:
+        """Send queued frames until the viewer is closed."""
+        while True:
+            while not self.frames:
+                if self.closed:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+            frame = self.frames.popleft()
+            if isinstance(frame, bytes):
+                await self.websocket.send_bytes(frame)
+            else:
+                await self.websocket.send_text(frame)
+            self.sent += 1
+
+
+class MirrorSession:
+    """One device stream shared by all viewers of the device."""
+
+    def __init__(self, adb: ADBManager, device_id: str) -> None:
+        """Initialize the session.
+
+        Args:
+            adb: ADB manager to run screenrecord and screencap with
+            device_id: Device serial number
+        """
+        self.adb = adb
+        self.device_id = device_id
+        self.viewers: set[MirrorViewer] = set()
+        self.codec: str | None = None
+        self.sps: bytes | None = None
+        self.pps: bytes | None = None
+        self.frames = 0
+        self.restarts = 0
+        self._task: asyncio.Task | None = None
+
+    def add(self, viewer: MirrorViewer) -> None:
+        """Add a viewer and start streaming if it is the first one."""
+        self.viewers.add(viewer)
+        if self.codec is not None:
+            viewer.put(self._announcement())
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def remove(self, viewer: MirrorViewer) -> None:
+        """Remove a viewer and stop streaming if it was the last one."""
+        self.viewers.discard(viewer)
+        viewer.close()
+        if not self.viewers:
+            await self.stop()
+
+    async def stop(self) -> None:
+        """Stop streaming and close the viewers."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for viewer in self.viewers:
+            viewer.close()
+
+    def _announcement(self) -> str:
+        return get_codec().dumps(
+            {"type": "mirror", "device_id": self.device_id, "codec": self.codec}
+        )
+
+    def _set_codec(self, codec: str) -> None:
+        """Switch codecs, or start a new stream with the same codec."""
+        changed = codec != self.codec
+        self.codec = codec
+        message = self._announcement()
+        for viewer in self.viewers:
+            viewer.needs_keyframe = True
+            if changed:
+                viewer.put(message)
+
+    async def _run(self) -> None:
+        try:
+            while self.viewers:
+                started = time.monotonic()
+                if not await self._record():
+                    break
+                self.restarts += 1
+                # Do not spin if screenrecord keeps exiting right away
+                await asyncio.sleep(max(0.0, MIN_RECORD_SECONDS - (time.monotonic() - started)))
+            if self.viewers:
+                logger.info(f"Mirroring {self.device_id} with screencap instead of screenrecord")
+                await self._capture_loop()
+        except Exception as e:
+            logger.error(f"Mirroring {self.device_id} failed: {e}")
+            error = get_codec().dumps({"type": "mirror_error", "message": str(e)})
+            for viewer in self.viewers:
+                viewer.put(error)
+                viewer.close()
+
+    async def _record(self) -> bool:
+        """Stream one screenrecord run to the viewers.
+
+        Returns:
+            True if screenrecord streamed H.264 (and may be restarted), False
+            if it could not
+        """
+        command = f"screenrecord --output-format=h264 --bit-rate {config.MIRROR_BIT_RATE}"
+        if config.MIRROR_SIZE:
+            command += f" --size {config.MIRROR_SIZE}"
+        command += " -"
+
+        splitter = AnnexBSplitter()
+        streamed = False
+        head = b""
+        async for chunk in self.adb.exec_out(self.device_id, command, _READ_SIZE):
+            if not streamed:
+                # screenrecord prints errors (e.g. unknown option) instead
+                head += chunk
+                if len(head) < 4:
+                    continue
+                if not head.startswith((START_CODE, b"\x00\x00\x01")):
+                    logger.warning(
+                        f"screenrecord on {self.device_id} did not stream H.264: "
+                        f"{head[:200].decode('utf-8', errors='replace').strip()}"
+                    )
+                    return False
+                streamed = True
+                self._set_codec(CODEC_H264)
+                chunk, head = head, b""
+            for nal in splitter.feed(chunk):
+                self._broadcast_nal(nal)
+        for nal in splitter.flush():
+            self._broadcast_nal(nal)
+        return streamed
+
+    def _broadcast_nal(self, nal: bytes) -> None:
+        kind = nal_type(nal)
+        if kind == NAL_SPS:
+            self.sps = nal
+        elif kind == NAL_PPS:
+            self.pps = nal
+        self.frames += 1
+
+        for viewer in self.viewers:
+            if not viewer.needs_keyframe:
+                viewer.put(nal)
+            elif kind == NAL_IDR:
+                # Start (or resume) the viewer's stream at this IDR frame
+                viewer.needs_keyframe = False
+                for header in (self.sps, self.pps):
+                    if header is not None:
+                        viewer.put(header)
+                viewer.put(nal)
+
+    async def _capture_loop(self) -> None:
+        """Send a screencap to the viewers every MIRROR_FALLBACK_INTERVAL_MS."""
+        self._set_codec(CODEC_PNG)
+        interval = config.MIRROR_FALLBACK_INTERVAL_MS / 1000
+        while self.viewers:
+            started = time.monotonic()
+            image = b"".join(
+                [
+                    chunk
+                    async for chunk in self.adb.capture_screen(
+                        self.device_id, FORMAT_PNG, config.MIRROR_FALLBACK_SCALE
+                    )
+                ]
+            )
+            self.frames += 1
+            for viewer in self.viewers:
+                # Images stand alone, so a viewer only needs the latest one
+                pending = len(viewer.frames)
+                viewer.frames = deque(f for f in viewer.frames if isinstance(f, str))
+                viewer.dropped += pending - len(viewer.frames)
+                viewer.put(image)
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+class MirrorHub:
+    """Mirror sessions by device."""
+
+    def __init__(self, adb: ADBManager) -> None:
+        """Initialize the hub.
+
+        Args:
+            adb: ADB manager to run screenrecord and screencap with
+        """
+        self.adb = adb
+        self.sessions: dict[str, MirrorSession] = {}
+
+    async def watch(self, websocket: WebSocket, device_id: str) -> None:
+        """Mirror a device to a WebSocket until either side is done.
+
+        Args:
+            websocket: Accepted viewer WebSocket
+            device_id: Device serial number
+        """
+        session = self.sessions.get(device_id)
+        if session is None:
+            session = self.sessions[device_id] = MirrorSession(self.adb, device_id)
+
+        viewer = MirrorViewer(websocket, config.MIRROR_QUEUE_FRAMES)
+        session.add(viewer)
+        writer = asyncio.create_task(self._write(viewer))
+        try:
+            # Viewers have nothing to say; read until they disconnect
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            writer.cancel()
+            if session.viewers == {viewer} and self.sessions.get(device_id) is session:
+                # Drop the session before it stops, so that a viewer arriving
+                # meanwhile starts a new one instead of joining a dying one
+                del self.sessions[device_id]
+            await session.remove(viewer)
+
+    @staticmethod
+    async def _write(viewer: MirrorViewer) -> None:
+        """Run a viewer's writer and close the viewer when the session ends."""
+        try:
+            await viewer.write()
+            # The session ended (e.g. the device went away)
+            await viewer.websocket.close(code=1011, reason="Mirroring stopped")
+        except (WebSocketDisconnect, RuntimeError, ConnectionError):
+            pass
+
+    async def close(self) -> None:
+        """Stop all sessions."""
+        for session in list(self.sessions.values()):
+            await session.stop()
+        self.sessions.clear()
+
+
+# Global mirror hub instance
+_mirror_hub: MirrorHub | None = None
+
+
+def get_mirror_hub() -> MirrorHub:
+    """Get the global mirror hub instance.
+
+    Returns:
+        MirrorHub instance
+    """
+    global _mirror_hub
+    if _mirror_hub is None:
+        _mirror_hub = MirrorHub(get_adb_manager())
+    return _mirror_hub
@@ -0,0 +1,260 @@
+"""Per-client outbound queues for the WebSocket relay.
+
+Each connection owns a bounded OutboundQueue that is drained by its own writer
+task, so relaying a message only enqueues it and a slow receiver never delays
+delivery to the other clients.
+
+Frames that carry a key are latest-value state (e.g. the fret array of one
+sender): a new frame replaces a pending frame with the same key in place, so a
+receiver that falls behind gets the newest state instead of a backlog. Frames
+without a key are discrete events and are always delivered in order.
+
+Frames may carry a deadline; the writer drops frames that are past it
+instead of sending them late.
+
+Frames are queued in priority lanes (critical, normal, bulk) and higher lanes
+are drained first, so a flood of bulk events cannot delay game state. A
+waiting lane is still served after MAX_LANE_SKIPS frames from higher lanes,
+so lower lanes are never starved. Order is kept within a lane only. A full
+queue makes room in its lowest non-empty lane; a frame of lower priority than
+everything pending is dropped itself.
+"""
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Hashable
+
+from .metrics import RelayMetrics, RelayTrace
+
+# Queue-full policies
+DROP_OLDEST = "drop_oldest"  # Discard the oldest pending frame
+CONFLATE = "conflate"  # Discard the oldest pending state frame, else the oldest frame
+DISCONNECT = "disconnect"  # Give up on the receiver
+
+QUEUE_FULL_POLICIES = (DROP_OLDEST, CONFLATE, DISCONNECT)
+
+# Priority lanes, drained in this order
+PRIORITY_CRITICAL = 0  # Game state (e.g. chord changes) and clock sync
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2  # Noisy events and telemetry
+
+PRIORITY_LANES = (PRIORITY_CRITICAL, PRIORITY_NORMAL, PRIORITY_BULK)
+
+# Frames sent from higher lanes before a waiting lower lane gets a turn
+MAX_LANE_SKIPS = 8
+
+
+@dataclass
+class OutboundFrame:
+    """A frame waiting to be sent to one client."""
+
+    data: str | bytes  # Encoded frame: text or binary WebSocket message
+    # Frames with equal keys carry the same state and may replace each other
+    key: Hashable | None = None
+    msg_type: str | None = None
+    trace: RelayTrace | None = None  # Set on relayed frames for latency metrics
+    deadline: float | None = None  # time.monotonic() after which the frame is stale
+    priority: int = PRIORITY_NORMAL  # Lane (see PRIORITY_LANES)
+    batchable: bool = True  # Whether the frame may be sent inside a JSON array frame
+
+
+class OutboundQueue:
+    """Bounded, prioritized queue of frames for a single receiver."""
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        policy: str = DROP_OLDEST,
+        metrics: RelayMetrics | None = None,
+    ) -> None:
+        """Initialize the queue.
+
+        Args:
+            maxsize: Maximum number of pending frames (across all lanes)
+            policy: What to do when the queue is full (see QUEUE_FULL_POLICIES)
+            metrics: Relay metrics to count dropped and conflated frames in
+        """
+        if policy not in QUEUE_FULL_POLICIES:
+            raise ValueError(f"Unknown queue-full policy: {policy}")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.metrics = metrics
+        self.dropped = 0
+        self.conflated = 0
+        self._lanes: tuple[deque[OutboundFrame], ...] = tuple(deque() for _ in PRIORITY_LANES)
+        # Times each lane was passed over while it had frames waiting
+        self._skips = [0] * len(PRIORITY_LANES)
+        self._size = 0
+        self._by_key: dict[Hashable, OutboundFrame] = {}
+        self._ready = asyncio.Event()
+        # Set when a frame that cannot be batched is queued
+        self._unbatchable = asyncio.Event()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def put(self, frame: OutboundFrame) -> bool:
+        """Enqueue a frame without blocking.
+
+        Args:
+            frame: Frame to enqueue
+
+        Returns:
+            False if the frame was not queued: the queue is full and the
+            policy is DISCONNECT, or every pending frame has a higher priority
+        """
+        if frame.key is not None:
+            pending = self._by_key.get(frame.key)
+            if pending is not None:
+                self._release(pending)
+                pending.data = frame.data
+                pending.trace = frame.trace
+                pending.deadline = frame.deadline
+                pending.batchable = frame.batchable
+                self.conflated += 1
+                if self.metrics is not None:
+                    self.metrics.frames_conflated += 1
+                return True
+
+        if self._size >= self.maxsize:
+            if self.policy == DISCONNECT:
+                return False
+
+            self._count_drop()
+            lowest = max(index for index, lane in enumerate(self._lanes) if lane)
+            if frame.priority > lowest:
+                # Never push out higher-priority frames to make room
+                return False
+
+            lane = self._lanes[lowest]
+            victim = None
+            if self.policy == CONFLATE:
+                # Oldest state frame of the lane, if it has one
+                victim = next((f for f in lane if f.key is not None), None)
+            if victim is None:
+                victim = lane[0]
+            lane.remove(victim)
+            self._forget(victim)
+            self._release(victim)
+            self._size -= 1
+
+        self._lanes[frame.priority].append(frame)
+        self._size += 1
+        if frame.key is not None:
+            self._by_key[frame.key] = frame
+        self._ready.set()
+        if not frame.batchable:
+            self._unbatchable.set()
+        return True
+
+    def _count_drop(self) -> None:
+        self.dropped += 1
+        if self.metrics is not None:
+            self.metrics.frames_dropped += 1
+
+    def _next_lane(self) -> int | None:
+        """Pick the lane to serve next.
+
+        Returns:
+            Index of the highest non-empty lane, or of a lower lane that was
+            passed over MAX_LANE_SKIPS times; None if the queue is empty
+        """
+        chosen = None
+        for index, lane in enumerate(self._lanes):
+            if not lane:
+                continue
+            if chosen is None:
+                chosen = index
+            elif self._skips[index] >= MAX_LANE_SKIPS:
+                return index
+        return chosen
+
+    def _pop(self, index: int) -> OutboundFrame:
+        """Remove the oldest frame of a lane and update the skip counts."""
+        for other, lane in enumerate(self._lanes):
+            if other != index and lane:
+                self._skips[other] += 1
+        self._skips[index] = 0
+
+        frame = self._lanes[index].popleft()
+        self._size -= 1
+        self._forget(frame)
+        return frame
+
+    def get_nowait(self) -> OutboundFrame | None:
+        """Remove the next frame if one is pending.
+
+        Returns:
+            Next frame to send, or None if the queue is empty
+        """
+        index = self._next_lane()
+        return None if index is None else self._pop(index)
+
+    def peek(self) -> OutboundFrame | None:
+        """Get the next frame without removing it.
+
+        Returns:
+            Next frame to send, or None if the queue is empty
+        """
+        index = self._next_lane()
+        return None if index is None else self._lanes[index][0]
+
+    async def get(self) -> OutboundFrame:
+        """Wait for and remove the next frame.
+
+        Returns:
+            Next frame to send
+        """
+        while not self._size:
+            self._ready.clear()
+            await self._ready.wait()
+
+        return self._pop(self._next_lane())
+
+    async def wait_unbatchable(self, timeout: float) -> None:
+        """Wait until a frame that cannot be batched is queued, or a timeout.
+
+        Lets a batching wait end early for frames that must not be delayed.
+
+        Args:
+            timeout: Seconds to wait at most
+        """
+        self._unbatchable.clear()
+        handle = asyncio.get_running_loop().call_later(timeout, self._unbatchable.set)
+        try:
+            await self._unbatchable.wait()
+        finally:
+            handle.cancel()
+
+    def release_traces(self) -> None:
+        """Stop counting the pending frames toward relay latency.
+
+        For receivers that may not come back (e.g. parked sessions); their
+        frames are still sent if they do.
+        """
+        for lane in self._lanes:
+            for frame in lane:
+                self._release(frame)
+
+    def clear(self) -> None:
+        """Drop all pending frames."""
+        self.release_traces()
+        for lane in self._lanes:
+            lane.clear()
+        self._skips = [0] * len(PRIORITY_LANES)
+        self._size = 0
+        self._by_key.clear()
+
+    def _release(self, frame: OutboundFrame) -> None:
+        """Detach a frame that will not be sent from its relay trace."""
+        if frame.trace is not None:
+            if self.metrics is not None:
+                self.metrics.abandoned(frame.trace)
+            frame.trace = None
+
+    def _forget(self, frame: OutboundFrame) -> None:
+        """Remove a frame from the key index if it is the indexed one."""
+        if frame.key is not None and self._by_key.get(frame.key) is frame:
+            del self._by_key[frame.key]
@@ -0,0 +1,76 @@
+"""Batched, room-scoped presence updates.
+
+Joins and leaves in a room are collected for a short window and sent as one
+``presence`` frame per room instead of one frame per client per event, so a
+reconnect storm of N clients costs O(N x windows) sends rather than O(N^2).
+
+Full frame::
+
+    {
+        "type": "presence",
+        "room_id": "ABC123",
+        "joined": [{"client_id": "client_7", "device_type": "mobile"}],
+        "left": [{"client_id": "client_3", "device_type": "pc",
+                  "event": "evicted", "reason": "..."}],
+        "counts": {"mobile": 4, "pc": 1}
+    }
+
+Clients connected with ``presence=counts`` only get ``type``, ``room_id`` and
+``counts``.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any
+
+# Presence modes a client can pick with the ``presence`` query parameter
+PRESENCE_FULL = "full"
+PRESENCE_COUNTS = "counts"
+PRESENCE_MODES = (PRESENCE_FULL, PRESENCE_COUNTS)
+
+
+@dataclass
+class PresenceBatch:
+    """Joins and leaves in one room during the current window."""
+
+    joined: dict[str, dict[str, Any]] = field(default_factory=dict)
+    left: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # Joined and left within the window: not reported to clients, but every
+    # worker must still drop their per-sender state
+    gone: list[str] = field(default_factory=list)
+    flush_handle: asyncio.TimerHandle | None = None
+
+    def add(
+        self, client_id: str, device_type: str, event: str, reason: str | None = None
+    ) -> None:
+        """Record a connection event.
+
+        A client that joins and leaves within the same window cancels out.
+
+        Args:
+            client_id: ID of the client
+            device_type: "mobile" or "pc"
+            event: "connected", "disconnected" or "evicted"
+            reason: Optional reason (e.g. why a client was evicted)
+        """
+        if event == "connected":
+            self.joined[client_id] = {"client_id": client_id, "device_type": device_type}
+            return
+
+        if self.joined.pop(client_id, None) is not None:
+            self.gone.append(client_id)
+            return
+        entry: dict[str, Any] = {"client_id": client_id, "device_type": device_type}
+        if event != "disconnected":
+            entry["event"] = event
+        if reason is not None:
+            entry["reason"] = reason
+        self.left[client_id] = entry
+
+    def is_empty(self) -> bool:
+        """Check if the batch has nothing to report or clean up.
+
+        Returns:
+            True if there are no joins or leaves
+        """
+        return not self.joined and not self.left and not self.gone
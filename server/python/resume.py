@@ -0,0 +1,113 @@
+"""Signed resume tokens for reconnecting WebSocket clients.
+
+A token names the client ID and room of a session. It is signed with
+HMAC-SHA256, so a client can only resume its own session. It also carries
+the session's nonce, which changes on every resume, so tokens from earlier
+connections of the session are refused, and its issue time, so old tokens
+can be refused. Whether the session can still be resumed (it is parked
+within its grace window on this worker) is up to the ConnectionManager.
+
+Token format: ``<base64url payload>.<base64url signature>`` where the payload
+is the JSON list ``[client_id, room_id, issued_ms, nonce]``.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import secrets
+from dataclasses import dataclass
+
+from .clock import now_ms
+from .codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+_SIGNATURE_BYTES = 16
+
+
+@dataclass
+class ResumeClaims:
+    """Contents of a verified resume token."""
+
+    client_id: str
+    room_id: str | None
+    issued_ms: int
+    nonce: str
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class ResumeTokens:
+    """Issues and verifies resume tokens."""
+
+    def __init__(self, secret: str = "") -> None:
+        """Initialize with a signing secret.
+
+        Args:
+            secret: HMAC secret (default: random, so tokens only verify in
+                this process)
+        """
+        self._key = secret.encode("utf-8") if secret else secrets.token_bytes(32)
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+    def issue(self, client_id: str, room_id: str | None, nonce: str) -> str:
+        """Issue a token for a session.
+
+        Args:
+            client_id: Client ID of the session
+            room_id: Room the session is bound to
+            nonce: Current nonce of the session (see new_nonce())
+
+        Returns:
+            Resume token
+        """
+        payload = get_codec().dumps_bytes([client_id, room_id, now_ms(), nonce])
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}"
+
+    @staticmethod
+    def new_nonce() -> str:
+        """Generate a session nonce."""
+        return secrets.token_hex(8)
+
+    def verify(self, token: str, max_age_ms: int | None = None) -> ResumeClaims | None:
+        """Verify a token.
+
+        Args:
+            token: Token from the client
+            max_age_ms: Refuse tokens issued longer ago than this
+
+        Returns:
+            Claims, or None if the token is malformed, not signed by us or
+            too old
+        """
+        try:
+            encoded_payload, encoded_signature = token.split(".")
+            payload = _b64decode(encoded_payload)
+            signature = _b64decode(encoded_signature)
+        except (ValueError, binascii.Error):
+            return None
+
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            logger.debug("Rejecting resume token with a bad signature")
+            return None
+
+        try:
+            client_id, room_id, issued_ms, nonce = get_codec().loads(payload)
+        except (ValueError, TypeError):
+            return None
+        if max_age_ms is not None and now_ms() - issued_ms > max_age_ms:
+            logger.debug(f"Rejecting expired resume token of {client_id}")
+            return None
+        return ResumeClaims(
+            client_id=client_id, room_id=room_id, issued_ms=issued_ms, nonce=nonce
+        )
@@ -0,0 +1,322 @@
+"""In-memory screen captures with coalescing.
+
+Captures run ``screencap`` through ``exec-out`` and stream its output as it
+arrives, without a file on the device or on the server:
+
+- ``screencap -p`` writes a PNG.
+- ``screencap`` writes a raw frame: a little-endian header (width, height,
+  pixel format, and on newer devices a color space, as u32 each) followed by
+  width x height x 4 bytes of pixels.
+
+Concurrent requests for the same device and capture share one ``screencap``
+run: late joiners replay the chunks that already arrived and then follow the
+live stream.
+
+Downscaled captures are taken raw and subsampled (every n-th pixel of every
+n-th row); downscaled PNGs are encoded on the server, which also spares the
+device its PNG encoding.
+"""
+
+import asyncio
+import logging
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
+logger = logging.getLogger(__name__)
+
+# Capture formats
+FORMAT_PNG = "png"
+FORMAT_RAW = "raw"
+CAPTURE_FORMATS = (FORMAT_PNG, FORMAT_RAW)
+
+# Pixel formats of raw frames (android.graphics.PixelFormat)
+PIXEL_FORMAT_RGBA_8888 = 1
+PIXEL_FORMAT_RGBX_8888 = 2
+
+# Raw frame headers: width, height, format (+ color space on Android 8+)
+_RAW_HEADER = struct.Struct("<III")
+_RAW_HEADER_V2 = struct.Struct("<IIII")
+
+# zlib level for server-side PNGs (speed over size; the link is local)
+PNG_COMPRESSION_LEVEL = 1
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Source of capture output: (device_id, screencap command) -> chunks
+CaptureSource = Callable[[str, str], AsyncIterator[bytes]]
+
+
+@dataclass
+class RawFrame:
+    """A raw ``screencap`` frame."""
+
+    width: int
+    height: int
+    pixel_format: int
+    pixels: memoryview  # width x height x 4 bytes
+    color_space: int | None = None  # Set by devices that send the longer header
+
+    def header(self) -> bytes:
+        """Encode the frame header the way the device sent it."""
+        if self.color_space is None:
+            return _RAW_HEADER.pack(self.width, self.height, self.pixel_format)
+        return _RAW_HEADER_V2.pack(self.width, self.height, self.pixel_format, self.color_space)
+
+
+def parse_raw_frame(data: bytes) -> RawFrame:
+    """Parse the output of ``screencap`` (without ``-p``).
+
+    Args:
+        data: Raw frame as sent by the device
+
+    Returns:
+        Parsed frame (pixels reference data without copying)
+
+    Raises:
+        ValueError: If the data is not a 32-bit raw frame
+    """
+    for header in (_RAW_HEADER_V2, _RAW_HEADER):
+        if len(data) < header.size:
+            continue
+        fields = header.unpack_from(data)
+        width, height = fields[0], fields[1]
+        if len(data) - header.size == width * height * 4:
+            return RawFrame(
+                width=width,
+                height=height,
+                pixel_format=fields[2],
+                pixels=memoryview(data)[header.size :],
+                color_space=fields[3] if len(fields) > 3 else None,
+            )
+    raise ValueError(f"Not a 32-bit raw screen frame ({len(data)} bytes)")
+
+
+def downscale(frame: RawFrame, factor: int) -> RawFrame:
+    """Shrink a frame by keeping every factor-th pixel of every factor-th row.
+
+    Args:
+        frame: Frame to shrink
+        factor: Divisor of width and height (1 returns the frame as is)
+
+    Returns:
+        Downscaled frame
+    """
+    if factor <= 1:
+        return frame
+
+    pixels = frame.pixels.cast("I")  # One item per pixel
+    width = frame.width
+    rows = [
+        pixels[y * width : (y + 1) * width : factor].tobytes()
+        for y in range(0, frame.height, factor)
+    ]
+    return RawFrame(
+        width=(width + factor - 1) // factor,
+        height=len(rows),
+        pixel_format=frame.pixel_format,
+        pixels=memoryview(b"".join(rows)),
+        color_space=frame.color_space,
+    )
+
+
+def encode_png(frame: RawFrame, level: int = PNG_COMPRESSION_LEVEL) -> bytes:
+    """Encode a raw frame as PNG.
+
+    RGBX frames are encoded as RGB, since their fourth byte is not alpha.
+
+    Args:
+        frame: Frame to encode
+        level: zlib compression level
+
+    Returns:
+        PNG file contents
+
+    Raises:
+        ValueError: If the pixel format is not RGBA_8888 or RGBX_8888
+    """
+    if frame.pixel_format == PIXEL_FORMAT_RGBA_8888:
+        color_type, channels, pixels = 6, 4, frame.pixels
+    elif frame.pixel_format == PIXEL_FORMAT_RGBX_8888:
+        color_type, channels = 2, 3
+        pixels = bytearray(frame.width * frame.height * 3)
+        for channel in range(3):
+            pixels[channel::3] = frame.pixels[channel::4].tobytes()
+    else:
+        raise ValueError(f"Unsupported pixel format: {frame.pixel_format}")
+
+    stride = frame.width * channels
+    compressor = zlib.compressobj(level)
+    idat = []
+    for y in range(frame.height):
+        # Filter type 0 (none) per row
+        idat.append(compressor.compress(b"\x00"))
+        idat.append(compressor.compress(pixels[y * stride : (y + 1) * stride]))
+    idat.append(compressor.flush())
+
+    ihdr = struct.pack(">IIBBBBB", frame.width, frame.height, 8, color_type, 0, 0, 0)
+    return b"".join(
+        (
+            _PNG_SIGNATURE,
+            _png_chunk(b"IHDR", ihdr),
+            _png_chunk(b"IDAT", b"".join(idat)),
+            _png_chunk(b"IEND", b""),
+        )
+    )
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+class SharedCapture:
+    """Output of one ``screencap`` run, readable by several requesters."""
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._changed = asyncio.Condition()
+
+    async def feed(self, chunk: bytes) -> None:
+        """Add a chunk of output and wake the readers."""
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, error: BaseException | None = None) -> None:
+        """Mark the capture as complete (or failed) and wake the readers."""
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Iterate over the output from the start, following the live capture.
+
+        Raises:
+            Exception: The error the capture failed with
+        """
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                chunks = self.chunks[index:]
+                done = self.done
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if done and index == len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    async def read(self) -> bytes:
+        """Wait for the whole output.
+
+        Raises:
+            Exception: The error the capture failed with
+        """
+        return b"".join([chunk async for chunk in self.stream()])
+
+
+class ScreenCapturer:
+    """Coalesces concurrent screen captures per device."""
+
+    def __init__(self, source: CaptureSource, timeout: float = 30.0) -> None:
+        """Initialize the capturer.
+
+        Args:
+            source: Runs a screencap command on a device and yields its output
+            timeout: Seconds a capture may take
+        """
+        self.source = source
+        self.timeout = timeout
+        self.captures = 0  # screencap runs started
+        self.coalesced = 0  # Requests served by a run another request started
+        self._active: dict[tuple[str, str], SharedCapture] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def _shared(self, device_id: str, command: str) -> SharedCapture:
+        """Join the running capture for a device, or start one."""
+        key = (device_id, command)
+        capture = self._active.get(key)
+        if capture is not None:
+            self.coalesced += 1
+            return capture
+
+        capture = SharedCapture()
+        self._active[key] = capture
+        self.captures += 1
+        # A task of its own, so the capture outlives the request that started it
+        task = asyncio.create_task(self._run(key, capture))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return capture
+
+    async def _run(self, key: tuple[str, str], capture: SharedCapture) -> None:
+        device_id, command = key
+        error: BaseException | None = None
+        try:
+            await asyncio.wait_for(self._pump(device_id, command, capture), self.timeout)
+        except asyncio.TimeoutError:
+            error = TimeoutError(f"Screen capture timed out: {device_id}")
+        except asyncio.CancelledError:
+            error = ConnectionAbortedError(f"Screen capture cancelled: {device_id}")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            # Requests from now on start a new capture
+            if self._active.get(key) is capture:
+                del self._active[key]
+            await capture.finish(error)
+
+    async def _pump(self, device_id: str, command: str, capture: SharedCapture) -> None:
+        async for chunk in self.source(device_id, command):
+            await capture.feed(chunk)
+
+    async def capture(
+        self, device_id: str, fmt: str = FORMAT_PNG, scale: int = 1
+    ) -> AsyncIterator[bytes]:
+        """Capture a device screen.
+
+        Args:
+            device_id: Device serial number
+            fmt: FORMAT_PNG or FORMAT_RAW (header + pixels as the device sends them)
+            scale: Divisor of width and height (1 for full size)
+
+        Yields:
+            Image data; full-size captures are streamed as they arrive
+
+        Raises:
+            ValueError: If the format is unknown, or a downscaled capture is
+                not a 32-bit raw frame
+        """
+        if fmt not in CAPTURE_FORMATS:
+            raise ValueError(f"Unknown capture format: {fmt}")
+
+        if scale <= 1:
+            command = "screencap -p" if fmt == FORMAT_PNG else "screencap"
+            async for chunk in self._shared(device_id, command).stream():
+                yield chunk
+            return
+
+        frame = parse_raw_frame(await self._shared(device_id, "screencap").read())
+        frame = await asyncio.to_thread(downscale, frame, scale)
+        if fmt == FORMAT_PNG:
+            yield await asyncio.to_thread(encode_png, frame)
+        else:
+            yield frame.header() + frame.pixels.tobytes()
+
+    async def close(self) -> None:
+        """Cancel running captures."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
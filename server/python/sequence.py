@@ -0,0 +1,52 @@
+"""Per-sender sequence numbers for relayed frames.
+
+The relay numbers every frame it relays from a client: 1, 2, 3, ... per
+sender (a resumed session continues its sequence, a new session starts at 1).
+The number is written into the frame as ``seq`` (the u16 ``seq`` field in
+binary frames, where it wraps), so receivers can drop a state frame that is
+not newer than the last one they applied from the same sender.
+
+Each worker checks the numbers again before fan-out, so frames that arrive
+through the broker out of order or twice are suppressed, and missing numbers
+are counted as gaps.
+"""
+
+
+class SequenceTracker:
+    """Last sequence number seen per sender."""
+
+    def __init__(self) -> None:
+        self._last: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def observe(self, sender_id: str, seq: int) -> int | None:
+        """Check a frame's sequence number against the sender's last one.
+
+        Args:
+            sender_id: Client ID of the sender
+            seq: Sequence number of the frame
+
+        Returns:
+            Number of frames missing before this one (0 if it is the next one
+            or the first seen from the sender), or None if the frame is not
+            newer than the last one and should be dropped
+        """
+        last = self._last.get(sender_id)
+        if last is not None and seq <= last:
+            return None
+        self._last[sender_id] = seq
+        return 0 if last is None else seq - last - 1
+
+    def forget(self, sender_id: str) -> None:
+        """Stop tracking a sender.
+
+        Args:
+            sender_id: Client ID of the sender
+        """
+        self._last.pop(sender_id, None)
+
+    def clear(self) -> None:
+        """Stop tracking all senders."""
+        self._last.clear()
@@ -0,0 +1,325 @@
+"""Persistent ADB shell sessions.
+
+Every ``adb shell`` call opens a new service socket and starts a new shell on
+the device. ShellSessions keeps a few long-lived shells per device instead
+and runs commands through them, which turns repeated commands (``getprop``,
+``dumpsys``, ``ip route``) from tens of milliseconds into a few.
+
+Sessions use the shell v2 protocol, so stdout and stderr arrive as separate
+packets. Each command is written to the shell's stdin as::
+
+    ( eval '<command>' ) </dev/null; echo "<marker>$?"; echo "<marker>" >&2
+
+with a marker that is unique per command. The command ends when the marker
+has appeared on both streams, and the exit status follows the stdout marker.
+Commands run in a subshell, so ``exit``, ``cd`` or a syntax error cannot
+break the session, and stdin is /dev/null, so they cannot swallow the next
+command.
+
+A device gets up to ``max_sessions`` shells, each running one command at a
+time; further commands wait for a free shell. Idle shells are closed after
+``idle_timeout`` seconds. Shells that die, or whose command is cancelled
+(e.g. on timeout), are replaced by a new one on the next command. A command
+that finds its reused shell dead before any output is retried once on a new
+shell. Otherwise a shell lost mid-command raises ShellSessionLost, an
+ADBFailure, since the command may have run: it must not be run again through
+another path.
+
+Devices without shell v2 run each command with ADBClient.shell.
+"""
+
+import asyncio
+import logging
+import secrets
+import shlex
+import time
+
+from .adb_client import (
+    SHELL_CLOSE_STDIN,
+    SHELL_EXIT,
+    SHELL_PACKET,
+    SHELL_STDERR,
+    SHELL_STDIN,
+    SHELL_STDOUT,
+    ADBClient,
+    ADBFailure,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ShellSessionLost(ADBFailure):
+    """Raised when a shell goes away while running a command.
+
+    The command may have run on the device.
+    """
+
+    pass
+
+
+class ShellSession:
+    """One long-lived shell on a device."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Initialize the session.
+
+        Args:
+            reader: Stream of the ``shell,v2,raw:`` service
+            writer: Stream of the ``shell,v2,raw:`` service
+        """
+        self.reader = reader
+        self.writer = writer
+        self.commands = 0
+        self.output_seen = False  # Whether the current command produced output
+        self.last_used = time.monotonic()
+        self.idle_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def alive(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    async def run(self, command: str) -> tuple[bytes, bytes, int]:
+        """Run a command in the shell.
+
+        The session is closed if the command does not complete (e.g. it is
+        cancelled by a timeout), since its output would leak into the next one.
+
+        Args:
+            command: Shell command line
+
+        Returns:
+            Tuple of (stdout, stderr, exit status)
+
+        Raises:
+            ShellSessionLost: If the shell went away
+        """
+        marker = f"__adb_{secrets.token_hex(8)}__".encode()
+        script = (
+            f"( eval {shlex.quote(command)} ) </dev/null; "
+            f'echo "{marker.decode()}$?"; echo "{marker.decode()}" >&2\n'
+        ).encode("utf-8")
+
+        completed = False
+        self.output_seen = False
+        try:
+            self.writer.write(_packet(SHELL_STDIN, script))
+            await self.writer.drain()
+            result = await self._read_result(marker)
+            completed = True
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            raise ShellSessionLost(f"Shell session lost: {e}") from e
+        finally:
+            if not completed:
+                self.close()
+
+        self.commands += 1
+        self.last_used = time.monotonic()
+        return result
+
+    async def _read_result(self, marker: bytes) -> tuple[bytes, bytes, int]:
+        stdout = bytearray()
+        stderr = bytearray()
+        code: int | None = None
+        stdout_end = stderr_end = -1
+
+        # Read up to the end of both marker lines, so that nothing of this
+        # command is left for the next one
+        while code is None or stderr_end < 0 or len(stderr) <= stderr_end + len(marker):
+            packet_id, length = SHELL_PACKET.unpack(
+                await self.reader.readexactly(SHELL_PACKET.size)
+            )
+            payload = await self.reader.readexactly(length)
+            if packet_id in (SHELL_STDOUT, SHELL_STDERR):
+                self.output_seen = True
+
+            # Only the new data (and a marker split across packets) is searched
+            if packet_id == SHELL_STDOUT:
+                stdout += payload
+                if stdout_end < 0:
+                    stdout_end = stdout.find(
+                        marker, max(0, len(stdout) - len(payload) - len(marker))
+                    )
+                if stdout_end >= 0:
+                    # Exit status, up to the end of the marker line
+                    status = stdout[stdout_end + len(marker) :]
+                    if b"\n" in status:
+                        code = int(status.split(b"\n", 1)[0])
+            elif packet_id == SHELL_STDERR:
+                stderr += payload
+                if stderr_end < 0:
+                    stderr_end = stderr.find(
+                        marker, max(0, len(stderr) - len(payload) - len(marker))
+                    )
+            elif packet_id == SHELL_EXIT:
+                raise ConnectionError("shell exited")
+
+        return bytes(stdout[:stdout_end]), bytes(stderr[:stderr_end]), code
+
+    def close(self) -> None:
+        """Close the shell (the device ends it when the socket closes)."""
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+        if not self.writer.is_closing():
+            try:
+                self.writer.write(_packet(SHELL_CLOSE_STDIN, b""))
+            except ConnectionError:
+                pass
+            self.writer.close()
+
+
+class DeviceShells:
+    """Pool of shell sessions for one device."""
+
+    def __init__(
+        self, client: ADBClient, serial: str, max_sessions: int, idle_timeout: float
+    ) -> None:
+        """Initialize the pool.
+
+        Args:
+            client: Client for the ADB server
+            serial: Device serial number
+            max_sessions: Shells (and so commands) running at once
+            idle_timeout: Seconds an unused shell is kept open
+        """
+        self.client = client
+        self.serial = serial
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.spawned = 0
+        self._idle: list[ShellSession] = []
+        self._busy = 0
+        self._available = asyncio.Condition()
+
+    @property
+    def sessions(self) -> int:
+        return len(self._idle) + self._busy
+
+    async def run(self, command: str) -> tuple[bytes, bytes, int]:
+        """Run a command on a free shell, starting one if needed.
+
+        Args:
+            command: Shell command line
+
+        Returns:
+            Tuple of (stdout, stderr, exit status)
+        """
+        session = await self._acquire()
+        try:
+            return await session.run(command)
+        except ShellSessionLost:
+            if not session.commands or session.output_seen:
+                raise
+            # The shell died while idle, and so did the other idle ones
+            # (e.g. the device rebooted); the command never ran
+            logger.debug(f"Shell sessions on {self.serial} were gone, starting a new one")
+            self.close()
+        finally:
+            await self._release(session)
+
+        session = await self._acquire()
+        try:
+            return await session.run(command)
+        finally:
+            await self._release(session)
+
+    async def _acquire(self) -> ShellSession:
+        async with self._available:
+            while True:
+                while self._idle:
+                    session = self._idle.pop()
+                    if session.idle_handle is not None:
+                        session.idle_handle.cancel()
+                        session.idle_handle = None
+                    if session.alive:
+                        self._busy += 1
+                        return session
+                    session.close()
+                if self.sessions < self.max_sessions:
+                    # Reserve the slot while the shell starts
+                    self._busy += 1
+                    break
+                await self._available.wait()
+
+        try:
+            reader, writer = await self.client.open_service(self.serial, "shell,v2,raw:")
+        except BaseException:
+            async with self._available:
+                self._busy -= 1
+                self._available.notify()
+            raise
+        self.spawned += 1
+        logger.debug(f"Started shell session {self.spawned} on {self.serial}")
+        return ShellSession(reader, writer)
+
+    async def _release(self, session: ShellSession) -> None:
+        async with self._available:
+            self._busy -= 1
+            if session.alive:
+                self._idle.append(session)
+                session.idle_handle = asyncio.get_running_loop().call_later(
+                    self.idle_timeout, self._expire, session
+                )
+            self._available.notify()
+
+    def _expire(self, session: ShellSession) -> None:
+        """Close a shell that stayed idle for idle_timeout."""
+        if session in self._idle:
+            self._idle.remove(session)
+            session.idle_handle = None
+            session.close()
+
+    def close(self) -> None:
+        """Close the idle shells (busy ones close when their command ends)."""
+        for session in self._idle:
+            session.close()
+        self._idle.clear()
+
+
+class ShellSessions:
+    """Persistent shell sessions for all devices."""
+
+    def __init__(
+        self, client: ADBClient, max_sessions: int = 2, idle_timeout: float = 60.0
+    ) -> None:
+        """Initialize the sessions.
+
+        Args:
+            client: Client for the ADB server
+            max_sessions: Shells per device
+            idle_timeout: Seconds an unused shell is kept open
+        """
+        self.client = client
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.devices: dict[str, DeviceShells] = {}
+
+    async def run(self, serial: str, command: str) -> tuple[bytes, bytes, int]:
+        """Run a shell command on a device.
+
+        Args:
+            serial: Device serial number
+            command: Shell command line
+
+        Returns:
+            Tuple of (stdout, stderr, exit status)
+        """
+        if "shell_v2" not in await self.client.features(serial):
+            return await self.client.shell(serial, command)
+
+        shells = self.devices.get(serial)
+        if shells is None:
+            shells = self.devices[serial] = DeviceShells(
+                self.client, serial, self.max_sessions, self.idle_timeout
+            )
+        return await shells.run(command)
+
+    def close(self) -> None:
+        """Close all idle shells."""
+        for shells in self.devices.values():
+            shells.close()
+        self.devices.clear()
+
+
+def _packet(packet_id: int, payload: bytes) -> bytes:
+    return SHELL_PACKET.pack(packet_id, len(payload)) + payload
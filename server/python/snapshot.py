@@ -0,0 +1,154 @@
+"""Last known controller state per room, sent to clients when they join.
+
+The relay keeps the most recent raw frame of each state message type per
+room, exactly as it was relayed. Frames are only parsed when a client joins
+and the snapshot is needed, and the encoded snapshot is cached until the
+state changes, so a reconnect storm costs one encode per room.
+
+Snapshot frame::
+
+    {
+        "type": "snapshot",
+        "room_id": "ABC123",
+        "chord": "Am",                  # last chord_change
+        "fingering": [...],
+        "frets": [...],
+        "fret_states": [...],           # last FRET_UPDATE payload
+        "last_strum_at": 1769947200123, # server time of the last STRUM_EVENT
+        "updated_at": 1769947200456,    # server time of the newest frame
+        "frames": [...]                 # the stored frames, oldest first
+    }
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Any
+
+from .clock import now_ms
+from .codec import get_codec
+from .wire import WIRE_BINARY, decode_frame
+
+logger = logging.getLogger(__name__)
+
+
+class RoomSnapshot:
+    """Latest state frames of one room."""
+
+    def __init__(self) -> None:
+        # msg_type -> (raw frame, wire format, server receive time in ms)
+        self.frames: dict[str, tuple[str | bytes, str, int]] = {}
+        self._encoded: str | None = None
+
+    def update(self, msg_type: str, frame: str | bytes, wire_format: str) -> None:
+        """Replace the stored frame of a message type.
+
+        Args:
+            msg_type: Message type
+            frame: Raw frame as relayed
+            wire_format: Format of the frame
+        """
+        # Re-insert so the dict stays ordered oldest to newest
+        self.frames.pop(msg_type, None)
+        self.frames[msg_type] = (frame, wire_format, now_ms())
+        self._encoded = None
+
+    def encode(self, room_id: str | None) -> str:
+        """Get the snapshot frame, building it if the state changed.
+
+        Args:
+            room_id: Room the snapshot belongs to
+
+        Returns:
+            JSON snapshot frame
+        """
+        if self._encoded is None:
+            self._encoded = get_codec().dumps(self._build(room_id))
+        return self._encoded
+
+    def _build(self, room_id: str | None) -> dict[str, Any]:
+        snapshot: dict[str, Any] = {
+            "type": "snapshot",
+            "room_id": room_id,
+            "chord": None,
+            "fingering": None,
+            "frets": None,
+            "fret_states": None,
+            "last_strum_at": None,
+            "updated_at": None,
+            "frames": [],
+        }
+        codec = get_codec()
+
+        for msg_type, (frame, wire_format, received_ms) in self.frames.items():
+            try:
+                if isinstance(frame, bytes) and wire_format == WIRE_BINARY:
+                    data = decode_frame(frame)
+                else:
+                    data = codec.loads(frame)
+            except ValueError as e:
+                logger.debug(f"Skipping undecodable {msg_type} frame in snapshot: {e}")
+                continue
+            if not isinstance(data, dict):
+                continue
+
+            if msg_type == "chord_change":
+                snapshot["chord"] = data.get("chord")
+                snapshot["fingering"] = data.get("fingering")
+                snapshot["frets"] = data.get("frets")
+            elif msg_type == "FRET_UPDATE":
+                snapshot["fret_states"] = data.get("payload")
+            elif msg_type == "STRUM_EVENT":
+                snapshot["last_strum_at"] = data.get("srv_ts", received_ms)
+            snapshot["updated_at"] = received_ms
+            snapshot["frames"].append(data)
+
+        return snapshot
+
+
+class SnapshotStore:
+    """Room snapshots, least recently updated rooms evicted first."""
+
+    def __init__(self, state_types: frozenset[str], max_rooms: int = 10000) -> None:
+        """Initialize the store.
+
+        Args:
+            state_types: Message types that make up the controller state
+            max_rooms: Maximum number of rooms to keep state for
+        """
+        self.state_types = state_types
+        self.max_rooms = max_rooms
+        self._rooms: OrderedDict[str | None, RoomSnapshot] = OrderedDict()
+
+    def record(
+        self, room_id: str | None, msg_type: str | None, frame: str | bytes, wire_format: str
+    ) -> None:
+        """Store a relayed frame if its type is part of the controller state.
+
+        Args:
+            room_id: Room the frame was relayed in
+            msg_type: Message type from the envelope
+            frame: Raw frame as relayed
+            wire_format: Format of the frame
+        """
+        if msg_type not in self.state_types:
+            return
+
+        snapshot = self._rooms.get(room_id)
+        if snapshot is None:
+            snapshot = self._rooms[room_id] = RoomSnapshot()
+            if len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room_id)
+        snapshot.update(msg_type, frame, wire_format)
+
+    def get(self, room_id: str | None) -> RoomSnapshot | None:
+        """Get the snapshot of a room.
+
+        Args:
+            room_id: Room ID
+
+        Returns:
+            Snapshot, or None if no state was relayed in the room
+        """
+        return self._rooms.get(room_id)
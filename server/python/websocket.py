@@ -2,18 +2,174 @@
 
 This module handles:
 - PC and mobile connection management
-- Message relay between devices
+- Room-scoped message relay between devices
+- Zero-parse passthrough forwarding of relay frames
+- Binary/JSON wire format negotiation and translation
+- Per-client send queues with backpressure and priority lanes
+- Slow-consumer detection and eviction
+- Per-type message TTLs: stale relay frames are dropped, not sent late
+- Optional send-side batching of text frames into JSON arrays
+- Per-sender relay sequence numbers; out-of-order frames are dropped (see
+  sequence.py)
+- Cross-worker delivery through a message broker
+- Relay metrics (Prometheus)
+- Clock synchronization and server receive timestamps (see clock.py)
+- Room state snapshot on join (see snapshot.py)
+- Batched, room-scoped presence updates (see presence.py)
+- Resumable sessions: a reconnect with a resume token within the grace
+  window keeps the client ID, room and queued frames (see resume.py)
 - User-Agent based device detection
 """
 
+import asyncio
 import logging
+import re
+import time
 from dataclasses import dataclass, field
-from typing import Any
+from typing import Any, Coroutine
 
 from fastapi import WebSocket
 
+from .broker import EVENT, RELAY, Broker, BrokerMessage, LocalBroker, create_broker
+from .codec import get_codec
+from .clock import ClockEstimator, now_ms
+from .config import config
+from .metrics import RelayMetrics, RelayTrace
+from .outbound import (
+    DISCONNECT,
+    PRIORITY_BULK,
+    PRIORITY_CRITICAL,
+    PRIORITY_NORMAL,
+    OutboundFrame,
+    OutboundQueue,
+)
+from .presence import PRESENCE_COUNTS, PRESENCE_FULL, PresenceBatch
+from .resume import ResumeTokens
+from .sequence import SequenceTracker
+from .snapshot import SnapshotStore
+from .wire import (
+    WIRE_BINARY,
+    WIRE_JSON,
+    WireVariants,
+    decode_frame,
+    message_type,
+    negotiate_subprotocol,
+    stamp_frame,
+    wire_format_for,
+)
+
 logger = logging.getLogger(__name__)
 
+# Message types the server acts on itself; everything else is relayed opaquely
+CONTROL_MESSAGE_TYPES = frozenset({"ping", "clock_sync_reply"})
+
+# Server messages that always take the critical lane: session setup must
+# precede relayed frames, and queueing would skew clock sync round trips
+CRITICAL_CONTROL_TYPES = frozenset({"connected", "snapshot", "pong", "clock_sync"})
+
+# Close code for clients evicted because they cannot keep up ("Try Again Later")
+CLOSE_CODE_SLOW_CONSUMER = 1013
+
+# Smoothing factor for the per-connection send latency average
+SEND_LATENCY_ALPHA = 0.2
+
+# Most frames packed into one array frame for a batching client
+BATCH_MAX_FRAMES = 64
+
+_TYPE_PATTERN = re.compile(r'"type"\s*:\s*"([^"\\]*)"')
+_ROOM_PATTERN = re.compile(r'"room_id"\s*:\s*"([^"\\]*)"')
+_TYPE_PATTERN_BYTES = re.compile(rb'"type"\s*:\s*"([^"\\]*)"')
+_ROOM_PATTERN_BYTES = re.compile(rb'"room_id"\s*:\s*"([^"\\]*)"')
+
+
+def read_envelope(message: str | bytes) -> tuple[str | None, str | None]:
+    """Read the routing envelope of a raw frame without parsing it.
+
+    Only the first ``"type"`` and ``"room_id"`` string fields are scanned for,
+    so a nested field can shadow a top-level one. Callers that act on the type
+    must parse the frame to confirm it.
+
+    Args:
+        message: Raw text or binary frame
+
+    Returns:
+        Tuple of (message type, room ID), each None if absent
+    """
+    if isinstance(message, str):
+        type_match = _TYPE_PATTERN.search(message)
+        room_match = _ROOM_PATTERN.search(message) if '"room_id"' in message else None
+        return (
+            type_match.group(1) if type_match else None,
+            room_match.group(1) if room_match else None,
+        )
+
+    type_match = _TYPE_PATTERN_BYTES.search(message)
+    room_match = _ROOM_PATTERN_BYTES.search(message) if b'"room_id"' in message else None
+    return (
+        type_match.group(1).decode("utf-8", errors="replace") if type_match else None,
+        room_match.group(1).decode("utf-8", errors="replace") if room_match else None,
+    )
+
+
+def is_json(message: str) -> bool:
+    """Check that a relayed text frame is valid JSON.
+
+    Passthrough frames are never parsed, so this is only done for frames
+    that go into a JSON array frame, which one invalid frame would break.
+
+    Args:
+        message: Raw text frame
+
+    Returns:
+        True if the frame parses
+    """
+    try:
+        get_codec().loads(message)
+    except ValueError:
+        return False
+    return True
+
+
+def stamp_fields(message: str | bytes, fields: dict[str, int]) -> str | bytes:
+    """Add integer fields to a JSON object frame without parsing it.
+
+    The fields are appended last, so they override values set by the client.
+    Frames that are not JSON objects are returned unchanged.
+
+    Args:
+        message: Raw JSON text or bytes
+        fields: Field names and values (names are not escaped)
+
+    Returns:
+        Stamped frame
+    """
+    tail = ",".join(f'"{name}":{value}' for name, value in fields.items()) + "}"
+
+    if isinstance(message, str):
+        body = message.rstrip()
+        if not body.endswith("}") or not body.lstrip().startswith("{"):
+            return message
+        head = body[:-1].rstrip()
+        return head + ("" if head.endswith("{") else ",") + tail
+
+    body = message.rstrip()
+    if not body.endswith(b"}") or not body.lstrip().startswith(b"{"):
+        return message
+    head = body[:-1].rstrip()
+    return head + (b"" if head.endswith(b"{") else b",") + tail.encode("ascii")
+
+
+def encode_message(data: dict[str, Any]) -> str:
+    """Serialize a server-generated message once for all of its receivers.
+
+    Args:
+        data: Message data
+
+    Returns:
+        JSON text
+    """
+    return get_codec().dumps(data)
+
 
 def detect_device_type(user_agent: str | None) -> str:
     """Detect device type from User-Agent header.
@@ -54,6 +210,43 @@ class ClientConnection:
     client_id: str
     device_type: str  # "mobile" or "pc"
     user_agent: str | None = None
+    room_id: str | None = None  # None = default room for clients without a room
+    wire_format: str = WIRE_JSON  # "json" or "binary" (see wire.py)
+    outbound: OutboundQueue = field(default_factory=OutboundQueue, repr=False)
+    writer_task: asyncio.Task | None = field(default=None, repr=False)
+    closing: bool = False  # Set once the connection is being torn down
+    evicted: bool = False  # Evicted by the server; never resumable
+    presence: str = PRESENCE_FULL  # PRESENCE_FULL or PRESENCE_COUNTS
+    batch: bool = False  # Client accepts JSON array frames of several messages
+    batch_delay: float = 0.0  # Current batching window (seconds), adapts to load
+    # Send tracking (monotonic seconds)
+    send_started_at: float | None = None  # Start of the in-flight send
+    send_latency_avg: float = 0.0  # Moving average of send duration
+    backlog_since: float | None = None  # When the queue passed the depth threshold
+    clock: ClockEstimator = field(default_factory=ClockEstimator, repr=False)
+    relay_seq: int = 0  # Sequence number of the last frame relayed from this client
+    # Grace-window expiry while the session is parked awaiting a resume
+    resume_handle: asyncio.TimerHandle | None = field(default=None, repr=False)
+    # Nonce in this connection's resume tokens (changes on every resume)
+    resume_nonce: str = field(default_factory=ResumeTokens.new_nonce, repr=False)
+    resume_issued_ms: int = 0  # When the client got its current resume token
+
+
+@dataclass
+class RoomConnections:
+    """Connections bound to a single room."""
+
+    room_id: str | None
+    mobile_connections: dict[str, ClientConnection] = field(default_factory=dict)
+    pc_connections: dict[str, ClientConnection] = field(default_factory=dict)
+
+    def is_empty(self) -> bool:
+        """Check if the room has no connections left.
+
+        Returns:
+            True if no mobile or PC is connected
+        """
+        return not self.mobile_connections and not self.pc_connections
 
 
 @dataclass
@@ -62,15 +255,140 @@ class ConnectionManagerState:
 
     mobile_connections: dict[str, ClientConnection] = field(default_factory=dict)
     pc_connections: dict[str, ClientConnection] = field(default_factory=dict)
+    rooms: dict[str | None, RoomConnections] = field(default_factory=dict)
+    # Identity-keyed index (id(websocket) -> connection) for O(1) sender lookup
+    connections_by_socket: dict[int, ClientConnection] = field(default_factory=dict)
     client_id_counter: int = 0
 
 
 class ConnectionManager:
     """Manages WebSocket connections between PC and mobile devices."""
 
-    def __init__(self) -> None:
-        """Initialize the connection manager."""
+    def __init__(
+        self,
+        send_queue_size: int = config.WS_SEND_QUEUE_SIZE,
+        queue_full_policy: str = config.WS_QUEUE_FULL_POLICY,
+        conflate_types: frozenset[str] = config.WS_CONFLATE_TYPES,
+        message_ttl: dict[str, float] | None = None,
+        critical_types: frozenset[str] = config.WS_CRITICAL_TYPES,
+        bulk_types: frozenset[str] = config.WS_BULK_TYPES,
+        evict_slow_consumers: bool = config.WS_EVICT_SLOW_CONSUMERS,
+        slow_send_timeout: float = config.WS_SLOW_SEND_TIMEOUT_MS / 1000,
+        slow_send_average: float = config.WS_SLOW_SEND_AVG_MS / 1000,
+        slow_queue_depth: int = config.WS_SLOW_QUEUE_DEPTH,
+        clock_sync_interval: float = config.WS_CLOCK_SYNC_INTERVAL,
+        stamp_server_time: bool = config.WS_STAMP_SERVER_TIME,
+        snapshot_types: frozenset[str] = config.WS_SNAPSHOT_TYPES,
+        resume_grace: float = config.WS_RESUME_GRACE_SECONDS,
+        presence_window: float = config.WS_PRESENCE_WINDOW_MS / 1000,
+        batch_window: float = config.WS_BATCH_WINDOW_MS / 1000,
+        broker: Broker | None = None,
+    ) -> None:
+        """Initialize the connection manager.
+
+        Args:
+            send_queue_size: Maximum pending frames per client
+            queue_full_policy: Policy applied when a client's queue is full
+            conflate_types: Latest-value message types that replace pending
+                frames from the same sender instead of queueing behind them
+            message_ttl: Seconds a relayed frame of each message type may wait
+                in a queue before it is dropped (default: WS_MESSAGE_TTL_MS)
+            critical_types: Message types sent ahead of everything else
+            bulk_types: Message types sent after everything else
+            evict_slow_consumers: Whether to evict clients that cannot keep up
+            slow_send_timeout: Seconds a single send (or a queue backlog) may
+                last before the client is evicted
+            slow_send_average: Average send duration (seconds) that gets a
+                client evicted
+            slow_queue_depth: Queue depth that counts as a backlog
+            clock_sync_interval: Seconds between server-initiated clock syncs
+                (0 disables them)
+            stamp_server_time: Whether to add the server receive time to
+                relayed frames
+            snapshot_types: Mobile message types kept as room state and
+                sent to joining clients (empty disables snapshots)
+            resume_grace: Seconds a dropped session stays resumable
+                (0 disables resume tokens)
+            presence_window: Seconds joins and leaves are collected before
+                a room's presence frame is sent (0 sends one per event)
+            batch_window: Longest wait (seconds) for more frames to pack into
+                one array frame for batching clients (0 disables batching)
+            broker: Broker shared with other workers (default: in-process)
+        """
         self.state = ConnectionManagerState()
+        self.send_queue_size = send_queue_size
+        self.queue_full_policy = queue_full_policy
+        self.conflate_types = conflate_types
+        if message_ttl is None:
+            message_ttl = {t: ms / 1000 for t, ms in config.WS_MESSAGE_TTL_MS.items() if ms > 0}
+        self.message_ttl = message_ttl
+        # Priority lane by message type (PRIORITY_NORMAL if not listed)
+        self.priorities: dict[str | None, int] = {t: PRIORITY_BULK for t in bulk_types}
+        self.priorities.update(
+            (t, PRIORITY_CRITICAL) for t in critical_types | CRITICAL_CONTROL_TYPES
+        )
+        self.evict_slow_consumers = evict_slow_consumers
+        self.slow_send_timeout = slow_send_timeout
+        self.slow_send_average = slow_send_average
+        self.slow_queue_depth = slow_queue_depth
+        self.clock_sync_interval = clock_sync_interval
+        self.stamp_server_time = stamp_server_time
+        self.snapshots = SnapshotStore(snapshot_types, config.WS_SNAPSHOT_MAX_ROOMS)
+        self.resume_grace = resume_grace
+        self.resume_tokens = ResumeTokens(config.WS_RESUME_SECRET)
+        # Dropped sessions awaiting a resume (client_id -> connection)
+        self._parked: dict[str, ClientConnection] = {}
+        self.presence_window = presence_window
+        self.batch_window = batch_window
+        # Presence events not sent yet, by room
+        self._presence_batches: dict[str | None, PresenceBatch] = {}
+        # Room member counts on other workers (room -> node ID -> (mobile, pc))
+        self._remote_counts: dict[str | None, dict[str, tuple[int, int]]] = {}
+        # Last relay sequence number per sender, to drop stale frames
+        self.sequences = SequenceTracker()
+        self.broker = broker or LocalBroker()
+        self.metrics = RelayMetrics()
+        # Client IDs must be unique across workers sharing the rooms
+        if self.broker.distributed:
+            self._client_id_prefix = f"client_{self.broker.node_id}_"
+        else:
+            self._client_id_prefix = "client_"
+        self._background_tasks: set[asyncio.Task] = set()
+        # Connections with a send in flight (id(websocket) -> connection)
+        self._sending: dict[int, ClientConnection] = {}
+        self._watchdog_task: asyncio.Task | None = None
+        self._clock_sync_task: asyncio.Task | None = None
+        self._resume_token_task: asyncio.Task | None = None
+
+    @property
+    def resume_token_refresh(self) -> float:
+        """Seconds after which a connected client gets a fresh resume token."""
+        return self.resume_grace / 2
+
+    async def start(self) -> None:
+        """Start the broker and background tasks (watchdog, clock sync,
+        resume token refresh)."""
+        await self.broker.start(self._deliver)
+        if self.evict_slow_consumers and self._watchdog_task is None:
+            self._watchdog_task = asyncio.create_task(self._watch_slow_consumers())
+        if self.clock_sync_interval > 0 and self._clock_sync_task is None:
+            self._clock_sync_task = asyncio.create_task(self._resync_clocks())
+        if self.resume_grace > 0 and self._resume_token_task is None:
+            self._resume_token_task = asyncio.create_task(self._refresh_resume_tokens())
+
+    async def stop(self) -> None:
+        """Stop background tasks and the broker, and disconnect all clients."""
+        if self._watchdog_task is not None:
+            self._watchdog_task.cancel()
+            self._watchdog_task = None
+        if self._clock_sync_task is not None:
+            self._clock_sync_task.cancel()
+            self._clock_sync_task = None
+        if self._resume_token_task is not None:
+            self._resume_token_task.cancel()
+            self._resume_token_task = None
+        await self.broker.stop()
+        await self.disconnect_all()
 
     def _generate_client_id(self) -> str:
         """Generate a unique client ID.
@@ -79,18 +397,44 @@ class ConnectionManager:
             Unique client ID string
         """
         self.state.client_id_counter += 1
-        return f"client_{self.state.client_id_counter}"
+        return f"{self._client_id_prefix}{self.state.client_id_counter}"
 
-    async def connect(self, websocket: WebSocket) -> str:
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: str | None = None,
+        resume_token: str | None = None,
+        presence: str = PRESENCE_FULL,
+        batch: bool = False,
+    ) -> str:
         """Accept and register a new WebSocket connection.
 
         Args:
             websocket: WebSocket connection to accept
+            room_id: Room to bind the connection to (already validated)
+            resume_token: Token from an earlier ``connected`` message; if its
+                session is still parked, the connection takes it over
+            presence: PRESENCE_FULL for joins, leaves and counts, or
+                PRESENCE_COUNTS for counts only
+            batch: Whether the client accepts JSON array frames (only used
+                if batching is enabled)
 
         Returns:
             Client ID assigned to the connection
         """
-        await websocket.accept()
+        # Prefer the binary subprotocol when the client offers it
+        subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        wire_format = wire_format_for(subprotocol)
+        batch = batch and self.batch_window > 0
+
+        if resume_token:
+            parked = self._claim_parked(resume_token, room_id)
+            if parked is not None:
+                parked.presence = presence
+                parked.batch = batch
+                await self._resume(parked, websocket, wire_format)
+                return parked.client_id
 
         # Detect device type
         user_agent = websocket.headers.get("user-agent")
@@ -105,69 +449,351 @@ class ConnectionManager:
             client_id=client_id,
             device_type=device_type,
             user_agent=user_agent,
+            room_id=room_id,
+            wire_format=wire_format,
+            outbound=OutboundQueue(
+                self.send_queue_size, self.queue_full_policy, self.metrics
+            ),
+            presence=presence,
+            batch=batch,
         )
-
-        # Store in appropriate list
-        if device_type == "mobile":
-            self.state.mobile_connections[client_id] = connection
-            logger.info(f"Mobile device connected: {client_id}")
-        else:
-            self.state.pc_connections[client_id] = connection
-            logger.info(f"PC connected: {client_id}")
+        self._register(connection)
 
         # Send connection confirmation
-        await websocket.send_json(
-            {
-                "type": "connected",
-                "client_id": client_id,
-                "device_type": device_type,
-            }
+        self._enqueue(
+            connection,
+            OutboundFrame(
+                self._connected_message(connection, resumed=False), msg_type="connected"
+            ),
         )
+        snapshot = self.snapshots.get(room_id)
+        if snapshot is not None:
+            self._enqueue(
+                connection, OutboundFrame(snapshot.encode(room_id), msg_type="snapshot")
+            )
+        if self.clock_sync_interval > 0:
+            self._send_clock_sync(connection)
 
-        # Notify other connected clients
-        await self._broadcast_connection_event(client_id, device_type, "connected")
+        # Notify other clients in the room
+        await self._broadcast_connection_event(
+            room_id, client_id, device_type, "connected"
+        )
 
         return client_id
 
-    async def disconnect(self, websocket: WebSocket) -> None:
+    def _connected_message(self, connection: ClientConnection, resumed: bool) -> str:
+        """Encode the ``connected`` message for a new or resumed session.
+
+        Args:
+            connection: Connection that was accepted
+            resumed: Whether an earlier session was taken over
+
+        Returns:
+            Encoded message
+        """
+        data: dict[str, Any] = {
+            "type": "connected",
+            "client_id": connection.client_id,
+            "device_type": connection.device_type,
+            "room_id": connection.room_id,
+            "wire_format": connection.wire_format,
+        }
+        if self.batch_window > 0:
+            data["batch"] = connection.batch
+        if self.resume_grace > 0:
+            data["resumed"] = resumed
+            data["resume_token"] = self._issue_resume_token(connection)
+        return encode_message(data)
+
+    def _issue_resume_token(self, connection: ClientConnection) -> str:
+        """Issue a resume token for a connection's current nonce."""
+        connection.resume_issued_ms = now_ms()
+        return self.resume_tokens.issue(
+            connection.client_id, connection.room_id, connection.resume_nonce
+        )
+
+    async def _refresh_resume_tokens(self) -> None:
+        """Periodically send connected clients a fresh resume token.
+
+        Tokens are refused once they could not be the newest token of a
+        session that dropped within the grace window, so long-lived
+        connections need new ones.
+        """
+        while True:
+            await asyncio.sleep(self.resume_token_refresh)
+            stale_before = now_ms() - int(self.resume_token_refresh * 1000)
+            for connection in list(self.state.connections_by_socket.values()):
+                if connection.closing or connection.resume_issued_ms > stale_before:
+                    continue
+                message = {
+                    "type": "resume_token",
+                    "resume_token": self._issue_resume_token(connection),
+                }
+                self._enqueue(
+                    connection, OutboundFrame(encode_message(message), msg_type="resume_token")
+                )
+
+    def _claim_parked(self, resume_token: str, room_id: str | None) -> ClientConnection | None:
+        """Take the parked session a resume token refers to out of the parking.
+
+        Claiming is synchronous, so of two concurrent resumes with the same
+        token only one gets the session; the other starts a new session.
+
+        Args:
+            resume_token: Token from the client
+            room_id: Room requested in the handshake, if any
+
+        Returns:
+            Parked connection, or None if the token is invalid, the session
+            expired, was already claimed (or lives on another worker) or the
+            room differs
+        """
+        # The newest token of a session is at most one refresh interval old
+        # when the session drops
+        max_age = self.resume_grace + self.resume_token_refresh
+        claims = self.resume_tokens.verify(resume_token, max_age_ms=int(max_age * 1000))
+        if claims is None:
+            return None
+        connection = self._parked.get(claims.client_id)
+        if connection is None or connection.room_id != claims.room_id:
+            return None
+        if claims.nonce != connection.resume_nonce:
+            # Token of an earlier connection of the session
+            return None
+        if room_id is not None and room_id != connection.room_id:
+            return None
+        del self._parked[claims.client_id]
+        if connection.resume_handle is not None:
+            connection.resume_handle.cancel()
+            connection.resume_handle = None
+        # Tokens issued before this resume stop working
+        connection.resume_nonce = ResumeTokens.new_nonce()
+        return connection
+
+    def _park(self, connection: ClientConnection) -> None:
+        """Keep a dropped session resumable for the grace window.
+
+        The connection stays in its room, so presence does not change and
+        frames keep queueing (within the queue limit) for the resumed socket.
+
+        Args:
+            connection: Connection whose socket dropped
+        """
+        socket_id = id(connection.websocket)
+        self.state.connections_by_socket.pop(socket_id, None)
+        self._sending.pop(socket_id, None)
+        if connection.writer_task is not None:
+            connection.writer_task.cancel()
+            connection.writer_task = None
+        # The session may never come back; its frames must not hold up the
+        # relay latency of the messages they carry
+        connection.outbound.release_traces()
+        connection.closing = False
+        connection.send_started_at = None
+        connection.backlog_since = None
+        connection.resume_handle = asyncio.get_running_loop().call_later(
+            self.resume_grace, self._expire_parked, connection
+        )
+        self._parked[connection.client_id] = connection
+
+    async def _resume(
+        self, connection: ClientConnection, websocket: WebSocket, wire_format: str
+    ) -> None:
+        """Attach a new socket to a session claimed with _claim_parked().
+
+        Args:
+            connection: Claimed connection
+            websocket: Newly accepted socket
+            wire_format: Wire format negotiated on the new socket
+        """
+        if wire_format != connection.wire_format:
+            # Queued frames were encoded for the old format
+            connection.outbound.clear()
+            connection.wire_format = wire_format
+        connection.websocket = websocket
+        connection.send_latency_avg = 0.0
+
+        # Confirm before replaying the queue, then hand over to the writer
+        message = self._connected_message(connection, resumed=True)
+        try:
+            await websocket.send_text(message)
+        except BaseException:
+            # The new socket failed too; keep the session resumable
+            self._park(connection)
+            raise
+        self.metrics.message_out("connected", len(message))
+
+        self.state.connections_by_socket[id(websocket)] = connection
+        connection.writer_task = asyncio.create_task(self._writer(connection))
+        self.metrics.sessions_resumed += 1
+        logger.info(
+            f"{connection.device_type.capitalize()} resumed: {connection.client_id} "
+            f"(room={connection.room_id}, {len(connection.outbound)} queued frames)"
+        )
+
+    def _expire_parked(self, connection: ClientConnection) -> None:
+        """End a parked session whose grace window passed.
+
+        Args:
+            connection: Parked connection
+        """
+        if self._parked.pop(connection.client_id, None) is None:
+            return
+        connection.resume_handle = None
+        self._remove(connection)
+        logger.info(
+            f"{connection.device_type.capitalize()} session expired: {connection.client_id}"
+        )
+        self._spawn(
+            self._broadcast_connection_event(
+                connection.room_id,
+                connection.client_id,
+                connection.device_type,
+                "disconnected",
+            )
+        )
+
+    def _register(self, connection: ClientConnection) -> None:
+        """Add a connection to the device map and the socket index.
+
+        Also starts the connection's writer task.
+
+        Args:
+            connection: Connection to register
+        """
+        self.state.connections_by_socket[id(connection.websocket)] = connection
+        connection.writer_task = asyncio.create_task(self._writer(connection))
+
+        room = self.state.rooms.get(connection.room_id)
+        if room is None:
+            room = RoomConnections(room_id=connection.room_id)
+            self.state.rooms[connection.room_id] = room
+
+        if connection.device_type == "mobile":
+            self.state.mobile_connections[connection.client_id] = connection
+            room.mobile_connections[connection.client_id] = connection
+            logger.info(
+                f"Mobile device connected: {connection.client_id} (room={connection.room_id})"
+            )
+        else:
+            self.state.pc_connections[connection.client_id] = connection
+            room.pc_connections[connection.client_id] = connection
+            logger.info(f"PC connected: {connection.client_id} (room={connection.room_id})")
+
+    def _unregister(self, websocket: WebSocket) -> ClientConnection | None:
+        """Remove the connection owning a WebSocket.
+
+        Args:
+            websocket: WebSocket connection to remove
+
+        Returns:
+            Removed connection, or None if the socket was not registered
+        """
+        connection = self.state.connections_by_socket.pop(id(websocket), None)
+        if connection is None:
+            return None
+        self._sending.pop(id(websocket), None)
+        self._remove(connection)
+        return connection
+
+    def _remove(self, connection: ClientConnection) -> None:
+        """Stop a connection's writer and remove it from the device and room maps.
+
+        Args:
+            connection: Connection to remove
+        """
+        connection.closing = True
+        if connection.writer_task is not None:
+            connection.writer_task.cancel()
+        connection.outbound.clear()
+        self.sequences.forget(connection.client_id)
+
+        room = self.state.rooms.get(connection.room_id)
+        if connection.device_type == "mobile":
+            self.state.mobile_connections.pop(connection.client_id, None)
+            if room is not None:
+                room.mobile_connections.pop(connection.client_id, None)
+        else:
+            self.state.pc_connections.pop(connection.client_id, None)
+            if room is not None:
+                room.pc_connections.pop(connection.client_id, None)
+
+        if room is not None and room.is_empty():
+            del self.state.rooms[connection.room_id]
+
+    def get_connection(self, websocket: WebSocket) -> ClientConnection | None:
+        """Look up the connection owning a WebSocket.
+
+        Args:
+            websocket: WebSocket connection
+
+        Returns:
+            ClientConnection or None if the socket is not registered
+        """
+        return self.state.connections_by_socket.get(id(websocket))
+
+    async def disconnect(
+        self, websocket: WebSocket, reason: str = "closed", resumable: bool = True
+    ) -> None:
         """Disconnect a WebSocket client.
 
+        Resumable sessions are parked for the grace window instead; the room
+        is only told the client left if it does not come back in time.
+
         Args:
             websocket: WebSocket connection to disconnect
+            reason: Disconnect reason for metrics ("closed" or "error")
+            resumable: Whether the client may resume (False for a normal close)
         """
-        # Find and remove the connection
-        client_id = None
-        device_type = None
-
-        # Check mobile connections
-        for cid, conn in list(self.state.mobile_connections.items()):
-            if conn.websocket == websocket:
-                client_id = cid
-                device_type = "mobile"
-                del self.state.mobile_connections[cid]
-                break
+        if resumable and self.resume_grace > 0:
+            connection = self.get_connection(websocket)
+            if connection is not None and not connection.evicted:
+                self.metrics.disconnected(reason)
+                self._park(connection)
+                logger.info(
+                    f"{connection.device_type.capitalize()} dropped: {connection.client_id} "
+                    f"(resumable for {self.resume_grace:g}s)"
+                )
+                return
 
-        # Check PC connections
-        if client_id is None:
-            for cid, conn in list(self.state.pc_connections.items()):
-                if conn.websocket == websocket:
-                    client_id = cid
-                    device_type = "pc"
-                    del self.state.pc_connections[cid]
-                    break
+        connection = self._unregister(websocket)
 
-        if client_id:
-            logger.info(f"{device_type.capitalize()} disconnected: {client_id}")
-            # Notify other clients
-            await self._broadcast_connection_event(client_id, device_type, "disconnected")
+        if connection:
+            self.metrics.disconnected(reason)
+            logger.info(
+                f"{connection.device_type.capitalize()} disconnected: {connection.client_id}"
+            )
+            # Notify other clients in the room
+            await self._broadcast_connection_event(
+                connection.room_id,
+                connection.client_id,
+                connection.device_type,
+                "disconnected",
+            )
 
     async def disconnect_all(self) -> None:
         """Disconnect all connected clients."""
+        for connection in self._parked.values():
+            if connection.resume_handle is not None:
+                connection.resume_handle.cancel()
+                connection.resume_handle = None
+        self._parked.clear()
+        for batch in self._presence_batches.values():
+            if batch.flush_handle is not None:
+                batch.flush_handle.cancel()
+        self._presence_batches.clear()
+        self._remote_counts.clear()
+        self.sequences.clear()
+
         all_connections = list(self.state.mobile_connections.values()) + list(
             self.state.pc_connections.values()
         )
 
         for connection in all_connections:
+            self.metrics.disconnected("shutdown")
+            connection.closing = True
+            if connection.writer_task is not None:
+                connection.writer_task.cancel()
             try:
                 await connection.websocket.close()
             except Exception as e:
@@ -175,88 +801,770 @@ class ConnectionManager:
 
         self.state.mobile_connections.clear()
         self.state.pc_connections.clear()
+        self.state.rooms.clear()
+        self.state.connections_by_socket.clear()
+        self._sending.clear()
         logger.info("All clients disconnected")
 
+    def _enqueue(self, connection: ClientConnection, frame: OutboundFrame) -> bool:
+        """Queue a frame for a client without waiting for the send.
+
+        If the client's queue is full under the DISCONNECT policy, the client
+        is evicted in the background. Under the other policies a full queue
+        may drop the frame itself (see OutboundQueue.put()).
+
+        Args:
+            connection: Receiving client
+            frame: Frame to send
+
+        Returns:
+            True if the frame was queued
+        """
+        if connection.closing:
+            return False
+
+        frame.priority = self.priorities.get(frame.msg_type, PRIORITY_NORMAL)
+        if not connection.outbound.put(frame):
+            if connection.outbound.policy == DISCONNECT and connection.resume_handle is None:
+                self._schedule_eviction(connection, "Send queue full", "queue_full")
+            return False
+
+        if (
+            connection.backlog_since is None
+            and len(connection.outbound) >= self.slow_queue_depth
+        ):
+            connection.backlog_since = time.monotonic()
+        return True
+
+    async def _writer(self, connection: ClientConnection) -> None:
+        """Drain a client's outbound queue onto its WebSocket.
+
+        Tracks how long each send takes so slow consumers can be evicted.
+        For batching clients, text frames queued together are sent as one
+        JSON array frame.
+
+        Args:
+            connection: Client to write to
+        """
+        socket_id = id(connection.websocket)
+        while True:
+            frame = await connection.outbound.get()
+            if self._is_expired(frame):
+                continue
+
+            if connection.batch and self._joins_batch(frame):
+                frames = await self._collect_batch(connection, frame)
+                if not frames:
+                    continue
+            else:
+                frames = [frame]
+            if len(frames) == 1:
+                data = frames[0].data
+            else:
+                data = "[" + ",".join(f.data for f in frames) + "]"
+
+            started = time.monotonic()
+            connection.send_started_at = started
+            self._sending[socket_id] = connection
+            try:
+                if isinstance(data, str):
+                    await connection.websocket.send_text(data)
+                else:
+                    await connection.websocket.send_bytes(data)
+            except asyncio.CancelledError:
+                self._abandon(frames)
+                raise
+            except Exception as e:
+                self._abandon(frames)
+                self.metrics.send_failures += 1
+                logger.error(
+                    f"Error sending to {connection.device_type} {connection.client_id}: {e}"
+                )
+                # Stop queueing; the receive loop will park or clean up the
+                # connection (queued frames are kept for a resume)
+                connection.closing = True
+                return
+            finally:
+                connection.send_started_at = None
+                self._sending.pop(socket_id, None)
+
+            now = time.monotonic()
+            elapsed = now - started
+            for sent in frames:
+                self.metrics.message_out(sent.msg_type, len(sent.data))
+                if sent.trace is not None:
+                    self.metrics.delivered(sent.trace, now)
+            if len(frames) > 1:
+                self.metrics.batches_sent += 1
+                self.metrics.batched_frames += len(frames)
+
+            connection.send_latency_avg += SEND_LATENCY_ALPHA * (
+                elapsed - connection.send_latency_avg
+            )
+            if connection.backlog_since is not None and (
+                len(connection.outbound) < self.slow_queue_depth
+            ):
+                connection.backlog_since = None
+
+            if (
+                self.evict_slow_consumers
+                and connection.send_latency_avg > self.slow_send_average
+            ):
+                self._schedule_eviction(
+                    connection,
+                    f"Slow consumer (avg send {connection.send_latency_avg * 1000:.0f} ms)",
+                )
+                return
+
+    def _abandon(self, frames: list[OutboundFrame]) -> None:
+        """Release the relay traces of frames whose send did not complete."""
+        for frame in frames:
+            if frame.trace is not None:
+                self.metrics.abandoned(frame.trace)
+
+    def _is_expired(self, frame: OutboundFrame) -> bool:
+        """Check a frame's deadline, counting it if it passed.
+
+        Args:
+            frame: Frame taken from a queue
+
+        Returns:
+            True if the frame must be dropped
+        """
+        if frame.deadline is not None and time.monotonic() > frame.deadline:
+            # Late realtime data is worse than none
+            self.metrics.expired(frame.trace, frame.msg_type)
+            return True
+        return False
+
+    async def _collect_batch(
+        self, connection: ClientConnection, first: OutboundFrame
+    ) -> list[OutboundFrame]:
+        """Gather the text frames to send together with a batching client's frame.
+
+        The client's batching window adapts to load: it opens to the full
+        ``batch_window`` once frames arrive together and halves whenever a
+        batch has a single frame, so an idle client is not delayed.
+
+        Args:
+            connection: Batching client
+            first: Frame already taken from the queue
+
+        Returns:
+            Frames to send, oldest first (empty if all of them expired)
+        """
+        frames = [first]
+        outbound = connection.outbound
+        pending = outbound.peek()
+        # Waiting is pointless if the next frame cannot join the batch anyway
+        if connection.batch_delay > 0 and (pending is None or self._joins_batch(pending)):
+            try:
+                # Cut short by frames that may not wait (e.g. pong)
+                await outbound.wait_unbatchable(connection.batch_delay)
+            except asyncio.CancelledError:
+                # Already taken from the queue, so clearing it will not release it
+                self._abandon(frames)
+                raise
+            if self._is_expired(first):
+                frames.clear()
+
+        while len(frames) < BATCH_MAX_FRAMES:
+            pending = outbound.peek()
+            # Binary and invalid frames cannot go into an array; they keep their place
+            if pending is None or not self._joins_batch(pending):
+                break
+            outbound.get_nowait()
+            if not self._is_expired(pending):
+                frames.append(pending)
+
+        if len(frames) > 1:
+            connection.batch_delay = self.batch_window
+        else:
+            connection.batch_delay /= 2
+            if connection.batch_delay < self.batch_window / 8:
+                connection.batch_delay = 0.0
+        return frames
+
+    @staticmethod
+    def _joins_batch(frame: OutboundFrame) -> bool:
+        """Check if a frame may be sent inside a JSON array frame."""
+        return isinstance(frame.data, str) and frame.batchable
+
+    async def _watch_slow_consumers(self) -> None:
+        """Evict clients whose in-flight send or queue backlog lasts too long.
+
+        Only connections with a send in flight are checked, so a tick costs
+        O(busy clients) rather than O(all clients).
+        """
+        interval = min(self.slow_send_timeout / 4, 0.05)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for connection in list(self._sending.values()):
+                if connection.closing:
+                    continue
+                started = connection.send_started_at
+                if started is not None and now - started > self.slow_send_timeout:
+                    self._schedule_eviction(
+                        connection, f"Send stalled for {(now - started) * 1000:.0f} ms"
+                    )
+                elif (
+                    connection.backlog_since is not None
+                    and now - connection.backlog_since > self.slow_send_timeout
+                ):
+                    self._schedule_eviction(
+                        connection, f"Send queue backlog of {len(connection.outbound)} frames"
+                    )
+
+    def _schedule_eviction(
+        self, connection: ClientConnection, reason: str, category: str = "slow_consumer"
+    ) -> None:
+        """Stop sending to a client and evict it in the background.
+
+        Args:
+            connection: Client to evict
+            reason: Why the client is evicted
+            category: Disconnect reason for metrics
+        """
+        if connection.closing:
+            return
+
+        connection.closing = True
+        connection.evicted = True
+        self.metrics.disconnected(category)
+        logger.warning(
+            f"Evicting {connection.device_type} {connection.client_id}: {reason}"
+        )
+        self._spawn(self._evict(connection, reason))
+
+    async def _evict(self, connection: ClientConnection, reason: str) -> None:
+        """Forcefully disconnect a client that cannot keep up.
+
+        Args:
+            connection: Client to evict
+            reason: Close reason sent to the client
+        """
+        if self._unregister(connection.websocket) is None:
+            return
+
+        # Notify the room first; closing a dead socket may take a while
+        await self._broadcast_connection_event(
+            connection.room_id,
+            connection.client_id,
+            connection.device_type,
+            "evicted",
+            reason=reason,
+        )
+
+        try:
+            await asyncio.wait_for(
+                connection.websocket.close(code=CLOSE_CODE_SLOW_CONSUMER, reason=reason),
+                timeout=self.slow_send_timeout,
+            )
+        except Exception as e:
+            logger.error(f"Error closing connection {connection.client_id}: {e}")
+
+    def _spawn(self, coro: Coroutine[Any, Any, None]) -> None:
+        """Run a coroutine in the background, keeping a reference to it.
+
+        Args:
+            coro: Coroutine to run
+        """
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
     async def handle_message(
-        self, websocket: WebSocket, data: dict[str, Any]
+        self, websocket: WebSocket, data: dict[str, Any], size: int | None = None
     ) -> None:
-        """Handle a message from a client.
+        """Handle a parsed message from a client.
 
         Args:
             websocket: WebSocket connection that sent the message
             data: Message data (JSON dict)
+            size: Length of the frame as received, for metrics (default: the
+                length of the re-encoded message)
         """
+        received_ms = now_ms()
         msg_type = data.get("type")
 
-        if msg_type == "ping":
-            await websocket.send_json({"type": "pong"})
+        # Find sender info
+        sender_client = self.get_connection(websocket)
+
+        if not sender_client:
+            logger.warning("Received message from unknown client")
             return
 
-        # Find sender info
-        sender_client = None
-        for conn in list(self.state.mobile_connections.values()) + list(
-            self.state.pc_connections.values()
+        if msg_type in CONTROL_MESSAGE_TYPES:
+            # Counted like relayed frames, as in handle_raw()
+            if size is None:
+                size = len(encode_message(data))
+            self.metrics.message_in(msg_type, size)
+
+            if msg_type == "ping":
+                pong: dict[str, Any] = {"type": "pong"}
+                if "t0" in data:
+                    # Clock sync request: echo the client time, add server times
+                    pong["t0"] = data["t0"]
+                    pong["t1"] = received_ms
+                    pong["t2"] = now_ms()
+                # Sent on its own without the batching delay, which would skew
+                # the client's round trip
+                self._enqueue(
+                    sender_client,
+                    OutboundFrame(encode_message(pong), msg_type="pong", batchable=False),
+                )
+            else:
+                self._handle_clock_sync_reply(sender_client, data, received_ms)
+            return
+
+        message = encode_message(data)
+        self.metrics.message_in(msg_type, len(message) if size is None else size)
+        self._relay(sender_client, message, msg_type, time.monotonic())
+
+    def _send_clock_sync(self, connection: ClientConnection) -> None:
+        """Start a server-initiated clock sync exchange with a client.
+
+        Args:
+            connection: Client to sync
+        """
+        t0 = connection.clock.start_exchange()
+        # Not batched: the batching delay would count as network latency
+        self._enqueue(
+            connection,
+            OutboundFrame(
+                encode_message({"type": "clock_sync", "t0": t0}),
+                msg_type="clock_sync",
+                batchable=False,
+            ),
+        )
+
+    def _handle_clock_sync_reply(
+        self, connection: ClientConnection, data: dict[str, Any], received_ms: int
+    ) -> None:
+        """Record a clock_sync_reply and send the client its clock estimate.
+
+        Args:
+            connection: Client that replied
+            data: Reply message
+            received_ms: Server receive time of the reply
+        """
+        try:
+            t0 = int(data["t0"])
+            t1 = float(data["t1"])
+            t2 = float(data["t2"])
+        except (KeyError, TypeError, ValueError):
+            logger.debug(f"Ignoring malformed clock_sync_reply from {connection.client_id}")
+            return
+
+        if connection.clock.add_reply(t0, t1, t2, received_ms) is None:
+            return
+
+        best = connection.clock.best
+        self._enqueue(
+            connection,
+            OutboundFrame(
+                encode_message(
+                    {
+                        "type": "clock",
+                        "offset_ms": round(best.offset_ms, 1),
+                        "rtt_ms": round(best.rtt_ms, 1),
+                    }
+                ),
+                msg_type="clock",
+            ),
+        )
+        # Collect a few samples back to back before settling on the interval
+        if connection.clock.needs_more_samples():
+            self._send_clock_sync(connection)
+
+    async def _resync_clocks(self) -> None:
+        """Periodically re-sync clients that take part in clock sync."""
+        while True:
+            await asyncio.sleep(self.clock_sync_interval)
+            for connection in list(self.state.connections_by_socket.values()):
+                if connection.clock.active and not connection.closing:
+                    self._send_clock_sync(connection)
+
+    def decode_frame(self, websocket: WebSocket, message: str | bytes) -> dict[str, Any]:
+        """Decode a raw frame in the sender's wire format.
+
+        Args:
+            websocket: WebSocket connection that sent the frame
+            message: Raw text or binary frame
+
+        Returns:
+            Decoded message
+
+        Raises:
+            ValueError: If the frame cannot be decoded
+        """
+        connection = self.get_connection(websocket)
+        if (
+            isinstance(message, bytes)
+            and connection is not None
+            and connection.wire_format == WIRE_BINARY
         ):
-            if conn.websocket == websocket:
-                sender_client = conn
-                break
+            return decode_frame(message)
+        return get_codec().loads(message)
+
+    async def handle_raw(self, websocket: WebSocket, message: str | bytes) -> None:
+        """Handle a raw frame from a client without parsing it.
+
+        Relay frames are forwarded byte-for-byte; only control messages
+        (see CONTROL_MESSAGE_TYPES) are decoded.
+
+        Args:
+            websocket: WebSocket connection that sent the frame
+            message: Raw text or binary frame
+        """
+        received_at = time.monotonic()
+        sender_client = self.get_connection(websocket)
 
         if not sender_client:
             logger.warning("Received message from unknown client")
             return
 
-        # Relay messages between devices
-        if sender_client.device_type == "mobile":
+        # Binary-protocol frames carry their type in the first byte
+        if isinstance(message, bytes) and sender_client.wire_format == WIRE_BINARY:
+            msg_type = message_type(message)
+            self.metrics.message_in(msg_type, len(message))
+            self._relay(sender_client, message, msg_type, received_at)
+            return
+
+        msg_type, frame_room_id = read_envelope(message)
+        control = None
+        if msg_type in CONTROL_MESSAGE_TYPES:
+            # The scan may have hit a nested "type"; parse to confirm it
+            try:
+                data = get_codec().loads(message)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                parsed_type = data.get("type")
+                msg_type = parsed_type if isinstance(parsed_type, str) else None
+                if msg_type in CONTROL_MESSAGE_TYPES:
+                    control = data
+
+        if control is not None:
+            # Counted by handle_message()
+            await self.handle_message(websocket, control, len(message))
+            return
+        self.metrics.message_in(msg_type, len(message))
+
+        if frame_room_id is not None and frame_room_id != sender_client.room_id:
+            logger.warning(
+                f"Dropping frame for room {frame_room_id} from {sender_client.client_id} "
+                f"(bound to room {sender_client.room_id})"
+            )
+            return
+
+        self._relay(sender_client, message, msg_type, received_at)
+
+    def _relay(
+        self,
+        sender_client: ClientConnection,
+        message: str | bytes,
+        msg_type: str | None,
+        received_at: float,
+    ) -> None:
+        """Forward an encoded frame to the other side of the sender's room.
+
+        The frame goes to local receivers and, through the broker, to the
+        receivers connected to other workers.
+
+        Args:
+            sender_client: Client that sent the frame
+            message: Encoded frame
+            msg_type: Message type from the envelope
+            received_at: time.monotonic() when the frame was received
+        """
+        if isinstance(message, bytes) and sender_client.wire_format == WIRE_BINARY:
+            wire_format = WIRE_BINARY
+        else:
+            wire_format = WIRE_JSON
+
+        server_time = now_ms()
+        seq: int | None = None
+        # Binary frames of unknown kinds (newer clients, app-private payloads)
+        # are not ours to edit; they are forwarded byte-for-byte, unsequenced
+        if wire_format == WIRE_JSON or msg_type is not None:
+            sender_client.relay_seq += 1
+            seq = sender_client.relay_seq
+            if wire_format == WIRE_BINARY:
+                message = stamp_frame(
+                    message, server_time if self.stamp_server_time else None, seq
+                )
+            elif self.stamp_server_time:
+                message = stamp_fields(message, {"seq": seq, "srv_ts": server_time})
+            else:
+                message = stamp_fields(message, {"seq": seq})
+
+        relay = BrokerMessage(
+            kind=RELAY,
+            room_id=sender_client.room_id,
+            payload=message,
+            origin=self.broker.node_id,
+            sender_id=sender_client.client_id,
+            sender_device_type=sender_client.device_type,
+            msg_type=msg_type,
+            wire_format=wire_format,
+            received_ms=server_time,
+            seq=seq,
+        )
+        self._deliver(relay, received_at)
+        self.broker.publish(relay)
+
+    def _deliver(self, message: BrokerMessage, received_at: float | None = None) -> None:
+        """Deliver a room-wide message to the local clients of its room.
+
+        Relayed frames go to the other side of the sender's room; receivers
+        that speak the sender's wire format get the original frame unchanged,
+        the other format is translated once per broadcast.
+
+        Args:
+            message: Message from this worker or from the broker
+            received_at: time.monotonic() when the frame was received
+                (default: derived from the message's receive time, for
+                messages from the broker)
+        """
+        if message.kind == EVENT and message.msg_type == "presence":
+            self._deliver_presence(message)
+            return
+
+        if message.kind == RELAY and message.seq is not None and message.sender_id is not None:
+            missing = self.sequences.observe(message.sender_id, message.seq)
+            if missing is None:
+                self.metrics.frames_out_of_order += 1
+                return
+            self.metrics.sequence_gaps += missing
+
+        if message.kind == RELAY and message.sender_device_type == "mobile":
+            # Kept even without local clients, for clients joining this worker later
+            self.snapshots.record(
+                message.room_id, message.msg_type, message.payload, message.wire_format
+            )
+
+        room = self.state.rooms.get(message.room_id)
+        if room is None:
+            return
+
+        if message.kind == EVENT:
+            self._send_to_room_mobile(room, message.payload, msg_type=message.msg_type)
+            self._send_to_room_pc(room, message.payload, msg_type=message.msg_type)
+            return
+
+        # Relay messages between devices in the same room
+        if message.sender_device_type == "mobile":
             # Mobile -> PC
-            await self._send_to_all_pc(data)
+            receivers = room.pc_connections
         else:
             # PC -> Mobile
-            await self._send_to_all_mobile(data)
+            receivers = room.mobile_connections
+
+        # Only the newest state frame per sender and type matters
+        msg_type = message.msg_type
+        key = (message.sender_id, msg_type) if msg_type in self.conflate_types else None
+        variants = WireVariants(message.payload, msg_type, message.wire_format)
+        if received_at is None:
+            received_at = time.monotonic()
+            if message.received_ms is not None:
+                received_at -= max(0, now_ms() - message.received_ms) / 1000
+        trace = RelayTrace(received_at)
+        ttl = self.message_ttl.get(msg_type) if msg_type is not None else None
+        deadline = received_at + ttl if ttl is not None else None
+        batchable: bool | None = None  # Checked once, if a receiver batches
+
+        for connection in list(receivers.values()):
+            data = variants.for_format(connection.wire_format)
+            if batchable is None and connection.batch and isinstance(data, str):
+                batchable = is_json(data)
+            # Parked sessions are not counted as receivers (see _park())
+            live = connection.resume_handle is None
+            frame = OutboundFrame(
+                data,
+                key,
+                msg_type,
+                trace if live else None,
+                deadline,
+                batchable=batchable is not False,
+            )
+            if self._enqueue(connection, frame) and live:
+                trace.remaining += 1
 
-    async def _send_to_all_mobile(self, data: dict[str, Any]) -> None:
-        """Send data to all connected mobile devices.
+    def _send_to_room_mobile(
+        self,
+        room: RoomConnections,
+        data: str | bytes,
+        key: Any = None,
+        msg_type: str | None = None,
+    ) -> None:
+        """Queue data for all mobile devices in a room.
 
         Args:
-            data: Data to send
+            room: Target room
+            data: Encoded frame to send
+            key: Conflation key of the frame
+            msg_type: Message type of the frame
         """
-        for connection in list(self.state.mobile_connections.values()):
-            try:
-                await connection.websocket.send_json(data)
-            except Exception as e:
-                logger.error(f"Error sending to mobile {connection.client_id}: {e}")
+        for connection in list(room.mobile_connections.values()):
+            self._enqueue(connection, OutboundFrame(data, key, msg_type))
 
-    async def _send_to_all_pc(self, data: dict[str, Any]) -> None:
-        """Send data to all connected PCs.
+    def _send_to_room_pc(
+        self,
+        room: RoomConnections,
+        data: str | bytes,
+        key: Any = None,
+        msg_type: str | None = None,
+    ) -> None:
+        """Queue data for all PCs in a room.
 
         Args:
-            data: Data to send
+            room: Target room
+            data: Encoded frame to send
+            key: Conflation key of the frame
+            msg_type: Message type of the frame
         """
-        for connection in list(self.state.pc_connections.values()):
-            try:
-                await connection.websocket.send_json(data)
-            except Exception as e:
-                logger.error(f"Error sending to PC {connection.client_id}: {e}")
+        for connection in list(room.pc_connections.values()):
+            self._enqueue(connection, OutboundFrame(data, key, msg_type))
 
     async def _broadcast_connection_event(
-        self, client_id: str, device_type: str, event: str
+        self,
+        room_id: str | None,
+        client_id: str,
+        device_type: str,
+        event: str,
+        reason: str | None = None,
     ) -> None:
-        """Broadcast a connection event to all clients.
+        """Add a connection event to its room's next presence frame.
+
+        The frame is sent after the presence window, or right away if the
+        window is 0.
 
         Args:
+            room_id: Room the client belongs to
             client_id: ID of the client
             device_type: Type of device ("mobile" or "pc")
-            event: Event type ("connected" or "disconnected")
+            event: Event type ("connected", "disconnected" or "evicted")
+            reason: Optional reason (e.g. why a client was evicted)
         """
-        message = {
-            "type": "connection_event",
-            "client_id": client_id,
-            "device_type": device_type,
-            "event": event,
-        }
+        batch = self._presence_batches.get(room_id)
+        if batch is None:
+            batch = self._presence_batches[room_id] = PresenceBatch()
+            if self.presence_window > 0:
+                batch.flush_handle = asyncio.get_running_loop().call_later(
+                    self.presence_window, self._flush_presence, room_id
+                )
+        batch.add(client_id, device_type, event, reason)
+
+        if self.presence_window <= 0:
+            self._flush_presence(room_id)
+
+    def _local_counts(self, room_id: str | None) -> tuple[int, int]:
+        """Count this worker's clients in a room.
+
+        Args:
+            room_id: Room ID
+
+        Returns:
+            Tuple of (mobile count, PC count)
+        """
+        room = self.state.rooms.get(room_id)
+        if room is None:
+            return 0, 0
+        return len(room.mobile_connections), len(room.pc_connections)
+
+    def _flush_presence(self, room_id: str | None) -> None:
+        """Send a room's pending presence batch to all workers.
+
+        Args:
+            room_id: Room ID
+        """
+        batch = self._presence_batches.pop(room_id, None)
+        if batch is None or batch.is_empty():
+            return
+
+        mobile, pc = self._local_counts(room_id)
+        # Serialized once, on every worker; counts are this worker's share
+        presence_message = BrokerMessage(
+            kind=EVENT,
+            room_id=room_id,
+            payload=encode_message(
+                {
+                    "joined": list(batch.joined.values()),
+                    "left": list(batch.left.values()),
+                    "gone": batch.gone,
+                    "counts": [mobile, pc],
+                }
+            ),
+            origin=self.broker.node_id,
+            msg_type="presence",
+        )
+        self._deliver(presence_message)
+        self.broker.publish(presence_message)
+
+    def _deliver_presence(self, message: BrokerMessage) -> None:
+        """Send a presence batch to the local clients of its room.
+
+        Args:
+            message: Presence batch from this worker or from the broker
+        """
+        try:
+            batch = get_codec().loads(message.payload)
+            node_mobile, node_pc = batch["counts"]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Dropping malformed presence batch: {e}")
+            return
+
+        for entry in batch.get("left", []):
+            self.sequences.forget(entry["client_id"])
+        for client_id in batch.get("gone", []):
+            self.sequences.forget(client_id)
+
+        room_id = message.room_id
+        if message.origin != self.broker.node_id:
+            remote = self._remote_counts.setdefault(room_id, {})
+            if node_mobile or node_pc:
+                remote[message.origin] = (node_mobile, node_pc)
+            else:
+                remote.pop(message.origin, None)
+                if not remote:
+                    del self._remote_counts[room_id]
+
+        room = self.state.rooms.get(room_id)
+        if room is None or not (batch.get("joined") or batch.get("left")):
+            return
+
+        mobile, pc = self._local_counts(room_id)
+        for remote_mobile, remote_pc in self._remote_counts.get(room_id, {}).values():
+            mobile += remote_mobile
+            pc += remote_pc
+        counts = {"mobile": mobile, "pc": pc}
 
-        # Send to all clients
-        await self._send_to_all_mobile(message)
-        await self._send_to_all_pc(message)
+        full: str | None = None
+        counts_only: str | None = None
+        for connection in list(room.mobile_connections.values()) + list(
+            room.pc_connections.values()
+        ):
+            if connection.presence == PRESENCE_COUNTS:
+                if counts_only is None:
+                    counts_only = encode_message(
+                        {"type": "presence", "room_id": room_id, "counts": counts}
+                    )
+                data = counts_only
+            else:
+                if full is None:
+                    full = encode_message(
+                        {
+                            "type": "presence",
+                            "room_id": room_id,
+                            "joined": batch.get("joined", []),
+                            "left": batch.get("left", []),
+                            "counts": counts,
+                        }
+                    )
+                data = full
+            self._enqueue(connection, OutboundFrame(data, msg_type="presence"))
 
     def get_connected_mobile_count(self) -> int:
         """Get count of connected mobile devices.
@@ -274,6 +1582,49 @@ class ConnectionManager:
         """
         return len(self.state.pc_connections)
 
+    def get_room_count(self) -> int:
+        """Get count of rooms with at least one connection.
+
+        Returns:
+            Number of active rooms
+        """
+        return len(self.state.rooms)
+
+    def render_metrics(self) -> str:
+        """Render relay metrics in Prometheus text format.
+
+        Returns:
+            Exposition text
+        """
+        return self.metrics.render(
+            {
+                "relay_connections": (
+                    "Connected clients",
+                    {
+                        '{device_type="mobile"}': self.get_connected_mobile_count(),
+                        '{device_type="pc"}': self.get_connected_pc_count(),
+                    },
+                ),
+                "relay_rooms": ("Rooms with at least one connection", {"": self.get_room_count()}),
+                "relay_queued_frames": (
+                    "Frames waiting in send queues",
+                    {
+                        "": sum(
+                            len(c.outbound) for c in self.state.connections_by_socket.values()
+                        )
+                    },
+                ),
+                "relay_broker_published": (
+                    "Messages published to other workers",
+                    {"": self.broker.published},
+                ),
+                "relay_broker_dropped": (
+                    "Broker messages dropped on full buffers",
+                    {"": self.broker.dropped},
+                ),
+            }
+        )
+
 
 # Global connection manager instance
 _connection_manager: ConnectionManager | None = None
@@ -282,10 +1633,13 @@ _connection_manager: ConnectionManager | None = None
 def get_connection_manager() -> ConnectionManager:
     """Get the global connection manager instance.
 
+    The manager is per process; with several workers, rooms are shared through
+    the broker selected by RELAY_BROKER.
+
     Returns:
         ConnectionManager instance
     """
     global _connection_manager
     if _connection_manager is None:
-        _connection_manager = ConnectionManager()
+        _connection_manager = ConnectionManager(broker=create_broker())
     return _connection_manager
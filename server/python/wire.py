@@ -0,0 +1,300 @@
+"""Compact binary wire format for controller frames.
+
+Clients that offer the ``airguitar.bin.v1`` WebSocket subprotocol exchange
+FRET_UPDATE and chord_change as fixed-size binary frames. All other messages
+stay JSON text. The relay translates between the formats when the two ends of
+a room speak different ones.
+
+Frame layout (network byte order):
+
+    offset  size  field
+    0       1     kind (1 = FRET_UPDATE, 2 = chord_change)
+    1       1     flags (bit 0: server time trailer present)
+    2       2     seq (u16, wraps; set by the relay, see sequence.py)
+    4       4     timestamp (u32, sender milliseconds modulo 2**32)
+    8       6     frets (i8 per string, low E first; -128 = not used)
+
+chord_change frames append the chord name as a u8 length plus UTF-8 bytes.
+Frames stamped by the relay end with the server receive time as a u64 (Unix
+epoch milliseconds) and have flag bit 0 set.
+"""
+
+import logging
+import struct
+from typing import Any
+
+from .codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+JSON_SUBPROTOCOL = "airguitar.json.v1"
+BINARY_SUBPROTOCOL = "airguitar.bin.v1"
+
+# Wire formats
+WIRE_JSON = "json"
+WIRE_BINARY = "binary"
+
+KIND_FRET_UPDATE = 1
+KIND_CHORD_CHANGE = 2
+
+KIND_TO_TYPE = {KIND_FRET_UPDATE: "FRET_UPDATE", KIND_CHORD_CHANGE: "chord_change"}
+TYPE_TO_KIND = {name: kind for kind, name in KIND_TO_TYPE.items()}
+
+# Message types that have a binary encoding
+BINARY_MESSAGE_TYPES = frozenset(TYPE_TO_KIND)
+
+FRET_NONE = -128
+STRING_COUNT = 6
+
+FLAG_SERVER_TIME = 0x01
+
+_HEADER = struct.Struct("!BBHI")
+_FRETS = struct.Struct("!6b")
+_SERVER_TIME = struct.Struct("!Q")
+_SEQ = struct.Struct("!H")
+_SEQ_OFFSET = 2
+_HEADER_AND_FRETS_SIZE = _HEADER.size + _FRETS.size
+
+
+def negotiate_subprotocol(offered: list[str]) -> str | None:
+    """Pick the subprotocol to accept from the ones a client offered.
+
+    Args:
+        offered: Subprotocols from the Sec-WebSocket-Protocol header
+
+    Returns:
+        Accepted subprotocol, or None for legacy clients that offered none
+    """
+    if BINARY_SUBPROTOCOL in offered:
+        return BINARY_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+def wire_format_for(subprotocol: str | None) -> str:
+    """Get the wire format for an accepted subprotocol.
+
+    Args:
+        subprotocol: Accepted subprotocol
+
+    Returns:
+        WIRE_BINARY or WIRE_JSON
+    """
+    return WIRE_BINARY if subprotocol == BINARY_SUBPROTOCOL else WIRE_JSON
+
+
+def message_type(frame: bytes) -> str | None:
+    """Get the message type of a binary frame from its kind byte.
+
+    Args:
+        frame: Binary frame
+
+    Returns:
+        Message type, or None if the kind is unknown
+    """
+    if not frame:
+        return None
+    return KIND_TO_TYPE.get(frame[0])
+
+
+def encode_frame(data: dict[str, Any]) -> bytes | None:
+    """Encode a JSON message as a binary frame.
+
+    Args:
+        data: Decoded JSON message
+
+    Returns:
+        Binary frame, or None if the message has no binary encoding
+    """
+    kind = TYPE_TO_KIND.get(data.get("type"))
+    if kind is None:
+        return None
+
+    try:
+        if kind == KIND_FRET_UPDATE:
+            frets = data.get("payload")
+        else:
+            frets = data.get("frets")
+            if frets is None and data.get("fingering") is not None:
+                frets = _frets_from_fingering(data["fingering"])
+
+        if not isinstance(frets, list) or len(frets) != STRING_COUNT:
+            return None
+
+        seq = int(data.get("seq") or 0) & 0xFFFF
+        timestamp = int(data.get("timestamp") or 0) & 0xFFFFFFFF
+        server_time = data.get("srv_ts")
+        trailer = b"" if server_time is None else _SERVER_TIME.pack(int(server_time))
+        flags = FLAG_SERVER_TIME if trailer else 0
+        frame = _HEADER.pack(kind, flags, seq, timestamp) + _FRETS.pack(
+            *(FRET_NONE if fret is None else int(fret) for fret in frets)
+        )
+    except (TypeError, ValueError, struct.error):
+        return None
+
+    if kind == KIND_CHORD_CHANGE:
+        name = str(data.get("chord") or "").encode("utf-8")[:255]
+        frame += bytes([len(name)]) + name
+    return frame + trailer
+
+
+def decode_frame(frame: bytes) -> dict[str, Any]:
+    """Decode a binary frame into its JSON message.
+
+    Args:
+        frame: Binary frame
+
+    Returns:
+        Decoded message in the JSON shape clients already understand
+
+    Raises:
+        ValueError: If the frame is malformed or of an unknown kind
+    """
+    if len(frame) < _HEADER_AND_FRETS_SIZE:
+        raise ValueError(f"Binary frame too short: {len(frame)} bytes")
+
+    kind, flags, seq, timestamp = _HEADER.unpack_from(frame)
+    frets = [None if f == FRET_NONE else f for f in _FRETS.unpack_from(frame, _HEADER.size)]
+
+    end = len(frame)
+    server_time = None
+    if flags & FLAG_SERVER_TIME:
+        if end < _HEADER_AND_FRETS_SIZE + _SERVER_TIME.size:
+            raise ValueError("Binary frame too short for its server time")
+        end -= _SERVER_TIME.size
+        (server_time,) = _SERVER_TIME.unpack_from(frame, end)
+
+    if kind == KIND_FRET_UPDATE:
+        data = {
+            "type": "FRET_UPDATE",
+            "payload": [-1 if f is None else f for f in frets],
+            "seq": seq,
+            "timestamp": timestamp,
+        }
+    elif kind == KIND_CHORD_CHANGE:
+        offset = _HEADER_AND_FRETS_SIZE
+        name_length = frame[offset] if end > offset else 0
+        name = frame[offset + 1 : min(offset + 1 + name_length, end)].decode(
+            "utf-8", errors="replace"
+        )
+        data = {
+            "type": "chord_change",
+            "chord": name,
+            "frets": frets,
+            "fingering": [
+                # string: 6 (low E) ... 1 (high E)
+                {"string": STRING_COUNT - i, "fret": fret}
+                for i, fret in enumerate(frets)
+                if fret is not None
+            ],
+            "seq": seq,
+            "timestamp": timestamp,
+        }
+    else:
+        raise ValueError(f"Unknown binary frame kind: {kind}")
+
+    if server_time is not None:
+        data["srv_ts"] = server_time
+    return data
+
+
+def stamp_frame(frame: bytes, server_time: int | None, seq: int | None = None) -> bytes:
+    """Set the relay fields of a binary frame.
+
+    Args:
+        frame: Binary frame from a client
+        server_time: Server receive time (Unix epoch milliseconds) for the
+            trailer, or None to leave the trailer as it is
+        seq: Relay sequence number for the seq field (low 16 bits), or None
+            to leave it as it is
+
+    Returns:
+        Stamped frame; frames of unknown kinds, or too short to be valid,
+        are returned unchanged
+    """
+    if message_type(frame) is None or len(frame) < _HEADER_AND_FRETS_SIZE:
+        return frame
+    stamped = bytearray(frame)
+    if seq is not None:
+        _SEQ.pack_into(stamped, _SEQ_OFFSET, seq & 0xFFFF)
+    if server_time is not None:
+        if stamped[1] & FLAG_SERVER_TIME:
+            if len(frame) < _HEADER_AND_FRETS_SIZE + _SERVER_TIME.size:
+                return frame
+            # Replace a trailer set by the client
+            del stamped[-_SERVER_TIME.size :]
+        stamped[1] |= FLAG_SERVER_TIME
+        stamped += _SERVER_TIME.pack(server_time)
+    return bytes(stamped)
+
+
+def _frets_from_fingering(fingering: list[dict[str, Any]]) -> list[int | None]:
+    """Convert a chord_change fingering list into a fret array.
+
+    Args:
+        fingering: List of {"string": 1-6, "fret": n}
+
+    Returns:
+        Fret per string, low E first
+    """
+    frets: list[int | None] = [None] * STRING_COUNT
+    for entry in fingering:
+        index = STRING_COUNT - int(entry["string"])
+        if 0 <= index < STRING_COUNT:
+            frets[index] = entry["fret"]
+    return frets
+
+
+class WireVariants:
+    """Per-format variants of one relayed frame, translated at most once."""
+
+    def __init__(self, message: str | bytes, msg_type: str | None, wire_format: str) -> None:
+        """Initialize with the frame as the sender encoded it.
+
+        Args:
+            message: Raw frame from the sender
+            msg_type: Message type from the routing envelope
+            wire_format: Sender's wire format
+        """
+        self.msg_type = msg_type
+        self._source_format = wire_format
+        self._variants: dict[str, str | bytes] = {wire_format: message}
+
+    def for_format(self, wire_format: str) -> str | bytes:
+        """Get the frame encoded for a receiver's wire format.
+
+        Frames that cannot be translated are returned unchanged.
+
+        Args:
+            wire_format: Receiver's wire format
+
+        Returns:
+            Encoded frame
+        """
+        variant = self._variants.get(wire_format)
+        if variant is None:
+            variant = self._translate(wire_format)
+            self._variants[wire_format] = variant
+        return variant
+
+    def _translate(self, wire_format: str) -> str | bytes:
+        message = self._variants[self._source_format]
+
+        if wire_format == WIRE_BINARY:
+            if self.msg_type not in BINARY_MESSAGE_TYPES:
+                return message
+            try:
+                data = get_codec().loads(message)
+            except ValueError:
+                return message
+            if not isinstance(data, dict):
+                return message
+            return encode_frame(data) or message
+
+        if isinstance(message, bytes) and self._source_format == WIRE_BINARY:
+            try:
+                return get_codec().dumps(decode_frame(message))
+            except ValueError as e:
+                logger.debug(f"Forwarding untranslatable binary frame: {e}")
+        return message
@@ -0,0 +1 @@
+"""Tests for the Python signaling server."""
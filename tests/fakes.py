@@ -0,0 +1,419 @@
+"""In-memory fakes for benchmarking and exercising the server without clients.
+
+- FakeWebSocket: a client socket for ConnectionManager
+- FakeADBServer: an ADB server with fake devices, for adb_client / ADBManager
+"""
+
+import asyncio
+import re
+import shlex
+import struct
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from server.python.codec import get_codec
+
+
+class FakeWebSocket:
+    """Stand-in for a Starlette WebSocket as used by ConnectionManager.
+
+    Sends are counted, and kept in ``sent`` when ``record`` is set. A
+    ``send_delay`` makes every send take that long, to simulate a slow
+    consumer. receive() waits until the client hangs up with disconnect().
+    """
+
+    def __init__(
+        self,
+        user_agent: str | None = None,
+        subprotocols: list[str] | None = None,
+        query: dict[str, str] | None = None,
+        record: bool = False,
+        send_delay: float = 0.0,
+    ) -> None:
+        """Initialize the fake.
+
+        Args:
+            user_agent: User-Agent header of the handshake
+            subprotocols: Subprotocols offered in the handshake
+            query: Query parameters of the handshake URL
+            record: Keep every sent frame in ``sent``
+            send_delay: Seconds each send takes
+        """
+        self.headers: dict[str, str] = {}
+        if user_agent is not None:
+            self.headers["user-agent"] = user_agent
+        self.query_params: dict[str, str] = dict(query or {})
+        self.scope: dict[str, Any] = {
+            "type": "websocket",
+            "subprotocols": list(subprotocols or []),
+        }
+        self.record = record
+        self.send_delay = send_delay
+        self.accepted = False
+        self.subprotocol: str | None = None
+        self.closed = False
+        self.close_code: int | None = None
+        self.close_reason: str | None = None
+        self.sent_count = 0
+        self.sent: list[str | bytes] = []
+        self._hung_up = asyncio.Event()
+
+    async def accept(
+        self, subprotocol: str | None = None, headers: list[tuple[bytes, bytes]] | None = None
+    ) -> None:
+        self.accepted = True
+        self.subprotocol = subprotocol
+
+    async def _send(self, data: str | bytes) -> None:
+        if self.closed:
+            raise RuntimeError("Cannot send on a closed WebSocket")
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.sent_count += 1
+        if self.record:
+            self.sent.append(data)
+
+    async def send_text(self, data: str) -> None:
+        await self._send(data)
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self._send(data)
+
+    async def send_json(self, data: Any, mode: str = "text") -> None:
+        if mode == "binary":
+            await self._send(get_codec().dumps_bytes(data))
+        else:
+            await self._send(get_codec().dumps(data))
+
+    async def close(self, code: int = 1000, reason: str | None = None) -> None:
+        self.closed = True
+        self.close_code = code
+        self.close_reason = reason
+
+    async def receive(self) -> dict[str, Any]:
+        await self._hung_up.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    def disconnect(self) -> None:
+        """Hang up from the client side."""
+        self._hung_up.set()
+
+    def sent_messages(self) -> list[Any]:
+        """Decode the recorded text frames.
+
+        Returns:
+            Decoded JSON messages, in send order (binary frames are skipped)
+        """
+        codec = get_codec()
+        return [codec.loads(frame) for frame in self.sent if isinstance(frame, str)]
+
+
+# Shell handler of FakeADBServer: (serial, command) -> (stdout, stderr, exit status)
+# An exit status of None makes an interactive shell die after the output
+ShellHandler = Callable[[str, str], tuple[bytes, bytes, int | None]]
+
+# Command line of a persistent shell session (see shell_session.py)
+_SESSION_COMMAND = re.compile(r'\( eval (.+) \) </dev/null; echo "(\S+)\$\?"; echo "\S+" >&2')
+
+
+@dataclass
+class FakeADBDevice:
+    """A device known to FakeADBServer."""
+
+    serial: str
+    model: str = "Pixel_8"
+    product: str = "shiba"
+    device: str = "shiba"
+    transport_id: int = 1
+    features: tuple[str, ...] = ("shell_v2", "cmd", "stat_v2")
+    files: dict[str, bytes] = field(default_factory=dict)  # Path -> contents for pulls
+
+
+class FakeADBServer:
+    """In-process stand-in for the ADB server's smart-socket protocol.
+
+    Serves the host services used by adb_client.ADBClient (devices-l,
+    track-devices-l, features, forward/killforward, connect/disconnect) and,
+    after
+    ``host:transport:<serial>``, the shell, shell v2, exec, reverse and sync
+    (RECV) device services. Every service request is kept in ``requests``.
+    attach() and detach() change the devices and notify track-devices-l
+    subscribers.
+
+    An interactive ``shell,v2,raw:`` (no command) runs the command lines that
+    shell_session.ShellSession writes to it through the shell handler;
+    kill_shells() ends them as a device reboot would. With ``packet_size``,
+    shell v2 output is split into packets of at most that many bytes, as
+    adbd does with long output.
+    """
+
+    def __init__(
+        self,
+        devices: list[FakeADBDevice] | None = None,
+        shell: ShellHandler | None = None,
+        packet_size: int = 0,
+    ) -> None:
+        """Initialize the fake.
+
+        Args:
+            devices: Connected devices (default: one "emulator-5554")
+            shell: Handler for shell and exec commands (default: echo the
+                command line to stdout with exit status 0)
+            packet_size: Max payload of a shell v2 output packet (0 for one
+                packet per stream)
+        """
+        self.devices: dict[str, FakeADBDevice] = {
+            d.serial: d for d in (devices or [FakeADBDevice("emulator-5554")])
+        }
+        self.shell = shell or (lambda serial, command: (command.encode() + b"\n", b"", 0))
+        self.packet_size = packet_size
+        self.forwards: dict[str, str] = {}  # "serial local" -> remote
+        self.reverses: dict[str, str] = {}  # "serial remote" -> local
+        self.requests: list[str] = []
+        self.connections = 0
+        self.port = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._handlers: set[asyncio.Task] = set()
+        self._trackers: set[asyncio.StreamWriter] = set()
+        self._shells: set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> int:
+        """Start listening on a free localhost port.
+
+        Returns:
+            Port the fake listens on
+        """
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        """Stop listening and drop open connections."""
+        for task in list(self._handlers):
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def attach(self, device: FakeADBDevice) -> None:
+        """Connect a device and notify the device trackers."""
+        self.devices[device.serial] = device
+        await self._notify_trackers()
+
+    async def detach(self, serial: str) -> None:
+        """Disconnect a device and notify the device trackers."""
+        self.devices.pop(serial, None)
+        await self._notify_trackers()
+
+    async def kill_shells(self) -> None:
+        """End the interactive shells."""
+        for writer in list(self._shells):
+            writer.write(struct.pack("<BI", 3, 1) + b"\x00")
+            writer.close()
+        self._shells.clear()
+
+    async def _notify_trackers(self) -> None:
+        data = self.device_list().encode("utf-8")
+        for writer in list(self._trackers):
+            writer.write(b"%04x" % len(data) + data)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                self._trackers.discard(writer)
+
+    def device_list(self) -> str:
+        """Format the devices like ``host:devices-l``."""
+        return "".join(
+            f"{d.serial}\tdevice product:{d.product} model:{d.model} "
+            f"device:{d.device} transport_id:{d.transport_id}\n"
+            for d in self.devices.values()
+        )
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            serial = None
+            while True:
+                try:
+                    length = int(await reader.readexactly(4), 16)
+                except asyncio.IncompleteReadError:
+                    return
+                service = (await reader.readexactly(length)).decode("utf-8")
+                self.requests.append(service)
+
+                if service.startswith("host:transport:"):
+                    serial = service.removeprefix("host:transport:")
+                    if serial not in self.devices:
+                        await self._fail(writer, f"device '{serial}' not found")
+                        return
+                    writer.write(b"OKAY")
+                    continue
+                if serial is not None:
+                    await self._device_service(reader, writer, serial, service)
+                else:
+                    await self._host_service(reader, writer, service)
+                return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _host_service(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, service: str
+    ) -> None:
+        if service == "host:version":
+            await self._okay(writer, "0029")
+        elif service == "host:devices-l":
+            await self._okay(writer, self.device_list())
+        elif service == "host:track-devices-l":
+            await self._okay(writer, self.device_list())
+            # Keep the connection open until the client closes it;
+            # attach() and detach() push updates
+            self._trackers.add(writer)
+            try:
+                await reader.read()
+            finally:
+                self._trackers.discard(writer)
+        elif service.startswith("host:connect:"):
+            await self._okay(writer, f"connected to {service.removeprefix('host:connect:')}")
+        elif service.startswith("host:disconnect:"):
+            target = service.removeprefix("host:disconnect:")
+            if target in self.devices:
+                await self._okay(writer, f"disconnected {target}")
+            else:
+                await self._fail(writer, f"no such device '{target}'")
+        elif service.startswith("host-serial:"):
+            rest = service.removeprefix("host-serial:")
+            # Serials of network devices contain a colon themselves
+            serial = next((s for s in self.devices if rest.startswith(f"{s}:")), None)
+            device = self.devices.get(serial) if serial is not None else None
+            request = rest[len(serial) + 1 :] if serial is not None else ""
+            if device is None:
+                await self._fail(writer, f"device not found: {rest}")
+            elif request == "features":
+                await self._okay(writer, ",".join(device.features))
+            elif request.startswith("forward:"):
+                local, _, remote = request.removeprefix("forward:").partition(";")
+                self.forwards[f"{serial} {local}"] = remote
+                writer.write(b"OKAYOKAY")
+            elif request.startswith("killforward:"):
+                local = request.removeprefix("killforward:")
+                if self.forwards.pop(f"{serial} {local}", None) is None:
+                    await self._fail(writer, f"listener '{local}' not found")
+                else:
+                    writer.write(b"OKAYOKAY")
+            else:
+                await self._fail(writer, f"unknown host service: {request}")
+        else:
+            await self._fail(writer, f"unknown host service: {service}")
+
+    async def _device_service(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        serial: str,
+        service: str,
+    ) -> None:
+        device = self.devices[serial]
+        if service == "shell,v2,raw:":
+            writer.write(b"OKAY")
+            self._shells.add(writer)
+            try:
+                await self._interactive_shell(reader, writer, serial)
+            finally:
+                self._shells.discard(writer)
+        elif service.startswith("shell,v2,raw:"):
+            stdout, stderr, code = self.shell(serial, service.removeprefix("shell,v2,raw:"))
+            writer.write(b"OKAY")
+            self._write_output(writer, 1, stdout)
+            self._write_output(writer, 2, stderr)
+            writer.write(struct.pack("<BI", 3, 1) + bytes([code & 0xFF]))
+        elif service.startswith(("shell:", "exec:")):
+            stdout, stderr, _ = self.shell(serial, service.partition(":")[2])
+            writer.write(b"OKAY" + stdout + (stderr if service.startswith("shell:") else b""))
+        elif service.startswith("reverse:forward:"):
+            remote, _, local = service.removeprefix("reverse:forward:").partition(";")
+            self.reverses[f"{serial} {remote}"] = local
+            writer.write(b"OKAYOKAY")
+        elif service == "sync:":
+            writer.write(b"OKAY")
+            await self._sync(reader, writer, device)
+        else:
+            await self._fail(writer, f"unknown device service: {service}")
+        await writer.drain()
+
+    async def _interactive_shell(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, serial: str
+    ) -> None:
+        pending = b""
+        while True:
+            packet_id, length = struct.unpack("<BI", await reader.readexactly(5))
+            data = await reader.readexactly(length)
+            if packet_id == 4:  # Close stdin
+                writer.write(struct.pack("<BI", 3, 1) + b"\x00")
+                return
+            pending += data
+            while b"\n" in pending:
+                line, pending = pending.split(b"\n", 1)
+                match = _SESSION_COMMAND.fullmatch(line.decode("utf-8"))
+                if match is None:
+                    continue
+                command = shlex.split(match.group(1))[0]
+                marker = match.group(2)
+                stdout, stderr, code = self.shell(serial, command)
+                if code is None:
+                    # The shell dies mid-command (e.g. the device rebooted)
+                    self._write_output(writer, 1, stdout)
+                    self._write_output(writer, 2, stderr)
+                    writer.write(struct.pack("<BI", 3, 1) + b"\x00")
+                    await writer.drain()
+                    return
+                self._write_output(writer, 1, stdout + f"{marker}{code}\n".encode())
+                self._write_output(writer, 2, stderr + f"{marker}\n".encode())
+                await writer.drain()
+
+    def _write_output(self, writer: asyncio.StreamWriter, packet_id: int, data: bytes) -> None:
+        """Write shell v2 stdout or stderr, split into packets of packet_size."""
+        size = self.packet_size or max(len(data), 1)
+        for offset in range(0, len(data), size):
+            chunk = data[offset : offset + size]
+            writer.write(struct.pack("<BI", packet_id, len(chunk)) + chunk)
+
+    async def _sync(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, device: FakeADBDevice
+    ) -> None:
+        while True:
+            request_id, length = struct.unpack("<4sI", await reader.readexactly(8))
+            if request_id == b"QUIT":
+                return
+            path = (await reader.readexactly(length)).decode("utf-8")
+            if request_id != b"RECV":
+                message = b"unsupported sync request"
+                writer.write(struct.pack("<4sI", b"FAIL", len(message)) + message)
+                return
+            data = device.files.get(path)
+            if data is None:
+                message = f"remote object '{path}' does not exist".encode()
+                writer.write(struct.pack("<4sI", b"FAIL", len(message)) + message)
+                continue
+            for offset in range(0, len(data), 64 * 1024):
+                chunk = data[offset : offset + 64 * 1024]
+                writer.write(struct.pack("<4sI", b"DATA", len(chunk)) + chunk)
+            writer.write(struct.pack("<4sI", b"DONE", 0))
+            await writer.drain()
+
+    @staticmethod
+    async def _okay(writer: asyncio.StreamWriter, text: str) -> None:
+        data = text.encode("utf-8")
+        writer.write(b"OKAY" + b"%04x" % len(data) + data)
+        await writer.drain()
+
+    @staticmethod
+    async def _fail(writer: asyncio.StreamWriter, message: str) -> None:
+        data = message.encode("utf-8")
+        writer.write(b"FAIL" + b"%04x" % len(data) + data)
+        await writer.drain()
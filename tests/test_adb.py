@@ -0,0 +1,152 @@
+"""ADBClient, ADBManager and DeviceTracker against FakeADBServer."""
+
+import asyncio
+import socket
+from typing import Awaitable, Callable
+
+import pytest
+
+from server.python.adb import DEVICE_ATTACHED, DEVICE_DETACHED, ADBError, ADBManager
+from server.python.adb_client import ADBClient, ADBConnectionError, ADBFailure
+from tests.fakes import FakeADBDevice, FakeADBServer
+
+
+def shell_handler(serial: str, command: str) -> tuple[bytes, bytes, int]:
+    """Echo the command, or fail with ``fail <status>``."""
+    if command.startswith("fail "):
+        return b"", b"boom\n", int(command.removeprefix("fail "))
+    return command.encode() + b"\n", b"", 0
+
+
+def run_with_fake(
+    scenario: Callable[[FakeADBServer, ADBManager], Awaitable[None]], **options
+) -> None:
+    """Run a scenario against a fake ADB server and a manager connected to it."""
+
+    async def main() -> None:
+        fake = FakeADBServer(
+            [
+                FakeADBDevice("emulator-5554"),
+                FakeADBDevice("legacy", features=("cmd",), transport_id=2),
+            ],
+            shell=shell_handler,
+            **options,
+        )
+        port = await fake.start()
+        manager = ADBManager(adb_path="/nonexistent/adb", client=ADBClient("127.0.0.1", port))
+        try:
+            await scenario(fake, manager)
+        finally:
+            await manager.close()
+            await fake.stop()
+
+    asyncio.run(main())
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_query_devices():
+    async def scenario(fake: FakeADBServer, adb: ADBManager) -> None:
+        assert await adb.client.query("host:devices-l") == fake.device_list()
+        assert await adb.client.query("host:version") == "0029"
+
+        devices = await adb.get_devices()
+        assert [d.device_id for d in devices] == ["emulator-5554", "legacy"]
+        assert devices[0].model == "Pixel_8"
+        assert devices[1].transport_id == "2"
+
+    run_with_fake(scenario)
+
+
+def test_forward():
+    async def scenario(fake: FakeADBServer, adb: ADBManager) -> None:
+        assert await adb.forward_port("emulator-5554", 8080, 9090)
+        assert fake.forwards == {"emulator-5554 tcp:8080": "tcp:9090"}
+
+        assert await adb.remove_forward("emulator-5554", 8080)
+        assert fake.forwards == {}
+        assert not await adb.remove_forward("emulator-5554", 8080)
+        assert not await adb.forward_port("missing", 8080, 9090)
+
+    run_with_fake(scenario)
+
+
+def test_transport_failure():
+    async def scenario(fake: FakeADBServer, adb: ADBManager) -> None:
+        with pytest.raises(ADBFailure, match="not found"):
+            await adb.client.open_service("missing", "exec:true")
+        stdout, stderr, code = await adb.shell_command("missing", "true")
+        assert (stdout, code) == ("", 1)
+        assert "not found" in stderr
+
+    run_with_fake(scenario)
+
+
+def test_server_unreachable_falls_back_to_executable():
+    async def main() -> None:
+        client = ADBClient("127.0.0.1", unused_port(), pool_size=0)
+        with pytest.raises(ADBConnectionError):
+            await client.query("host:devices-l")
+
+        adb = ADBManager(adb_path="/nonexistent/adb", client=client)
+        try:
+            with pytest.raises(ADBError, match="executable not found"):
+                await adb.get_devices()
+        finally:
+            await adb.close()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("packet_size", [0, 3])
+def test_shell_v2_exit_codes(packet_size: int):
+    async def scenario(fake: FakeADBServer, adb: ADBManager) -> None:
+        assert await adb.client.shell("emulator-5554", "fail 3") == (b"", b"boom\n", 3)
+        assert await adb.client.shell("emulator-5554", "echo hi") == (b"echo hi\n", b"", 0)
+
+        # Persistent shell sessions: the status survives packet splits, and
+        # one command's output does not leak into the next
+        for _ in range(3):
+            assert await adb.shell_command("emulator-5554", "fail 7") == ("", "boom\n", 7)
+            assert await adb.shell_command("emulator-5554", "echo 'a b'") == (
+                "echo 'a b'\n",
+                "",
+                0,
+            )
+        assert adb.shells.devices["emulator-5554"].spawned == 1
+
+        # Without shell v2, stderr is mixed into stdout and the status is lost
+        assert await adb.shell_command("legacy", "fail 3") == ("boom\n", "", 0)
+
+    run_with_fake(scenario, packet_size=packet_size)
+
+
+def test_track_devices():
+    async def scenario(fake: FakeADBServer, adb: ADBManager) -> None:
+        tracker = adb.tracker
+        tracker.start()
+        assert await tracker.wait_synced(timeout=5)
+        assert set(tracker.devices) == {"emulator-5554", "legacy"}
+        events = tracker.subscribe()
+
+        await fake.attach(FakeADBDevice("192.168.1.20:5555", transport_id=3))
+        event = await asyncio.wait_for(events.get(), 5)
+        assert (event.event, event.device.device_id) == (DEVICE_ATTACHED, "192.168.1.20:5555")
+
+        await fake.detach("legacy")
+        event = await asyncio.wait_for(events.get(), 5)
+        assert (event.event, event.device.device_id) == (DEVICE_DETACHED, "legacy")
+
+        assert set(tracker.devices) == {"emulator-5554", "192.168.1.20:5555"}
+        requests = len(fake.requests)
+        assert [d.device_id for d in await adb.get_devices()] == [
+            "emulator-5554",
+            "192.168.1.20:5555",
+        ]
+        assert len(fake.requests) == requests  # Answered from the registry
+
+    run_with_fake(scenario)
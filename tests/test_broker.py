@@ -0,0 +1,129 @@
+"""Cross-worker relay through UnixSocketBroker."""
+
+import asyncio
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from server.python import broker as broker_module
+from server.python.broker import UnixSocketBroker
+from server.python.websocket import ConnectionManager
+from tests.fakes import FakeWebSocket
+from tests.test_websocket import (
+    DESKTOP_USER_AGENT,
+    FRET_UPDATE,
+    MOBILE_USER_AGENT,
+    messages_of_type,
+)
+
+
+async def eventually(check: Callable[[], bool], timeout: float = 2.0) -> None:
+    """Wait until a condition holds."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not check():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def start_worker(path: Path, node_id: str, **options: Any) -> ConnectionManager:
+    """Start a ConnectionManager as if it ran in its own worker process."""
+    broker = UnixSocketBroker(str(path))
+    broker.node_id = node_id
+    options = {"presence_window": 0, "clock_sync_interval": 0, **options}
+    manager = ConnectionManager(broker=broker, **options)
+    await manager.start()
+    await eventually(lambda: broker._writer is not None)
+    return manager
+
+
+@pytest.fixture(autouse=True)
+def fast_reconnect(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(broker_module, "RECONNECT_DELAY", 0.01)
+
+
+def test_relay_and_presence_across_workers(tmp_path: Path):
+    async def main() -> None:
+        hub = await start_worker(tmp_path / "hub.sock", "a")
+        peer = await start_worker(tmp_path / "hub.sock", "b")
+        try:
+            assert hub.broker._server is not None
+            assert peer.broker._server is None
+
+            pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+            phone = FakeWebSocket(MOBILE_USER_AGENT, record=True)
+            await hub.connect(pc, room_id="ROOM01")
+            phone_id = await peer.connect(phone, room_id="ROOM01")
+            assert phone_id.startswith("client_b_")
+
+            await eventually(lambda: bool(messages_of_type(pc, "presence")))
+            joined = [c for m in messages_of_type(pc, "presence") for c in m.get("joined", [])]
+            assert {"client_id": phone_id, "device_type": "mobile"} in joined
+
+            await peer.handle_raw(phone, FRET_UPDATE)
+            await eventually(lambda: bool(messages_of_type(pc, "FRET_UPDATE")))
+            [fret] = messages_of_type(pc, "FRET_UPDATE")
+            assert fret["payload"] == [0, 2, 2, 1, 0, 0]
+            assert fret["seq"] == 1
+            # Not echoed back to the sending worker
+            await asyncio.sleep(0.05)
+            assert messages_of_type(phone, "FRET_UPDATE") == []
+        finally:
+            await peer.stop()
+            await hub.stop()
+
+    asyncio.run(main())
+
+
+def test_peer_takes_over_the_hub(tmp_path: Path):
+    async def main() -> None:
+        path = tmp_path / "hub.sock"
+        hub = await start_worker(path, "a")
+        first = await start_worker(path, "b")
+        second = await start_worker(path, "c")
+        try:
+            # The hub's worker dies, releasing the lock
+            await hub.stop()
+            await eventually(
+                lambda: (first.broker._server is None) != (second.broker._server is None)
+            )
+            new_hub = first.broker if first.broker._server is not None else second.broker
+            await eventually(lambda: len(new_hub._peers) == 2)
+
+            pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+            phone = FakeWebSocket(MOBILE_USER_AGENT)
+            await first.connect(pc, room_id="ROOM01")
+            await second.connect(phone, room_id="ROOM01")
+            await second.handle_raw(phone, FRET_UPDATE)
+            await eventually(lambda: bool(messages_of_type(pc, "FRET_UPDATE")))
+        finally:
+            await second.stop()
+            await first.stop()
+
+    asyncio.run(main())
+
+
+def test_remote_client_gone_within_a_window_is_forgotten(tmp_path: Path):
+    async def main() -> None:
+        hub = await start_worker(tmp_path / "hub.sock", "a", presence_window=0.05)
+        peer = await start_worker(tmp_path / "hub.sock", "b", presence_window=0.05)
+        try:
+            pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+            await hub.connect(pc, room_id="ROOM01")
+            await asyncio.sleep(0.1)
+            presence_frames = len(messages_of_type(pc, "presence"))
+
+            phone = FakeWebSocket(MOBILE_USER_AGENT)
+            await peer.connect(phone, room_id="ROOM01")
+            await peer.handle_raw(phone, FRET_UPDATE)
+            await eventually(lambda: len(hub.sequences) == 1)
+
+            # Joined and left within one presence window
+            await peer.disconnect(phone, resumable=False)
+            await eventually(lambda: len(hub.sequences) == 0)
+            assert len(messages_of_type(pc, "presence")) == presence_frames
+        finally:
+            await peer.stop()
+            await hub.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+"""JSON codec selection and backends."""
+
+import sys
+
+import pytest
+
+from server.python import codec as codec_module
+from server.python.codec import CODECS, CodecJSONResponse, create_codec
+
+MESSAGE = {"type": "chord_change", "chord": "Ré", "frets": [None, 0, 2], "velocity": 0.5}
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_codecs_round_trip(name: str):
+    if name != "json":
+        pytest.importorskip(name)
+    codec = create_codec(name)
+    assert codec.name == name
+
+    text = codec.dumps(MESSAGE)
+    assert " " not in text  # Compact separators
+    assert codec.loads(text) == MESSAGE
+    assert codec.loads(codec.dumps_bytes(MESSAGE)) == MESSAGE
+    with pytest.raises(ValueError):
+        codec.loads('{"type":')
+
+
+def test_auto_falls_back_in_order(monkeypatch: pytest.MonkeyPatch):
+    pytest.importorskip("orjson")
+    pytest.importorskip("msgspec")
+    assert create_codec("auto").name == "orjson"
+
+    # A None entry makes the import raise ImportError
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    assert create_codec("auto").name == "msgspec"
+
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    assert create_codec("AUTO").name == "json"
+
+
+def test_missing_or_unknown_codec_uses_json(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    assert create_codec("msgspec").name == "json"
+    assert create_codec("simdjson").name == "json"
+
+
+def test_response_uses_the_configured_codec(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(codec_module, "_codec", create_codec("json"))
+    response = CodecJSONResponse({"status": "ok", "devices": ["émulateur"]})
+
+    assert response.body == '{"status":"ok","devices":["émulateur"]}'.encode()
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["content-length"] == str(len(response.body))
@@ -0,0 +1,126 @@
+"""Screen mirroring: H.264 splitting and fan-out to viewers."""
+
+import asyncio
+from typing import Awaitable, Callable
+
+import pytest
+
+from server.python import mirror
+from server.python.adb import ADBManager
+from server.python.adb_client import ADBClient
+from server.python.mirror import CODEC_H264, CODEC_PNG, AnnexBSplitter, MirrorHub, nal_type
+from tests.fakes import FakeADBServer, FakeWebSocket
+from tests.test_screencap import raw_frame
+
+SERIAL = "emulator-5554"
+
+SPS = b"\x00\x00\x00\x01\x67\x42\x00\x1f"
+PPS = b"\x00\x00\x00\x01\x68\xce\x3c\x80"
+IDR = b"\x00\x00\x00\x01\x65\x88\x84\x00\x21"
+SLICE = b"\x00\x00\x00\x01\x41\x9a\x02"
+STREAM = SPS + PPS + IDR + SLICE
+
+
+class Device:
+    """Shell handler running screenrecord and screencap."""
+
+    def __init__(self, screenrecord: bytes) -> None:
+        self.screenrecord = screenrecord
+        self.commands: list[str] = []
+
+    def __call__(self, serial: str, command: str) -> tuple[bytes, bytes, int]:
+        self.commands.append(command)
+        if command.startswith("screenrecord"):
+            return self.screenrecord, b"", 0
+        return raw_frame(4, 4), b"", 0
+
+
+def run_with_hub(
+    scenario: Callable[[MirrorHub, Device], Awaitable[None]], screenrecord: bytes
+) -> None:
+    """Run a scenario against a mirror hub on a fake ADB server."""
+
+    async def main() -> None:
+        device = Device(screenrecord)
+        fake = FakeADBServer(shell=device)
+        client = ADBClient("127.0.0.1", await fake.start())
+        adb = ADBManager(adb_path="/nonexistent/adb", client=client)
+        hub = MirrorHub(adb)
+        try:
+            await scenario(hub, device)
+        finally:
+            await hub.close()
+            await adb.close()
+            await fake.stop()
+
+    asyncio.run(main())
+
+
+async def eventually(check: Callable[[], bool], timeout: float = 2.0) -> None:
+    """Wait until a condition holds."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not check():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def no_restarts(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Keep screenrecord from being restarted while a test runs
+    monkeypatch.setattr(mirror, "MIN_RECORD_SECONDS", 60.0)
+
+
+def test_splitter_handles_split_start_codes():
+    splitter = AnnexBSplitter()
+    # 3-byte start code for the PPS, and chunks cut inside start codes
+    stream = SPS + b"\x00\x00\x01" + PPS[4:] + IDR + SLICE
+    nals = []
+    for chunk in (stream[:6], stream[6:10], stream[10:20], stream[20:]):
+        nals += splitter.feed(chunk)
+    nals += splitter.flush()
+
+    assert nals == [SPS, PPS, IDR, SLICE]
+    assert [nal_type(nal) for nal in nals] == [7, 8, 5, 1]
+    assert splitter.flush() == []
+
+
+def test_viewers_share_one_stream():
+    async def scenario(hub: MirrorHub, device: Device) -> None:
+        viewers = [FakeWebSocket(record=True) for _ in range(2)]
+        watches = [asyncio.create_task(hub.watch(viewer, SERIAL)) for viewer in viewers]
+        await eventually(lambda: all(len(viewer.sent) == 5 for viewer in viewers))
+
+        for viewer in viewers:
+            [announcement] = viewer.sent_messages()
+            assert announcement == {"type": "mirror", "device_id": SERIAL, "codec": CODEC_H264}
+            assert viewer.sent[1:] == [SPS, PPS, IDR, SLICE]
+        assert [c for c in device.commands if c.startswith("screenrecord")] == [
+            device.commands[0]
+        ]
+        session = hub.sessions[SERIAL]
+
+        # The session outlives its first viewer, not its last
+        viewers[0].disconnect()
+        await watches[0]
+        assert hub.sessions == {SERIAL: session}
+        viewers[1].disconnect()
+        await watches[1]
+        assert hub.sessions == {}
+        assert session.viewers == set()
+        assert session._task is None
+
+    run_with_hub(scenario, STREAM)
+
+
+def test_screencap_fallback():
+    async def scenario(hub: MirrorHub, device: Device) -> None:
+        viewer = FakeWebSocket(record=True)
+        watch = asyncio.create_task(hub.watch(viewer, SERIAL))
+        await eventually(lambda: len(viewer.sent) >= 2)
+
+        assert viewer.sent_messages()[0]["codec"] == CODEC_PNG
+        assert viewer.sent[1].startswith(b"\x89PNG")
+        viewer.disconnect()
+        await watch
+
+    run_with_hub(scenario, b"Unknown option: --output-format\n")
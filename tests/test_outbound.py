@@ -0,0 +1,122 @@
+"""OutboundQueue lanes, eviction and conflation."""
+
+import pytest
+
+from server.python.metrics import RelayMetrics, RelayTrace
+from server.python.outbound import (
+    CONFLATE,
+    DISCONNECT,
+    DROP_OLDEST,
+    MAX_LANE_SKIPS,
+    PRIORITY_BULK,
+    PRIORITY_CRITICAL,
+    PRIORITY_NORMAL,
+    OutboundFrame,
+    OutboundQueue,
+)
+
+
+def frame(data: str, priority: int = PRIORITY_NORMAL, key: str | None = None) -> OutboundFrame:
+    return OutboundFrame(data, key=key, priority=priority)
+
+
+def drain(queue: OutboundQueue) -> list[str]:
+    sent = []
+    while (next_frame := queue.get_nowait()) is not None:
+        sent.append(next_frame.data)
+    return sent
+
+
+def test_lanes_are_drained_in_priority_order():
+    queue = OutboundQueue(maxsize=16)
+    queue.put(frame("b1", PRIORITY_BULK))
+    queue.put(frame("n1"))
+    queue.put(frame("c1", PRIORITY_CRITICAL))
+    queue.put(frame("n2"))
+    queue.put(frame("c2", PRIORITY_CRITICAL))
+
+    assert drain(queue) == ["c1", "c2", "n1", "n2", "b1"]
+
+
+def test_waiting_lane_is_served_after_max_lane_skips():
+    queue = OutboundQueue(maxsize=64)
+    queue.put(frame("b", PRIORITY_BULK))
+    for i in range(MAX_LANE_SKIPS + 2):
+        queue.put(frame(f"c{i}", PRIORITY_CRITICAL))
+
+    sent = drain(queue)
+    assert sent.index("b") == MAX_LANE_SKIPS
+    assert [data for data in sent if data != "b"] == [f"c{i}" for i in range(MAX_LANE_SKIPS + 2)]
+
+
+@pytest.mark.parametrize("policy", [DROP_OLDEST, CONFLATE])
+def test_full_queue_never_evicts_higher_priority_frames(policy: str):
+    queue = OutboundQueue(maxsize=3, policy=policy)
+    for i in range(3):
+        assert queue.put(frame(f"c{i}", PRIORITY_CRITICAL, key=f"k{i}"))
+
+    assert not queue.put(frame("bulk", PRIORITY_BULK))
+    assert queue.dropped == 1
+    assert drain(queue) == ["c0", "c1", "c2"]
+
+
+@pytest.mark.parametrize("policy", [DROP_OLDEST, CONFLATE])
+def test_full_queue_evicts_from_lowest_lane(policy: str):
+    queue = OutboundQueue(maxsize=3, policy=policy)
+    queue.put(frame("c0", PRIORITY_CRITICAL, key="c"))
+    queue.put(frame("b0", PRIORITY_BULK))
+    queue.put(frame("n0"))
+
+    assert queue.put(frame("c1", PRIORITY_CRITICAL))
+    assert drain(queue) == ["c0", "c1", "n0"]
+
+
+def test_conflate_policy_prefers_state_frames_of_the_lowest_lane():
+    queue = OutboundQueue(maxsize=3, policy=CONFLATE)
+    queue.put(frame("c-state", PRIORITY_CRITICAL, key="c"))
+    queue.put(frame("n-event"))
+    queue.put(frame("n-state", key="n"))
+
+    assert queue.put(frame("n-new"))
+    assert drain(queue) == ["c-state", "n-event", "n-new"]
+
+
+def test_disconnect_policy_refuses_frames():
+    queue = OutboundQueue(maxsize=1, policy=DISCONNECT)
+    assert queue.put(frame("a"))
+    assert not queue.put(frame("b", PRIORITY_CRITICAL))
+    assert queue.dropped == 0
+    assert drain(queue) == ["a"]
+
+
+def test_evicted_frames_release_their_trace():
+    metrics = RelayMetrics()
+    queue = OutboundQueue(maxsize=1, metrics=metrics)
+    trace = RelayTrace(received_at=0.0, remaining=2)
+    trace.last_sent_at = 0.5  # Already sent to the other receiver
+    queue.put(OutboundFrame("old", trace=trace))
+
+    queue.put(frame("new"))
+    assert trace.remaining == 1
+    assert metrics.frames_dropped == 1
+
+
+def test_state_frames_are_replaced_in_place():
+    metrics = RelayMetrics()
+    queue = OutboundQueue(maxsize=16, metrics=metrics)
+    replaced = RelayTrace(received_at=0.0, remaining=1)
+    queue.put(OutboundFrame("frets-1", key="frets", trace=replaced))
+    queue.put(frame("strum"))
+    queue.put(frame("frets-2", key="frets"))
+    queue.put(frame("frets-3", key="frets"))
+
+    assert len(queue) == 2
+    assert queue.conflated == 2
+    assert metrics.frames_conflated == 2
+    assert replaced.remaining == 0
+    # The newest state keeps the position of the first pending frame
+    assert drain(queue) == ["frets-3", "strum"]
+
+    # Once sent, the key starts a new frame
+    queue.put(frame("frets-4", key="frets"))
+    assert drain(queue) == ["frets-4"]
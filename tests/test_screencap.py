@@ -0,0 +1,164 @@
+"""Raw frame parsing, downscaling, PNG encoding and capture coalescing."""
+
+import asyncio
+import struct
+import zlib
+from typing import AsyncIterator
+
+import pytest
+
+from server.python.screencap import (
+    FORMAT_RAW,
+    PIXEL_FORMAT_RGBA_8888,
+    PIXEL_FORMAT_RGBX_8888,
+    ScreenCapturer,
+    downscale,
+    encode_png,
+    parse_raw_frame,
+)
+
+
+def raw_frame(
+    width: int, height: int, pixel_format: int = 1, color_space: int | None = None
+) -> bytes:
+    """Build screencap output whose pixel at (x, y) is bytes (x, y, x + y, 255)."""
+    if color_space is None:
+        header = struct.pack("<III", width, height, pixel_format)
+    else:
+        header = struct.pack("<IIII", width, height, pixel_format, color_space)
+    pixels = bytes(
+        value for y in range(height) for x in range(width) for value in (x, y, x + y, 255)
+    )
+    return header + pixels
+
+
+def png_chunks(png: bytes) -> dict[bytes, bytes]:
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    chunks = {}
+    offset = 8
+    while offset < len(png):
+        (length,) = struct.unpack_from(">I", png, offset)
+        chunk_type = png[offset + 4 : offset + 8]
+        data = png[offset + 8 : offset + 8 + length]
+        (crc,) = struct.unpack_from(">I", png, offset + 8 + length)
+        assert crc == zlib.crc32(chunk_type + data)
+        chunks[chunk_type] = data
+        offset += 12 + length
+    return chunks
+
+
+@pytest.mark.parametrize("color_space", [None, 1])
+def test_parse_raw_frame(color_space: int | None):
+    frame = parse_raw_frame(raw_frame(3, 2, PIXEL_FORMAT_RGBX_8888, color_space))
+
+    assert (frame.width, frame.height, frame.pixel_format) == (3, 2, PIXEL_FORMAT_RGBX_8888)
+    assert frame.color_space == color_space
+    assert frame.pixels[:8].tobytes() == bytes([0, 0, 0, 255, 1, 0, 1, 255])
+    header = frame.header()
+    assert header == raw_frame(3, 2, PIXEL_FORMAT_RGBX_8888, color_space)[: len(header)]
+
+
+def test_parse_raw_frame_rejects_other_data():
+    with pytest.raises(ValueError):
+        parse_raw_frame(b"\x89PNG\r\n\x1a\n" + bytes(100))
+    with pytest.raises(ValueError):
+        parse_raw_frame(raw_frame(3, 2)[:-1])
+
+
+def test_downscale_keeps_every_nth_pixel():
+    frame = parse_raw_frame(raw_frame(5, 3))
+    assert downscale(frame, 1) is frame
+
+    small = downscale(frame, 2)
+    assert (small.width, small.height) == (3, 2)
+    pixels = small.pixels.tobytes()
+    assert [tuple(pixels[i : i + 2]) for i in range(0, len(pixels), 4)] == [
+        (0, 0),
+        (2, 0),
+        (4, 0),
+        (0, 2),
+        (2, 2),
+        (4, 2),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("pixel_format", "color_type", "channels"),
+    [(PIXEL_FORMAT_RGBA_8888, 6, 4), (PIXEL_FORMAT_RGBX_8888, 2, 3)],
+)
+def test_encode_png(pixel_format: int, color_type: int, channels: int):
+    frame = parse_raw_frame(raw_frame(3, 2, pixel_format))
+    chunks = png_chunks(encode_png(frame))
+
+    assert chunks[b"IHDR"] == struct.pack(">IIBBBBB", 3, 2, 8, color_type, 0, 0, 0)
+    assert chunks[b"IEND"] == b""
+    rows = zlib.decompress(chunks[b"IDAT"])
+    stride = 3 * channels
+    assert len(rows) == 2 * (1 + stride)
+    assert rows[0] == 0  # Filter type
+    assert rows[1 : 1 + stride] == bytes(
+        value for x in range(3) for value in (x, 0, x, 255)[:channels]
+    )
+
+
+def test_encode_png_rejects_other_pixel_formats():
+    with pytest.raises(ValueError):
+        encode_png(parse_raw_frame(raw_frame(1, 1, pixel_format=4)))
+
+
+def test_concurrent_captures_share_one_run():
+    async def main() -> None:
+        release = asyncio.Event()
+        commands: list[str] = []
+        frame = raw_frame(4, 4)
+
+        async def source(device_id: str, command: str) -> AsyncIterator[bytes]:
+            commands.append(command)
+            yield frame[:10]
+            await release.wait()
+            yield frame[10:]
+
+        capturer = ScreenCapturer(source)
+
+        async def read(**options) -> bytes:
+            return b"".join([chunk async for chunk in capturer.capture("emulator-5554", **options)])
+
+        first = asyncio.create_task(read(fmt=FORMAT_RAW))
+        await asyncio.sleep(0.01)
+        # Joins after the first chunk arrived: replays it, then follows
+        late = asyncio.create_task(read(fmt=FORMAT_RAW))
+        scaled = asyncio.create_task(read(fmt=FORMAT_RAW, scale=2))
+        await asyncio.sleep(0.01)
+        release.set()
+
+        assert await first == frame
+        assert await late == frame
+        assert parse_raw_frame(await scaled).width == 2
+        assert commands == ["screencap"]
+        assert (capturer.captures, capturer.coalesced) == (1, 2)
+
+        # Finished runs are not joined
+        assert await read(fmt=FORMAT_RAW) == frame
+        assert capturer.captures == 2
+        await capturer.close()
+
+    asyncio.run(main())
+
+
+def test_capture_errors_reach_every_requester():
+    async def main() -> None:
+        async def source(device_id: str, command: str) -> AsyncIterator[bytes]:
+            yield b"partial"
+            await asyncio.sleep(0.01)
+            raise ConnectionResetError("device gone")
+
+        capturer = ScreenCapturer(source)
+
+        async def read() -> bytes:
+            return b"".join([chunk async for chunk in capturer.capture("emulator-5554")])
+
+        results = await asyncio.gather(read(), read(), return_exceptions=True)
+        assert [type(result) for result in results] == [ConnectionResetError] * 2
+        await capturer.close()
+
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Persistent shell sessions against FakeADBServer."""
+
+import asyncio
+from typing import Awaitable, Callable
+
+from server.python.adb import ADBManager
+from server.python.adb_client import ADBClient
+from server.python.shell_session import ShellSessions
+from tests.fakes import FakeADBServer
+
+SERIAL = "emulator-5554"
+
+
+class Device:
+    """Shell handler that records the commands it ran."""
+
+    def __init__(self) -> None:
+        self.commands: list[str] = []
+
+    def __call__(self, serial: str, command: str) -> tuple[bytes, bytes, int | None]:
+        self.commands.append(command)
+        if command == "crash":
+            # Starts writing, then the device goes away
+            return b"partial\n", b"", None
+        return command.encode() + b"\n", b"", 0
+
+
+def run_with_shells(
+    scenario: Callable[[FakeADBServer, ShellSessions, Device], Awaitable[None]],
+    **options,
+) -> None:
+    """Run a scenario against shell sessions on a fake ADB server."""
+
+    async def main() -> None:
+        device = Device()
+        fake = FakeADBServer(shell=device)
+        client = ADBClient("127.0.0.1", await fake.start())
+        shells = ShellSessions(client, **options)
+        try:
+            await scenario(fake, shells, device)
+        finally:
+            shells.close()
+            await client.close()
+            await fake.stop()
+
+    asyncio.run(main())
+
+
+def test_dead_idle_shell_is_replaced():
+    async def scenario(fake: FakeADBServer, shells: ShellSessions, device: Device) -> None:
+        assert await shells.run(SERIAL, "first") == (b"first\n", b"", 0)
+        await fake.kill_shells()
+        await asyncio.sleep(0.01)
+
+        assert await shells.run(SERIAL, "second") == (b"second\n", b"", 0)
+        assert device.commands == ["first", "second"]
+        assert shells.devices[SERIAL].spawned == 2
+
+    run_with_shells(scenario)
+
+
+def test_shell_lost_after_output_is_not_retried():
+    async def main() -> None:
+        device = Device()
+        fake = FakeADBServer(shell=device)
+        client = ADBClient("127.0.0.1", await fake.start())
+        adb = ADBManager(adb_path="/nonexistent/adb", client=client)
+        try:
+            # A reused shell, so a silent death would be retried
+            assert await adb.shell_command(SERIAL, "warm up") == ("warm up\n", "", 0)
+
+            stdout, stderr, code = await adb.shell_command(SERIAL, "crash")
+            assert (stdout, code) == ("", 1)
+            assert "Shell session lost" in stderr
+            # Not run again on a new shell, nor through the adb executable
+            assert device.commands == ["warm up", "crash"]
+
+            assert await adb.shell_command(SERIAL, "after") == ("after\n", "", 0)
+        finally:
+            await adb.close()
+            await fake.stop()
+
+    asyncio.run(main())
+
+
+def test_idle_shells_expire():
+    async def scenario(fake: FakeADBServer, shells: ShellSessions, device: Device) -> None:
+        await shells.run(SERIAL, "x")
+        pool = shells.devices[SERIAL]
+        assert pool.sessions == 1
+
+        await asyncio.sleep(0.1)
+        assert pool.sessions == 0
+
+        await shells.run(SERIAL, "y")
+        assert pool.spawned == 2
+
+    run_with_shells(scenario, idle_timeout=0.05)
+
+
+def test_commands_wait_for_a_free_shell():
+    async def scenario(fake: FakeADBServer, shells: ShellSessions, device: Device) -> None:
+        results = await asyncio.gather(*(shells.run(SERIAL, f"echo {i}") for i in range(6)))
+
+        assert results == [(f"echo {i}\n".encode(), b"", 0) for i in range(6)]
+        pool = shells.devices[SERIAL]
+        assert pool.spawned == 2
+        assert pool.sessions == 2
+
+    run_with_shells(scenario, max_sessions=2)
@@ -0,0 +1,468 @@
+"""ConnectionManager against FakeWebSocket clients."""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable
+
+from server.python.presence import PRESENCE_COUNTS
+from server.python.websocket import ConnectionManager
+from server.python.wire import BINARY_SUBPROTOCOL, decode_frame, encode_frame
+from tests.fakes import FakeWebSocket
+
+MOBILE_USER_AGENT = "Mozilla/5.0 (Linux; Android 14) Mobile"
+DESKTOP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+
+FRET_UPDATE = '{"type":"FRET_UPDATE","payload":[0,2,2,1,0,0]}'
+
+
+def run_with_manager(
+    scenario: Callable[[ConnectionManager], Awaitable[None]], **options: Any
+) -> None:
+    """Run a scenario against a started ConnectionManager."""
+
+    async def main() -> None:
+        manager = ConnectionManager(**{"presence_window": 0, "clock_sync_interval": 0, **options})
+        await manager.start()
+        try:
+            await scenario(manager)
+        finally:
+            await manager.disconnect_all()
+            await manager.stop()
+
+    asyncio.run(main())
+
+
+async def settle() -> None:
+    """Let the writer tasks drain their queues into the fake sockets."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def messages_of_type(websocket: FakeWebSocket, message_type: str) -> list[dict[str, Any]]:
+    messages = []
+    for sent in websocket.sent_messages():
+        # Batched messages arrive as a JSON array
+        messages.extend(sent if isinstance(sent, list) else [sent])
+    return [m for m in messages if m.get("type") == message_type]
+
+
+def test_relay_mobile_to_pc():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT, record=True)
+        await manager.connect(pc, room_id="ROOM01")
+        await manager.connect(phone, room_id="ROOM01")
+
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await manager.handle_raw(phone, '{"type":"ping"}')
+        await settle()
+
+        [fret] = messages_of_type(pc, "FRET_UPDATE")
+        assert fret["payload"] == [0, 2, 2, 1, 0, 0]
+        assert fret["seq"] == 1
+        assert messages_of_type(phone, "FRET_UPDATE") == []
+        assert len(messages_of_type(phone, "pong")) == 1
+        assert messages_of_type(pc, "pong") == []
+
+    run_with_manager(scenario)
+
+
+def test_rooms_are_isolated():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        other_pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01")
+        await manager.connect(other_pc, room_id="ROOM02")
+        await manager.connect(phone, room_id="ROOM01")
+
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await settle()
+
+        assert len(messages_of_type(pc, "FRET_UPDATE")) == 1
+        assert messages_of_type(other_pc, "FRET_UPDATE") == []
+
+    run_with_manager(scenario)
+
+
+def test_presence_on_leave():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01")
+        phone_id = await manager.connect(phone, room_id="ROOM01")
+        await settle()
+
+        await manager.disconnect(phone, resumable=False)
+        await settle()
+
+        presence = messages_of_type(pc, "presence")[-1]
+        assert presence["left"] == [{"client_id": phone_id, "device_type": "mobile"}]
+        assert presence["counts"] == {"mobile": 0, "pc": 1}
+
+    run_with_manager(scenario)
+
+
+def test_resume_takes_over_the_session_once():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT, record=True)
+        await manager.connect(pc, room_id="ROOM01")
+        phone_id = await manager.connect(phone, room_id="ROOM01")
+        await settle()
+        [connected] = messages_of_type(phone, "connected")
+
+        await manager.disconnect(phone)
+        await manager.handle_raw(pc, '{"type":"chord_change","chord":"Am"}')
+
+        resumed = FakeWebSocket(MOBILE_USER_AGENT, record=True)
+        assert (
+            await manager.connect(
+                resumed, room_id="ROOM01", resume_token=connected["resume_token"]
+            )
+            == phone_id
+        )
+        await settle()
+        assert messages_of_type(resumed, "connected")[0]["resumed"] is True
+        assert len(messages_of_type(resumed, "chord_change")) == 1
+
+        # The resume superseded the first token
+        await manager.disconnect(resumed)
+        again = FakeWebSocket(MOBILE_USER_AGENT)
+        assert (
+            await manager.connect(again, room_id="ROOM01", resume_token=connected["resume_token"])
+            != phone_id
+        )
+
+    run_with_manager(scenario, resume_grace=10)
+
+
+def test_relay_latency_ignores_parked_receivers():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT)
+        parked_pc = FakeWebSocket(DESKTOP_USER_AGENT)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        for websocket in (pc, parked_pc, phone):
+            await manager.connect(websocket, room_id="ROOM01")
+
+        # Queued before and after the PC dropped
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await manager.disconnect(parked_pc)
+        await manager.handle_raw(phone, '{"type":"STRUM_EVENT","payload":{"velocity":0.8}}')
+        await settle()
+
+        assert manager.metrics.relay_latency.count == 2
+        assert manager.metrics.delivery_latency.count == 2
+
+    run_with_manager(scenario, resume_grace=10)
+
+
+def test_batches_skip_invalid_frames():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01", batch=True)
+        await manager.connect(phone, room_id="ROOM01")
+        await asyncio.sleep(0.05)
+        sent = len(pc.sent)
+
+        for frame in ('{"type":"note_a"}', '{"type":"STRUM_EVENT",', "not json", '{"type":"note_b"}'):
+            await manager.handle_raw(phone, frame)
+        await asyncio.sleep(0.05)
+
+        frames = pc.sent[sent:]
+        assert '{"type":"STRUM_EVENT",' in frames
+        assert "not json" in frames
+        valid = [frame for frame in frames if frame not in ('{"type":"STRUM_EVENT",', "not json")]
+        relayed = []
+        for frame in valid:
+            decoded = json.loads(frame)
+            relayed.extend(decoded if isinstance(decoded, list) else [decoded])
+        assert [m["type"] for m in relayed] == ["note_a", "note_b"]
+
+    run_with_manager(scenario, batch_window=0.01)
+
+
+def test_frames_are_counted_once():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01")
+        await manager.connect(phone, room_id="ROOM01")
+
+        await manager.handle_raw(phone, '{"type":"ping"}')
+        # A nested "type" is seen first, but the frame is a relayed note
+        await manager.handle_raw(phone, '{"payload":{"type":"ping"},"type":"note"}')
+        await settle()
+
+        assert manager.metrics.messages_in == {"ping": 1, "note": 1}
+        assert len(messages_of_type(pc, "note")) == 1
+
+        # The parsed path counts the same frames
+        await manager.handle_message(phone, {"type": "ping"}, 15)
+        await manager.handle_message(phone, {"type": "note"})
+        assert manager.metrics.messages_in == {"ping": 2, "note": 2}
+        assert manager.metrics.bytes_in["ping"] == 30
+
+    run_with_manager(scenario)
+
+
+def test_binary_frames_of_unknown_kinds_are_forwarded_unchanged():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, subprotocols=[BINARY_SUBPROTOCOL], record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT, subprotocols=[BINARY_SUBPROTOCOL])
+        await manager.connect(pc, room_id="ROOM01")
+        await manager.connect(phone, room_id="ROOM01")
+
+        private = bytes([9, 0]) + bytes(range(2, 20))
+        fret = encode_frame({"type": "FRET_UPDATE", "payload": [0, 2, 2, 1, 0, 0]})
+        await manager.handle_raw(phone, private)
+        await manager.handle_raw(phone, fret)
+        await settle()
+
+        binary = [frame for frame in pc.sent if isinstance(frame, bytes)]
+        assert private in binary
+        [stamped] = [decode_frame(frame) for frame in binary if frame != private]
+        assert stamped["seq"] == 1  # The unknown frame took no sequence number
+        assert "srv_ts" in stamped
+
+    run_with_manager(scenario)
+
+
+def test_binary_frames_reach_json_clients_as_json():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT, subprotocols=[BINARY_SUBPROTOCOL])
+        await manager.connect(pc, room_id="ROOM01")
+        await manager.connect(phone, room_id="ROOM01")
+
+        await manager.handle_raw(
+            phone, encode_frame({"type": "chord_change", "chord": "G", "frets": [3, 2, 0, 0, 0, 3]})
+        )
+        await settle()
+
+        [chord] = messages_of_type(pc, "chord_change")
+        assert chord["chord"] == "G"
+        assert chord["frets"] == [3, 2, 0, 0, 0, 3]
+        assert chord["seq"] == 1
+        assert "srv_ts" in chord
+
+    run_with_manager(scenario)
+
+
+def test_json_frames_reach_binary_clients_as_binary():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, subprotocols=[BINARY_SUBPROTOCOL], record=True)
+        json_pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        for websocket in (pc, json_pc, phone):
+            await manager.connect(websocket, room_id="ROOM01")
+
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await manager.handle_raw(phone, '{"type":"STRUM_EVENT","payload":{"velocity":0.8}}')
+        await settle()
+
+        [frame] = [frame for frame in pc.sent if isinstance(frame, bytes)]
+        fret = decode_frame(frame)
+        assert fret["payload"] == [0, 2, 2, 1, 0, 0]
+        assert fret["seq"] == 1
+        # No binary encoding: delivered as JSON
+        assert len(messages_of_type(pc, "STRUM_EVENT")) == 1
+        # The JSON receiver of the same frame is unaffected
+        assert messages_of_type(json_pc, "FRET_UPDATE")[0]["seq"] == 1
+
+    run_with_manager(scenario)
+
+
+def test_stalled_receiver_is_evicted():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        stalled = FakeWebSocket(DESKTOP_USER_AGENT, send_delay=10)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01")
+        stalled_id = await manager.connect(stalled, room_id="ROOM01")
+        await manager.connect(phone, room_id="ROOM01")
+        connection = manager.get_connection(stalled)
+        token = manager.resume_tokens.issue(stalled_id, "ROOM01", connection.resume_nonce)
+
+        # The stalled send does not hold up the other receiver
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await settle()
+        assert len(messages_of_type(pc, "FRET_UPDATE")) == 1
+
+        await asyncio.sleep(0.2)
+        assert stalled.close_code == 1013
+        assert manager.get_connection(stalled) is None
+        assert manager.metrics.disconnects == {"slow_consumer": 1}
+        [presence] = [m for m in messages_of_type(pc, "presence") if m.get("left")]
+        assert presence["left"][0]["client_id"] == stalled_id
+
+        # The endpoint's own disconnect does not park an evicted client
+        await manager.disconnect(stalled)
+        resumed = FakeWebSocket(DESKTOP_USER_AGENT)
+        assert await manager.connect(resumed, room_id="ROOM01", resume_token=token) != stalled_id
+
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await settle()
+        assert len(messages_of_type(pc, "FRET_UPDATE")) == 2
+
+    run_with_manager(
+        scenario, evict_slow_consumers=True, slow_send_timeout=0.05, resume_grace=10
+    )
+
+
+def test_expired_frames_are_not_sent():
+    async def scenario(manager: ConnectionManager) -> None:
+        # Busy sending its "connected" frame while the chord change waits
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True, send_delay=0.05)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01")
+        await manager.connect(phone, room_id="ROOM01")
+        await settle()
+
+        await manager.handle_raw(phone, '{"type":"chord_change","chord":"Am"}')
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await asyncio.sleep(0.2)
+
+        assert messages_of_type(pc, "chord_change") == []
+        assert len(messages_of_type(pc, "FRET_UPDATE")) == 1
+        assert manager.metrics.frames_expired == {"chord_change": 1}
+        assert manager.metrics.relay_latency.count == 1
+
+    run_with_manager(scenario, message_ttl={"chord_change": 0.01})
+
+
+def test_snapshot_on_join():
+    async def scenario(manager: ConnectionManager) -> None:
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(phone, room_id="ROOM01")
+        await manager.handle_raw(phone, '{"type":"chord_change","chord":"Em","frets":[0,2,2,0,0,0]}')
+        await manager.handle_raw(phone, FRET_UPDATE)
+        await manager.handle_raw(phone, '{"type":"note"}')
+
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        await manager.connect(pc, room_id="ROOM01")
+        other_room = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        await manager.connect(other_room, room_id="ROOM02")
+        await settle()
+
+        [snapshot] = messages_of_type(pc, "snapshot")
+        assert snapshot["room_id"] == "ROOM01"
+        assert snapshot["chord"] == "Em"
+        assert snapshot["frets"] == [0, 2, 2, 0, 0, 0]
+        assert snapshot["fret_states"] == [0, 2, 2, 1, 0, 0]
+        assert [frame["type"] for frame in snapshot["frames"]] == ["chord_change", "FRET_UPDATE"]
+        assert messages_of_type(other_room, "snapshot") == []
+
+    run_with_manager(scenario, snapshot_types=frozenset({"chord_change", "FRET_UPDATE"}))
+
+
+def test_presence_is_batched_per_window():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        await manager.connect(pc, room_id="ROOM01")
+        await asyncio.sleep(0.1)
+        assert len(messages_of_type(pc, "presence")) == 1
+
+        phones = [FakeWebSocket(MOBILE_USER_AGENT) for _ in range(5)]
+        phone_ids = [await manager.connect(phone, room_id="ROOM01") for phone in phones]
+        await settle()
+        assert len(messages_of_type(pc, "presence")) == 1
+        await asyncio.sleep(0.1)
+
+        [presence] = messages_of_type(pc, "presence")[1:]
+        assert [client["client_id"] for client in presence["joined"]] == phone_ids
+        assert presence["left"] == []
+        assert presence["counts"] == {"mobile": 5, "pc": 1}
+
+    run_with_manager(scenario, presence_window=0.05)
+
+
+def test_join_and_leave_within_a_window_cancel_out():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        await manager.connect(pc, room_id="ROOM01")
+        await asyncio.sleep(0.1)
+        presence_frames = len(messages_of_type(pc, "presence"))
+
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(phone, room_id="ROOM01")
+        await manager.handle_raw(phone, '{"type":"FRET_UPDATE","payload":[0,0,0,0,0,0],"seq":1}')
+        await manager.disconnect(phone, resumable=False)
+        await asyncio.sleep(0.1)
+
+        assert len(messages_of_type(pc, "presence")) == presence_frames
+        assert len(manager.sequences) == 0
+
+    run_with_manager(scenario, presence_window=0.05)
+
+
+def test_presence_counts_mode():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        await manager.connect(pc, room_id="ROOM01", presence=PRESENCE_COUNTS)
+        await manager.connect(FakeWebSocket(MOBILE_USER_AGENT), room_id="ROOM01")
+        await settle()
+
+        assert messages_of_type(pc, "presence")[-1] == {
+            "type": "presence",
+            "room_id": "ROOM01",
+            "counts": {"mobile": 1, "pc": 1},
+        }
+
+    run_with_manager(scenario)
+
+
+
+async def open_batching_window(manager: ConnectionManager, phone: FakeWebSocket) -> None:
+    """Relay frames that arrive together, so the receivers' batching wait opens."""
+    await asyncio.sleep(0.2)
+    for i in range(3):
+        await manager.handle_raw(phone, f'{{"type":"note","n":{i}}}')
+    await asyncio.sleep(0.2)
+
+
+def test_pong_cuts_the_batching_wait_short():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT, record=True)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01", batch=True)
+        await manager.connect(phone, room_id="ROOM01")
+        await open_batching_window(manager, phone)
+
+        # Held for up to the batching window...
+        await manager.handle_raw(phone, '{"type":"note","n":3}')
+        await settle()
+        assert len(messages_of_type(pc, "note")) == 3
+        # ...unless a frame that must not wait arrives
+        await manager.handle_raw(pc, '{"type":"ping","t0":1}')
+        await settle()
+
+        assert len(messages_of_type(pc, "note")) == 4
+        assert len(messages_of_type(pc, "pong")) == 1
+
+    run_with_manager(scenario, batch_window=0.1)
+
+
+def test_writer_cancelled_in_the_batching_wait_releases_its_frame():
+    async def scenario(manager: ConnectionManager) -> None:
+        pc = FakeWebSocket(DESKTOP_USER_AGENT)
+        other_pc = FakeWebSocket(DESKTOP_USER_AGENT)
+        phone = FakeWebSocket(MOBILE_USER_AGENT)
+        await manager.connect(pc, room_id="ROOM01", batch=True)
+        await manager.connect(other_pc, room_id="ROOM01")
+        await manager.connect(phone, room_id="ROOM01")
+        await open_batching_window(manager, phone)
+        assert manager.metrics.relay_latency.count == 3
+
+        # Held in the batching wait when the PC drops; recorded once the
+        # other PC got it and the dropped one let it go
+        await manager.handle_raw(phone, '{"type":"note","n":3}')
+        await settle()
+        await manager.disconnect(pc)
+        await settle()
+
+        assert manager.metrics.relay_latency.count == 4
+        assert manager.metrics.delivery_latency.count == 7
+
+    run_with_manager(scenario, batch_window=0.1, resume_grace=10)
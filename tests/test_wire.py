@@ -0,0 +1,145 @@
+"""Binary wire format."""
+
+import json
+
+import pytest
+
+from server.python.wire import (
+    BINARY_SUBPROTOCOL,
+    FLAG_SERVER_TIME,
+    JSON_SUBPROTOCOL,
+    KIND_FRET_UPDATE,
+    WIRE_BINARY,
+    WIRE_JSON,
+    WireVariants,
+    decode_frame,
+    encode_frame,
+    negotiate_subprotocol,
+    stamp_frame,
+    wire_format_for,
+)
+
+FRET_UPDATE = {"type": "FRET_UPDATE", "payload": [0, 2, 2, 1, 0, 0], "seq": 0, "timestamp": 42}
+
+
+def test_stamp_sets_seq_and_server_time():
+    frame = encode_frame(FRET_UPDATE)
+    stamped = stamp_frame(frame, 1769947200123, seq=7)
+
+    assert stamped[0] == KIND_FRET_UPDATE
+    assert stamped[1] & FLAG_SERVER_TIME
+    decoded = decode_frame(stamped)
+    assert (decoded["seq"], decoded["srv_ts"]) == (7, 1769947200123)
+    assert decoded["payload"] == FRET_UPDATE["payload"]
+
+    # A second stamp replaces the trailer instead of appending another
+    assert decode_frame(stamp_frame(stamped, 5, seq=8))["srv_ts"] == 5
+    assert len(stamp_frame(stamped, 5, seq=8)) == len(stamped)
+
+
+def test_stamp_leaves_unknown_kinds_untouched():
+    frame = bytes([9, 0]) + bytes(range(2, 20))
+    assert stamp_frame(frame, 123, 7) == frame
+
+
+def test_fret_update_round_trip():
+    frame = encode_frame(
+        {"type": "FRET_UPDATE", "payload": [0, 3, -1, 2, 1, 0], "seq": 70000, "timestamp": 2**32 + 5}
+    )
+    assert len(frame) == 14
+
+    assert decode_frame(frame) == {
+        "type": "FRET_UPDATE",
+        "payload": [0, 3, -1, 2, 1, 0],
+        "seq": 70000 & 0xFFFF,  # u16, wraps
+        "timestamp": 5,  # u32, wraps
+    }
+
+
+def test_chord_change_round_trip():
+    message = {
+        "type": "chord_change",
+        "chord": "Am7",
+        "frets": [None, 0, 2, 0, 1, 0],
+        "seq": 3,
+        "timestamp": 1000,
+        "srv_ts": 1769947200123,
+    }
+    frame = encode_frame(message)
+    assert frame[14] == 3  # Chord name length
+    assert frame[15:18] == b"Am7"
+    assert frame[1] & FLAG_SERVER_TIME
+    assert len(frame) == 14 + 1 + 3 + 8
+
+    decoded = decode_frame(frame)
+    assert decoded["chord"] == "Am7"
+    assert decoded["frets"] == [None, 0, 2, 0, 1, 0]
+    assert decoded["srv_ts"] == 1769947200123
+    assert decoded["fingering"] == [
+        {"string": 5, "fret": 0},
+        {"string": 4, "fret": 2},
+        {"string": 3, "fret": 0},
+        {"string": 2, "fret": 1},
+        {"string": 1, "fret": 0},
+    ]
+
+
+def test_chord_change_frets_from_fingering():
+    frame = encode_frame(
+        {
+            "type": "chord_change",
+            "chord": "C",
+            "fingering": [{"string": 5, "fret": 3}, {"string": 4, "fret": 2}, {"string": 2, "fret": 1}],
+        }
+    )
+    decoded = decode_frame(frame)
+    assert decoded["frets"] == [None, 3, 2, None, 1, None]
+    assert "srv_ts" not in decoded
+
+
+def test_chord_name_is_cut_at_255_bytes():
+    decoded = decode_frame(
+        encode_frame({"type": "chord_change", "chord": "x" * 300, "frets": [0] * 6})
+    )
+    assert decoded["chord"] == "x" * 255
+
+
+def test_messages_without_binary_encoding():
+    assert encode_frame({"type": "STRUM_EVENT", "payload": {}}) is None
+    assert encode_frame({"type": "FRET_UPDATE", "payload": [0, 1]}) is None
+    assert encode_frame({"type": "chord_change", "chord": "C"}) is None
+    with pytest.raises(ValueError):
+        decode_frame(b"\x01\x00")
+    with pytest.raises(ValueError):
+        decode_frame(bytes([9]) + bytes(13))
+
+
+def test_subprotocol_negotiation():
+    assert negotiate_subprotocol([JSON_SUBPROTOCOL, BINARY_SUBPROTOCOL]) == BINARY_SUBPROTOCOL
+    assert negotiate_subprotocol([JSON_SUBPROTOCOL]) == JSON_SUBPROTOCOL
+    assert negotiate_subprotocol(["other"]) is None
+    assert wire_format_for(BINARY_SUBPROTOCOL) == WIRE_BINARY
+    assert wire_format_for(JSON_SUBPROTOCOL) == WIRE_JSON
+    assert wire_format_for(None) == WIRE_JSON
+
+
+def test_variants_translate_once_per_format():
+    text = '{"type":"FRET_UPDATE","payload":[0,2,2,1,0,0],"seq":4}'
+    variants = WireVariants(text, "FRET_UPDATE", WIRE_JSON)
+
+    assert variants.for_format(WIRE_JSON) is text
+    binary = variants.for_format(WIRE_BINARY)
+    assert decode_frame(binary)["payload"] == [0, 2, 2, 1, 0, 0]
+    assert variants.for_format(WIRE_BINARY) is binary
+
+
+def test_variants_forward_what_they_cannot_translate():
+    strum = '{"type":"STRUM_EVENT"}'
+    assert WireVariants(strum, "STRUM_EVENT", WIRE_JSON).for_format(WIRE_BINARY) == strum
+
+    broken = bytes([1, 0, 0])
+    assert WireVariants(broken, "FRET_UPDATE", WIRE_BINARY).for_format(WIRE_JSON) == broken
+
+    frame = encode_frame({"type": "FRET_UPDATE", "payload": [0] * 6, "srv_ts": 9})
+    text = WireVariants(frame, "FRET_UPDATE", WIRE_BINARY).for_format(WIRE_JSON)
+    assert json.loads(text) == decode_frame(frame)